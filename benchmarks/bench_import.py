@@ -0,0 +1,45 @@
+#!/usr/bin/env python
+"""
+Measure the import time of lean_client modules, each in a fresh interpreter
+using `python -X importtime`, and the start up time of an interpreter doing
+nothing for comparison.
+
+    python benchmarks/bench_import.py --runs 10
+"""
+import argparse
+import subprocess
+import sys
+import time
+
+MODULES = ['lean_client', 'lean_client.commands', 'lean_client.goals', 'lean_client.diagnostics',
+           'lean_client.trio_server', 'lean_client.pool', 'lean_client.gateway']
+
+
+def import_time(module: str) -> float:
+    """Cumulative import time of module in milliseconds, as reported by Python."""
+    result = subprocess.run([sys.executable, '-X', 'importtime', '-c', f'import {module}'],
+                            capture_output=True, text=True, check=True)
+    for line in result.stderr.splitlines():
+        parts = line.split('|')
+        if len(parts) == 3 and parts[2].strip() == module:
+            return int(parts[1]) / 1000
+    raise ValueError(f'No import time for {module}')
+
+
+def startup_time(code: str) -> float:
+    start = time.perf_counter()
+    subprocess.run([sys.executable, '-c', code], check=True)
+    return (time.perf_counter() - start) * 1000
+
+
+def main(args):
+    print(f'{"python -c pass":30} {min(startup_time("pass") for _ in range(args.runs)):8.1f} ms (start up)')
+    for module in args.modules or MODULES:
+        print(f'{module:30} {min(import_time(module) for _ in range(args.runs)):8.1f} ms')
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--runs', type=int, default=5, help='best of this many runs is shown')
+    parser.add_argument('modules', nargs='*', help=f'modules to import, default {" ".join(MODULES)}')
+    main(parser.parse_args())
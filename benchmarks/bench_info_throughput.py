@@ -0,0 +1,50 @@
+#!/usr/bin/env python
+"""
+Measure how many info requests per second TrioLeanServer pushes through a real
+child process, using the fake Lean server so that no Lean install is needed.
+
+    python benchmarks/bench_info_throughput.py --requests 5000 --state-size 2000
+"""
+import argparse
+import sys
+import time
+
+import trio  # type: ignore
+
+from lean_client.commands import InfoRequest
+from lean_client.trio_server import TrioLeanServer
+
+
+async def main(args):
+    lean_cmd = [sys.executable, '-m', 'lean_client.fake_server',
+                '--latency', str(args.latency), '--state-size', str(args.state_size)]
+    async with trio.open_nursery() as nursery:
+        server = TrioLeanServer(nursery, lean_cmd=lean_cmd)
+        await server.start()
+        await server.full_sync('bench.lean', content='--')
+
+        start = time.perf_counter()
+        for i in range(args.requests):
+            await server.send(InfoRequest('bench.lean', i, 0))
+        elapsed = time.perf_counter() - start
+        print(f'sequential: {args.requests / elapsed:.0f} requests/s')
+
+        async def info(line):
+            await server.send(InfoRequest('bench.lean', line, 0))
+        start = time.perf_counter()
+        async with trio.open_nursery() as requests:
+            for i in range(args.requests):
+                requests.start_soon(info, i)
+        elapsed = time.perf_counter() - start
+        print(f'pipelined: {args.requests / elapsed:.0f} requests/s')
+
+        server.kill()
+        nursery.cancel_scope.cancel()
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--requests', type=int, default=2000)
+    parser.add_argument('--latency', type=float, default=0.)
+    parser.add_argument('--state-size', type=int, default=200)
+    trio.run(main, parser.parse_args())
@@ -2,25 +2,12 @@
 """PyQt + Lean test"""
 import sys
 from pathlib import Path
-from typing import Tuple
 
 from PyQt5.QtWidgets import *
 from PyQt5 import QtCore
 
 from lean_client.qt_server import  QtLeanServer
-
-UNSOLVED = 'tactic failed, there are unsolved goals'
-
-def read_lean_template(file_name: str = 'template.lean') -> Tuple[int, str]:
-    """Read a template Lean file containing at least one sorry.
-    Returns the line number of the first sorry"""
-    text = Path(file_name).read_text()
-    nb = 0
-    for line in text.split('\n'):
-        nb += 1
-        if 'sorry' in line:
-            break
-    return nb, text
+from lean_client.tactics import ProofDocument, UNSOLVED
 
 
 
@@ -31,14 +18,19 @@ class MainWindow(QMainWindow):
         self.init_ui()
 
         self.debug = debug
-        self.server = QtLeanServer(debug=self.debug)
+        self.server = QtLeanServer(debug=self.debug, parse_in_thread=True)
         self.server.incoming_message.connect(self.handle_message)
         self.server.state_update.connect(self.update_state)
         self.server.is_ready.connect(self.handle_ready)
         self.server.error.connect(self.handle_error)
 
-        self.proof_start, self.template = read_lean_template()
-        self.lines = []
+        # Template Lean file containing at least one sorry, replaced by the tactics
+        self.document = ProofDocument(Path('template.lean').read_text())
+        self.tactics = []
+        # Goal state and errors after each number of tactics, so that undo
+        # doesn't need Lean.
+        self.states = []
+        self.errors = []
         self.update_file_content()
 
     def init_ui(self):
@@ -103,19 +95,18 @@ class MainWindow(QMainWindow):
 
     def handle_ready(self):
         """Called when Lean is done compiling."""
-        self.server.info('template.lean',
-                line=self.proof_start + len(self.lines), col=0)
+        line, col = self.document.state_position(len(self.tactics))
+        self.server.info('template.lean', line=line, col=col)
 
     def update_file_content(self):
         """Update the code widget and send content to Lean"""
-        self.content = self.template.replace('sorry','\n'.join(self.lines) ,1)
+        self.content = self.document.content(self.tactics)
         self.code_widget.setPlainText(self.content)
         self.server.sync('template.lean', content=self.content)
 
     def input_widget_validate(self):
         """Called when user validates a command."""
-        cmd = '  ' + self.input_widget.text().strip(' ,') + ','
-        self.lines.append(cmd)
+        self.tactics.append(self.input_widget.text())
         self.update_file_content()
         cmd = self.input_widget.setText('')
 
@@ -123,18 +114,26 @@ class MainWindow(QMainWindow):
         """Called each time our LeanServerQt emits the incoming_message signal."""
 
         #filter out messages saying we are not done yet.
-        self.errors_widget.setPlainText('\n'.join(
-            [str(msg.text) for msg in self.server.messages
-               if not msg.text.startswith(UNSOLVED)]))
+        errors = '\n'.join([str(msg.text) for msg in self.server.messages
+                            if not msg.text.startswith(UNSOLVED)])
+        self.errors = self.errors[:len(self.tactics)] + [errors]
+        self.errors_widget.setPlainText(errors)
 
     def update_state(self):
         """Called each time our LeanServerQt emits the update_state signal."""
+        self.states = self.states[:len(self.tactics)] + [self.server.goal_state]
         self.state_widget.setPlainText(self.server.goal_state)
 
     def undo(self):
-        """Called by the Undo action (from menu or Ctrl-Z). """
-        self.lines = self.lines[:-1]
-        self.update_file_content()
+        """Called by the Undo action (from menu or Ctrl-Z). The previous
+        state is cached, Lean gets the shorter proof with the next command."""
+        if not self.tactics or len(self.states) < len(self.tactics):
+            return
+        self.tactics.pop()
+        self.code_widget.setPlainText(self.document.content(self.tactics))
+        self.state_widget.setPlainText(self.states[len(self.tactics)])
+        if len(self.errors) > len(self.tactics):
+            self.errors_widget.setPlainText(self.errors[len(self.tactics)])
 
     def quit(self):
         """Called by the Quit action (from menu or Ctrl-Q). """
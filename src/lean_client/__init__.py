@@ -0,0 +1,31 @@
+"""
+Python clients for the Lean server.
+
+Backends are only imported when used, so that importing lean_client doesn't
+import trio or PyQt5:
+
+    from lean_client import TrioLeanServer  # imports trio now
+"""
+import importlib
+
+# Names available from lean_client, with the module defining them
+LAZY_NAMES = {
+    'TrioLeanServer': 'lean_client.trio_server',
+    'Priority': 'lean_client.trio_server',
+    'QtLeanServer': 'lean_client.qt_server',
+    'SyncLeanServer': 'lean_client.sync_server',
+    'LeanServerPool': 'lean_client.pool',
+    'MessageRetention': 'lean_client.retention',
+}
+
+
+def __getattr__(name: str):
+    if name not in LAZY_NAMES:
+        raise AttributeError(f'module {__name__!r} has no attribute {name!r}')
+    value = getattr(importlib.import_module(LAZY_NAMES[name]), name)
+    globals()[name] = value
+    return value
+
+
+def __dir__():
+    return sorted(list(globals()) + list(LAZY_NAMES))
@@ -11,10 +11,11 @@ by the Lean server by the parse_response function at the bottom of this file.
 Everything else in this file are intermediate objects that will be contained in
 response objects.
 """
-from dataclasses import dataclass
-from typing import Optional, List, NewType, ClassVar, Union, Type
+from dataclasses import dataclass, fields, is_dataclass
+from typing import Optional, List, Dict, NewType, ClassVar, Union, Type
 from enum import Enum
 import json
+import sys
 
 
 def dict_to_dataclass(cls, dic: dict):
@@ -22,9 +23,25 @@ def dict_to_dataclass(cls, dic: dict):
     return cls(**dic)
 
 
+def dataclass_to_dict(obj):
+    """Convert (nested) response objects back to what Lean sends: fields
+    like type_ lose their underscore, enums become strings and missing
+    optional fields are left out."""
+    if is_dataclass(obj):
+        return {field.name.rstrip('_'): dataclass_to_dict(getattr(obj, field.name))
+                for field in fields(obj) if getattr(obj, field.name) is not None}
+    if isinstance(obj, Enum):
+        return obj.name
+    if isinstance(obj, list):
+        return [dataclass_to_dict(item) for item in obj]
+    return obj
+
+
 class Request:
     command: ClassVar[str]
     expect_response: ClassVar[bool]
+    # Whether identical requests may share a response, see TrioLeanServer.send_raw
+    read_only: ClassVar[bool] = False
 
     def __post_init__(self):
         self.seq_num = 0
@@ -39,11 +56,16 @@ class Response:
     response: ClassVar[str]
 
     @staticmethod
-    def parse_response(data: str) -> Union['AllMessagesResponse', 'CurrentTasksResponse', 'OkResponse', 'ErrorResponse']:
+    def parse_response(data: str, previous_msgs: Optional[Dict[tuple, 'Message']] = None
+                       ) -> Union['AllMessagesResponse', 'CurrentTasksResponse', 'OkResponse', 'ErrorResponse']:
+        """Parse a line sent by Lean. previous_msgs is the table of a server
+        reusing unchanged messages, see AllMessagesResponse."""
         dic = json.loads(data)
         response = dic.pop('response')
 
-        for cls in [AllMessagesResponse, CurrentTasksResponse, OkResponse, ErrorResponse]:
+        if response == AllMessagesResponse.response:
+            return AllMessagesResponse.from_dict(dic, previous_msgs)
+        for cls in [CurrentTasksResponse, OkResponse, ErrorResponse]:
             if response == cls.response:  # type: ignore
                 return cls.from_dict(dic)  # type: ignore
         raise ValueError("Couldn't parse response string.")
@@ -67,17 +89,43 @@ class Message:
     @classmethod
     def from_dict(cls, dic):
         dic['severity'] = getattr(Severity, dic['severity'])
+        # File names and captions take few distinct values
+        dic['file_name'] = sys.intern(dic['file_name'])
+        dic['caption'] = sys.intern(dic['caption'])
         return dict_to_dataclass(cls, dic)
 
 
+def message_dict_key(dic: dict) -> tuple:
+    return (dic.get('file_name'), dic.get('severity'), dic.get('caption'), dic.get('text'),
+            dic.get('pos_line'), dic.get('pos_col'), dic.get('end_pos_line'), dic.get('end_pos_col'))
+
+
 @dataclass
 class AllMessagesResponse(Response):
+    """
+    Lean sends all messages again in each all_messages response, so messages
+    which did not change since the previous response need not be rebuilt:
+    given the table previous_msgs of the previous response of the same
+    server, the previous Message objects are reused (hence they should not be
+    mutated) and the table is updated in place.
+    """
     response = 'all_messages'
     msgs: List[Message]
 
     @classmethod
-    def from_dict(cls, dic):
-        return cls([Message.from_dict(msg) for msg in dic['msgs']])
+    def from_dict(cls, dic, previous_msgs: Optional[Dict[tuple, Message]] = None):
+        previous = previous_msgs if previous_msgs is not None else dict()
+        current: Dict[tuple, Message] = dict()
+        msgs = []
+        for msg_dic in dic['msgs']:
+            key = message_dict_key(msg_dic)
+            msg = previous.get(key) or current.get(key) or Message.from_dict(msg_dic)
+            current[key] = msg
+            msgs.append(msg)
+        if previous_msgs is not None:
+            previous_msgs.clear()
+            previous_msgs.update(current)
+        return cls(msgs)
 
 
 @dataclass
@@ -89,6 +137,12 @@ class Task:
     end_pos_col: int
     desc: str
 
+    @classmethod
+    def from_dict(cls, dic):
+        dic['file_name'] = sys.intern(dic['file_name'])
+        dic['desc'] = sys.intern(dic['desc'])
+        return dict_to_dataclass(cls, dic)
+
 
 @dataclass
 class CurrentTasksResponse(Response):
@@ -99,7 +153,9 @@ class CurrentTasksResponse(Response):
 
     @classmethod
     def from_dict(cls, dic):
-        dic['tasks'] = [dict_to_dataclass(Task, task) for task in dic.pop('tasks')]
+        dic['tasks'] = [Task.from_dict(task) for task in dic.pop('tasks')]
+        if dic.get('cur_task') is not None:
+            dic['cur_task'] = Task.from_dict(dic['cur_task'])
         return dict_to_dataclass(cls, dic)
 
 
@@ -178,6 +234,7 @@ class SyncResponse(CommandResponse):
 class CompleteRequest(Request):
     command = 'complete'
     expect_response = True
+    read_only = True
     file_name: str
     line: int
     column: int
@@ -225,6 +282,7 @@ class CompleteResponse(CommandResponse):
 class InfoRequest(Request):
     command = 'info'
     expect_response = True
+    read_only = True
     file_name: str
     line: int
     column: int
@@ -271,6 +329,7 @@ class InfoResponse(CommandResponse):
 class SearchRequest(Request):
     command = 'search'
     expect_response = True
+    read_only = True
     query: str
 
 
@@ -305,6 +364,7 @@ class SearchResponse(CommandResponse):
 class HoleCommandsRequest(Request):
     command = 'hole_commands'
     expect_response = True
+    read_only = True
     file_name: str
     line: int
     column: int
@@ -362,6 +422,7 @@ class HoleCommandsResponse(CommandResponse):
 class AllHoleCommandsRequest(Request):
     command = 'all_hole_commands'
     expect_response = True
+    read_only = True
     file_name: str
 
 
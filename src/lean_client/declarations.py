@@ -0,0 +1,180 @@
+"""
+A local index of declarations, answering searches without asking Lean.
+
+A DeclarationIndex keeps the SearchItems (name, type, doc and source) seen
+in search and info responses. It can be filled as a side effect of a
+server's traffic, by a bulk scan of search queries, and saved to disk for
+the next session:
+
+    index = DeclarationIndex.load('decls.json') if Path('decls.json').exists() else DeclarationIndex()
+    index.watch(server)
+    await index.scan(server)
+    index.prefix('nat.succ_')
+    index.search('add_comm')
+    index.save('decls.json')
+
+search matches queries like Lean's search does: the characters of the query
+must appear in order in the name. Names are prefiltered on the set of
+characters they contain, so a lookup scores a small part of the index.
+
+An index may be updated from the reader thread of a SyncLeanServer (see
+watch) while other threads query it: additions and lookups hold a lock.
+"""
+from typing import Optional, List, Dict, Iterable, Union, TYPE_CHECKING
+from pathlib import Path
+from dataclasses import replace
+import bisect
+import json
+import string
+import threading
+
+from lean_client.commands import (Response, OkResponse, SearchRequest, SearchResponse,
+                                  SearchItem, InfoRecord, dataclass_to_dict)
+
+if TYPE_CHECKING:
+    from lean_client.trio_server import TrioLeanServer
+    from lean_client.sync_server import SyncLeanServer
+
+FORMAT_VERSION = 1
+
+# Characters after which a match counts as the start of a word
+SEPARATORS = '._'
+
+
+def char_mask(text: str) -> int:
+    """Bit mask of the characters in text, ignoring case. Characters
+    outside of ASCII share a bit."""
+    mask = 0
+    for char in text.lower():
+        mask |= 1 << min(ord(char), 127)
+    return mask
+
+
+def match_score(query: str, name: str) -> Optional[float]:
+    """Score of name for query (higher is better), or None if the
+    characters of query don't appear in order in name. Matches at the start
+    of words and consecutive matches score more, short names win ties."""
+    lower = name.lower()
+    score = 0.
+    position = -1
+    for char in query.lower():
+        found = lower.find(char, position + 1)
+        if found < 0:
+            return None
+        if found == position + 1 and position >= 0:
+            score += 2
+        if found == 0 or lower[found - 1] in SEPARATORS:
+            score += 1
+        position = found
+    return score - 0.01 * len(name)
+
+
+class DeclarationIndex:
+    def __init__(self, items: Iterable[SearchItem] = ()):
+        self.items: Dict[str, SearchItem] = dict()
+        # Sorted names, for prefix lookups, rebuilt lazily after additions
+        self.sorted_names: List[str] = []
+        self.is_sorted = True
+        # Names by the mask of their characters
+        self.by_mask: Dict[int, List[str]] = dict()
+        self.lock = threading.Lock()
+        for item in items:
+            self.add(item)
+
+    def __len__(self) -> int:
+        return len(self.items)
+
+    def __contains__(self, name: str) -> bool:
+        return name in self.items
+
+    def get(self, name: str) -> Optional[SearchItem]:
+        return self.items.get(name)
+
+    def add(self, item: SearchItem):
+        """Add or update a declaration. Fields missing from item are kept
+        from the known declaration. The index stores its own copy of item."""
+        with self.lock:
+            known = self.items.get(item.text)
+            if known is None:
+                self.items[item.text] = replace(item)
+                self.by_mask.setdefault(char_mask(item.text), []).append(item.text)
+                self.is_sorted = False
+            else:
+                known.type_ = item.type_ or known.type_
+                known.doc = item.doc if item.doc is not None else known.doc
+                known.source = item.source if item.source is not None else known.source
+
+    def add_info_record(self, record: InfoRecord):
+        """Add the declaration described by an info record, if any."""
+        if record.full_id and record.type_:
+            self.add(SearchItem(record.full_id, record.type_, record.source, record.doc))
+
+    def update(self, response: Response):
+        """Add the declarations in a search or info response. This is meant
+        to be a response callback of a server (see watch), so raw responses
+        are read without modifying them."""
+        if not isinstance(response, OkResponse):
+            return
+        results = response.data.get('results')
+        if isinstance(results, list):
+            for result in results:
+                if isinstance(result, dict) and 'text' in result and 'type' in result:
+                    self.add(SearchItem.from_dict(dict(result)))
+        record = response.data.get('record')
+        if isinstance(record, dict) and 'full-id' in record:
+            self.add_info_record(InfoRecord.from_dict(dict(record)))
+
+    def watch(self, server: Union['TrioLeanServer', 'SyncLeanServer']):
+        """Record the declarations in all responses of server (a
+        TrioLeanServer or SyncLeanServer)."""
+        server.response_callbacks.append(self.update)
+
+    async def scan(self, server: 'TrioLeanServer', queries: Iterable[str] = string.ascii_lowercase):
+        """Fill the index by asking Lean for each query, one at a time."""
+        for query in queries:
+            response = await server.send(SearchRequest(query))
+            assert isinstance(response, SearchResponse)
+            for item in response.results:
+                self.add(item)
+
+    def prefix(self, prefix: str, limit: Optional[int] = None) -> List[SearchItem]:
+        """Declarations whose name starts with prefix, sorted by name."""
+        with self.lock:
+            if not self.is_sorted:
+                self.sorted_names = sorted(self.items)
+                self.is_sorted = True
+            start = bisect.bisect_left(self.sorted_names, prefix)
+            names: List[str] = []
+            for name in self.sorted_names[start:]:
+                if not name.startswith(prefix) or len(names) == limit:
+                    break
+                names.append(name)
+            return [self.items[name] for name in names]
+
+    def search(self, query: str, limit: Optional[int] = 20) -> List[SearchItem]:
+        """Declarations matching query, best first (see match_score)."""
+        query_mask = char_mask(query)
+        scored = []
+        with self.lock:
+            for mask, names in self.by_mask.items():
+                if mask & query_mask != query_mask:
+                    continue
+                for name in names:
+                    score = match_score(query, name)
+                    if score is not None:
+                        scored.append((-score, name))
+            scored.sort()
+            return [self.items[name] for _, name in scored[:limit]]
+
+    def save(self, path: Union[str, Path]):
+        with self.lock:
+            data = {'version': FORMAT_VERSION,
+                    'declarations': [dataclass_to_dict(item) for item in self.items.values()]}
+        Path(path).write_text(json.dumps(data))
+
+    @classmethod
+    def load(cls, path: Union[str, Path]) -> 'DeclarationIndex':
+        data = json.loads(Path(path).read_text())
+        if data.get('version') != FORMAT_VERSION:
+            raise ValueError(f'Unsupported declaration index version {data.get("version")}')
+        return cls(SearchItem.from_dict(dic) for dic in data['declarations'])
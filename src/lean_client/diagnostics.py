@@ -0,0 +1,116 @@
+"""
+Indexed views of the messages sent by Lean.
+
+Lean sends the full list of messages for every file in each all_messages
+response. A MessageIndex groups them by file and answers line range and
+severity queries without scanning everything. Only files whose messages
+changed since the previous response are re-indexed.
+"""
+from typing import Optional, List, Dict, Set
+import sys
+
+from lean_client.commands import Message, Severity
+
+
+def end_line(msg: Message) -> int:
+    return msg.end_pos_line if msg.end_pos_line is not None else msg.pos_line
+
+
+class IntervalIndex:
+    def __init__(self, msgs: List[Message]):
+        """
+        Messages sorted by starting line, seen as an implicit balanced binary
+        tree: the node covering msgs[lo:hi] is msgs[(lo+hi)//2] and stores the
+        largest end line in this range, so overlap queries can skip whole
+        subtrees ending before the queried range.
+        """
+        self.msgs = sorted(msgs, key=lambda msg: (msg.pos_line, msg.pos_col))
+        self.starts = [msg.pos_line for msg in self.msgs]
+        self.ends = [end_line(msg) for msg in self.msgs]
+        self.max_ends = self.ends.copy()
+        self._build(0, len(self.msgs))
+
+    def _build(self, lo: int, hi: int) -> int:
+        if lo >= hi:
+            return -1
+        mid = (lo + hi) // 2
+        self.max_ends[mid] = max(self.ends[mid], self._build(lo, mid), self._build(mid + 1, hi))
+        return self.max_ends[mid]
+
+    def overlapping(self, first_line: int, last_line: int) -> List[Message]:
+        """Messages whose line range meets [first_line, last_line], sorted by position."""
+        result: List[Message] = []
+        self._query(0, len(self.msgs), first_line, last_line, result)
+        return result
+
+    def _query(self, lo: int, hi: int, first_line: int, last_line: int, result: List[Message]):
+        if lo >= hi:
+            return
+        mid = (lo + hi) // 2
+        if self.max_ends[mid] < first_line:
+            return
+        self._query(lo, mid, first_line, last_line, result)
+        if self.starts[mid] <= last_line:
+            if self.ends[mid] >= first_line:
+                result.append(self.msgs[mid])
+            self._query(mid + 1, hi, first_line, last_line, result)
+
+    def __len__(self):
+        return len(self.msgs)
+
+
+class FileMessages:
+    def __init__(self, file_name: str, msgs: List[Message]):
+        """Messages of one file, with one interval index per severity."""
+        self.file_name = file_name
+        self.msgs = msgs
+        self.all = IntervalIndex(msgs)
+        self.by_severity: Dict[Severity, IntervalIndex] = {
+                severity: IntervalIndex([msg for msg in msgs if msg.severity == severity])
+                for severity in Severity}
+
+    def query(self, first_line: Optional[int] = None, last_line: Optional[int] = None,
+              severity: Optional[Severity] = None) -> List[Message]:
+        index = self.all if severity is None else self.by_severity[severity]
+        if first_line is None and last_line is None:
+            return index.msgs.copy()
+        return index.overlapping(first_line if first_line is not None else 0,
+                                 last_line if last_line is not None else sys.maxsize)
+
+
+class MessageIndex:
+    def __init__(self):
+        """Messages grouped by file, see the module docstring."""
+        self.files: Dict[str, FileMessages] = dict()
+
+    def update(self, msgs: List[Message]) -> Set[str]:
+        """Index the messages of a new all_messages response and return the
+        names of the files whose messages changed."""
+        grouped: Dict[str, List[Message]] = dict()
+        for msg in msgs:
+            grouped.setdefault(msg.file_name, []).append(msg)
+
+        changed = set(self.files) - set(grouped)
+        for file_name in changed:
+            del self.files[file_name]
+        for file_name, file_msgs in grouped.items():
+            old = self.files.get(file_name)
+            if old is None or old.msgs != file_msgs:
+                self.files[file_name] = FileMessages(file_name, file_msgs)
+                changed.add(file_name)
+        return changed
+
+    def query(self, file_name: str, first_line: Optional[int] = None, last_line: Optional[int] = None,
+              severity: Optional[Severity] = None) -> List[Message]:
+        """Messages of the given file, optionally restricted to those
+        overlapping lines first_line to last_line (inclusive) and to those
+        of the given severity."""
+        if file_name not in self.files:
+            return []
+        return self.files[file_name].query(first_line, last_line, severity)
+
+    def count(self, file_name: str, severity: Optional[Severity] = None) -> int:
+        if file_name not in self.files:
+            return 0
+        file_msgs = self.files[file_name]
+        return len(file_msgs.all if severity is None else file_msgs.by_severity[severity])
@@ -0,0 +1,280 @@
+"""
+A stand-in for `lean --server` which speaks the same line-delimited JSON
+protocol but does no elaboration at all.
+
+It is meant for load tests and benchmarks which need a real child process
+(real pipes, OS buffering, process start up) on a machine without Lean.
+It can be used as the lean_cmd of any server class, for instance:
+
+    TrioLeanServer(nursery, lean_cmd=[sys.executable, '-m',
+                                      'lean_client.fake_server', '--latency', '0.01'])
+
+The server appends `--server` itself, which this script accepts and ignores.
+Run `python -m lean_client.fake_server --help` for the list of knobs.
+"""
+from typing import Optional, List, Dict, Any, Callable, Tuple
+from pathlib import Path
+import argparse
+import heapq
+import itertools
+import json
+import os
+import selectors
+import sys
+import time
+
+
+def parse_args(argv: Optional[List[str]] = None) -> argparse.Namespace:
+    parser = argparse.ArgumentParser(
+            description='Fake Lean server speaking the lean --server protocol.')
+    parser.add_argument('--server', action='store_true',
+                        help='accepted for compatibility with lean --server, ignored')
+    parser.add_argument('--latency', type=float, default=0.,
+                        help='seconds before answering each request')
+    parser.add_argument('--elaboration-time', type=float, default=0.,
+                        help='seconds between a sync invalidating a file and '
+                             'the server being idle again')
+    parser.add_argument('--messages-per-file', type=int, default=0,
+                        help='number of messages reported for each synced file')
+    parser.add_argument('--message-size', type=int, default=40,
+                        help='length of the text of each message')
+    parser.add_argument('--state-size', type=int, default=20,
+                        help='length of the goal state returned by info requests')
+    parser.add_argument('--results', type=int, default=5,
+                        help='number of completions and search results')
+    parser.add_argument('--messages-rate', type=float, default=0.,
+                        help='all_messages updates per second while elaborating')
+    parser.add_argument('--tasks-rate', type=float, default=0.,
+                        help='current_tasks updates per second while elaborating')
+    return parser.parse_args(argv)
+
+
+def padded(text: str, size: int) -> str:
+    """Pad text with dots to reach the given size."""
+    return text + '.' * max(0, size - len(text))
+
+
+class FakeLeanServer:
+    def __init__(self, options: argparse.Namespace, output=None):
+        """
+        Fake Lean server state. Replies are not written immediately but
+        scheduled in a heap so that pipelined requests are answered after
+        the configured latency without blocking each other.
+        """
+        self.options = options
+        self.output = output or sys.stdout.buffer
+        self.files: Dict[str, str] = dict()
+        # file name -> time at which its elaboration finishes
+        self.elaborating: Dict[str, float] = dict()
+        self.scheduled: List[Tuple[float, int, Callable[[], None]]] = []
+        self.counter = itertools.count()
+        self.pending_output: List[bytes] = []
+
+    def schedule(self, delay: float, action: Callable[[], None]):
+        heapq.heappush(self.scheduled,
+                       (time.monotonic() + delay, next(self.counter), action))
+
+    def emit(self, dic: Dict[str, Any]):
+        self.pending_output.append(json.dumps(dic).encode() + b'\n')
+
+    def flush(self):
+        if self.pending_output:
+            self.output.write(b''.join(self.pending_output))
+            self.output.flush()
+            self.pending_output = []
+
+    def run_due(self) -> Optional[float]:
+        """Run every scheduled action which is due, and return the delay
+        until the next one (or None if nothing is scheduled)."""
+        while self.scheduled:
+            when, _, action = self.scheduled[0]
+            delay = when - time.monotonic()
+            if delay > 0:
+                return delay
+            heapq.heappop(self.scheduled)
+            action()
+        return None
+
+    # Protocol
+
+    def handle_line(self, line: bytes):
+        try:
+            request = json.loads(line.decode())
+        except ValueError:
+            self.emit({'response': 'error', 'message': f'invalid json: {line!r}'})
+            return
+        command = request.get('command')
+        seq_num = request.get('seq_num', 0)
+        if command in ('sleep', 'long_sleep'):
+            return
+        handler = getattr(self, f'handle_{command}', None)
+        if handler is None:
+            self.reply_error(seq_num, f'unknown command {command}')
+        else:
+            handler(request)
+
+    def reply(self, seq_num: int, **data):
+        data['response'] = 'ok'
+        data['seq_num'] = seq_num
+        self.schedule(self.options.latency, lambda: self.emit(data))
+
+    def reply_error(self, seq_num: int, message: str):
+        data = {'response': 'error', 'seq_num': seq_num, 'message': message}
+        self.schedule(self.options.latency, lambda: self.emit(data))
+
+    def handle_sync(self, request: Dict[str, Any]):
+        file_name = request['file_name']
+        content = request.get('content')
+        if content is None:
+            path = Path(file_name)
+            if not path.is_file():
+                self.reply_error(request['seq_num'],
+                                 f"file '{file_name}' not found in the LEAN_PATH")
+                return
+            content = path.read_text()
+        if self.files.get(file_name) == content:
+            self.reply(request['seq_num'], message='file unchanged')
+            return
+        self.files[file_name] = content
+        self.reply(request['seq_num'], message='file invalidated')
+        self.start_elaboration(file_name)
+
+    def file_error(self, request: Dict[str, Any]) -> bool:
+        """Reply with an error if the request is about an unknown file."""
+        if request['file_name'] in self.files:
+            return False
+        self.reply_error(request['seq_num'],
+                         f"file '{request['file_name']}' not found in the LEAN_PATH")
+        return True
+
+    def handle_info(self, request: Dict[str, Any]):
+        if self.file_error(request):
+            return
+        state = padded(f"⊢ goal at {request['line']}:{request['column']} ",
+                       self.options.state_size)
+        self.reply(request['seq_num'], record={'state': state})
+
+    def handle_complete(self, request: Dict[str, Any]):
+        if self.file_error(request):
+            return
+        completions = [{'text': f'fake_decl_{i}', 'type': 'Prop'}
+                       for i in range(self.options.results)]
+        if request.get('skip_completions'):
+            self.reply(request['seq_num'], prefix='fake')
+        else:
+            self.reply(request['seq_num'], prefix='fake', completions=completions)
+
+    def handle_search(self, request: Dict[str, Any]):
+        results = [{'text': f"{request['query']}_{i}", 'type': 'Prop',
+                    'source': {'file': 'fake.lean', 'line': i + 1, 'column': 0}}
+                   for i in range(self.options.results)]
+        self.reply(request['seq_num'], results=results)
+
+    def handle_hole_commands(self, request: Dict[str, Any]):
+        if self.file_error(request):
+            return
+        self.reply(request['seq_num'], message='No hole at position')
+
+    def handle_all_hole_commands(self, request: Dict[str, Any]):
+        if self.file_error(request):
+            return
+        self.reply(request['seq_num'], holes=[])
+
+    def handle_hole(self, request: Dict[str, Any]):
+        if self.file_error(request):
+            return
+        self.reply(request['seq_num'], message='No hole at position')
+
+    def handle_roi(self, request: Dict[str, Any]):
+        self.reply(request['seq_num'])
+
+    # Elaboration simulation
+
+    def start_elaboration(self, file_name: str):
+        # Elaboration starts when the sync reply is sent, so that the final
+        # current_tasks response never overtakes the reply.
+        opts = self.options
+        start = opts.latency
+        end = time.monotonic() + start + opts.elaboration_time
+        self.elaborating[file_name] = end
+        self.schedule(start, self.send_tasks)
+        for rate, action in ((opts.tasks_rate, self.send_tasks),
+                             (opts.messages_rate, self.send_messages)):
+            if rate > 0:
+                nb_updates = int(opts.elaboration_time * rate)
+                for i in range(1, nb_updates):
+                    self.schedule(start + i / rate, action)
+        self.schedule(start + opts.elaboration_time,
+                      lambda: self.finish_elaboration(file_name, end))
+
+    def finish_elaboration(self, file_name: str, end: float):
+        # Only the latest sync of a file finishes its elaboration.
+        if self.elaborating.get(file_name) != end:
+            return
+        del self.elaborating[file_name]
+        self.send_messages()
+        self.send_tasks()
+
+    def file_messages(self, file_name: str) -> List[Dict[str, Any]]:
+        severities = ['error', 'warning', 'information']
+        return [{'file_name': file_name,
+                 'severity': severities[i % 3],
+                 'caption': '',
+                 'text': padded(f'fake message {i} ', self.options.message_size),
+                 'pos_line': i + 1, 'pos_col': 0,
+                 'end_pos_line': i + 1, 'end_pos_col': 1}
+                for i in range(self.options.messages_per_file)]
+
+    def send_messages(self):
+        msgs: List[Dict[str, Any]] = []
+        for file_name in self.files:
+            msgs.extend(self.file_messages(file_name))
+        self.emit({'response': 'all_messages', 'msgs': msgs})
+
+    def send_tasks(self):
+        tasks = [{'file_name': file_name, 'pos_line': 1, 'pos_col': 0,
+                  'end_pos_line': max(1, self.files[file_name].count('\n')),
+                  'end_pos_col': 0, 'desc': 'elaborating'}
+                 for file_name in self.elaborating]
+        dic: Dict[str, Any] = {'response': 'current_tasks',
+                               'is_running': bool(tasks), 'tasks': tasks}
+        if tasks:
+            dic['cur_task'] = tasks[0]
+        self.emit(dic)
+
+    def serve(self, input_fd: int = 0):
+        """Main loop: read requests from input_fd until it is closed."""
+        selector = selectors.DefaultSelector()
+        selector.register(input_fd, selectors.EVENT_READ)
+        unfinished_line = b''
+        while True:
+            timeout = self.run_due()
+            self.flush()
+            if selector.select(timeout):
+                data = os.read(input_fd, 1 << 16)
+                if not data:
+                    break
+                lines = (unfinished_line + data).split(b'\n')
+                unfinished_line = lines.pop()
+                for line in lines:
+                    if line.strip():
+                        self.handle_line(line)
+        # Answer everything which was asked before stdin was closed.
+        while True:
+            timeout = self.run_due()
+            self.flush()
+            if timeout is None:
+                break
+            time.sleep(timeout)
+
+
+def main(argv: Optional[List[str]] = None):
+    server = FakeLeanServer(parse_args(argv))
+    try:
+        server.serve()
+    except (BrokenPipeError, KeyboardInterrupt):
+        pass
+
+
+if __name__ == '__main__':
+    main()
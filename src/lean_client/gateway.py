@@ -0,0 +1,322 @@
+"""
+HTTP and WebSocket access to a pool of Lean servers, for programs which are
+not written in Python.
+
+All bodies are JSON, responses are the Lean responses with the same field
+names as in the Lean server protocol:
+
+    POST /sync               {"file_name", "content" (optional)}
+                             -> {"messages": [...]} once the file is compiled
+    POST /info               {"file_name", "line", "column"}
+    POST /complete           {"file_name", "line", "column", "skip_completions" (optional)}
+    POST /search             {"query"}
+    POST /hole_commands      {"file_name", "line", "column"}
+    POST /all_hole_commands  {"file_name"}
+    POST /hole               {"file_name", "line", "column", "action"}
+    GET  /messages?file_name=...
+    GET  /events             WebSocket streaming all_messages and current_tasks
+                             updates as {"server": index, "response": ..., ...}
+
+Requests about a file always go to the pool server which has it synced.
+Slow WebSocket subscribers skip intermediate updates: they always get the
+latest all_messages and current_tasks of each server.
+
+This is meant to run on a local or trusted network, there is no
+authentication. Run it with
+
+    python -m lean_client.gateway --port 8000 --servers 4
+"""
+from typing import Optional, List, Dict, Tuple, Type, Any, Set
+from urllib.parse import urlsplit, parse_qs
+import argparse
+import base64
+import functools
+import hashlib
+import json
+import struct
+
+import trio  # type: ignore
+
+from lean_client.commands import (dict_to_dataclass, dataclass_to_dict, Request, SyncRequest, InfoRequest,
+                                  CompleteRequest, SearchRequest, HoleCommandsRequest, AllHoleCommandsRequest,
+                                  HoleRequest, Response, AllMessagesResponse, CurrentTasksResponse)
+from lean_client.pool import LeanServerPool
+from lean_client.trio_server import TrioLeanServer
+
+REQUEST_CLASSES: List[Type[Request]] = [InfoRequest, CompleteRequest, SearchRequest, HoleCommandsRequest,
+                                        AllHoleCommandsRequest, HoleRequest]
+REQUESTS = {cls.command: cls for cls in REQUEST_CLASSES}
+
+MAX_HEADER_SIZE = 1 << 16
+WEBSOCKET_GUID = '258EAFA5-E914-47DA-95CA-C5AB0DC85B11'
+REASONS = {101: 'Switching Protocols', 200: 'OK', 400: 'Bad Request', 404: 'Not Found',
+           405: 'Method Not Allowed', 431: 'Request Header Fields Too Large', 502: 'Bad Gateway'}
+
+
+class HttpError(Exception):
+    def __init__(self, status: int, message: str):
+        super().__init__(message)
+        self.status = status
+        self.message = message
+
+
+class HttpConnection:
+    def __init__(self, stream: trio.abc.Stream):
+        """Minimal HTTP/1.1 server side connection with keep-alive."""
+        self.stream = stream
+        self.buffer = bytearray()
+
+    async def receive_some(self):
+        data = await self.stream.receive_some(1 << 16)
+        if not data:
+            raise EOFError
+        self.buffer += data
+
+    async def receive_request(self) -> Optional[Tuple[str, str, Dict[str, str], bytes]]:
+        """Method, target, headers (lower case names) and body of the next
+        request, or None if the client closed the connection."""
+        try:
+            while b'\r\n\r\n' not in self.buffer:
+                if len(self.buffer) > MAX_HEADER_SIZE:
+                    raise HttpError(431, 'Headers too large')
+                await self.receive_some()
+            end = self.buffer.index(b'\r\n\r\n')
+            lines = self.buffer[:end].decode('latin-1').split('\r\n')
+            del self.buffer[:end + 4]
+            method, target, _ = lines[0].split(' ', 2)
+            headers = dict()
+            for line in lines[1:]:
+                name, _, value = line.partition(':')
+                headers[name.strip().lower()] = value.strip()
+            length = int(headers.get('content-length', 0))
+            if length < 0:
+                raise ValueError('Negative Content-Length')
+            while len(self.buffer) < length:
+                await self.receive_some()
+        except EOFError:
+            return None
+        except ValueError:
+            raise HttpError(400, 'Malformed request')
+        body = bytes(self.buffer[:length])
+        del self.buffer[:length]
+        return method, target, headers, body
+
+    async def send_response(self, status: int, headers: Dict[str, str], body: bytes = b''):
+        lines = [f'HTTP/1.1 {status} {REASONS.get(status, "")}']
+        lines.extend(f'{name}: {value}' for name, value in headers.items())
+        await self.stream.send_all(('\r\n'.join(lines) + '\r\n\r\n').encode('latin-1') + body)
+
+    async def send_json(self, status: int, value: Any):
+        body = json.dumps(value).encode()
+        await self.send_response(status, {'Content-Type': 'application/json',
+                                           'Content-Length': str(len(body))}, body)
+
+
+class WebSocket:
+    def __init__(self, connection: HttpConnection):
+        """Minimal server side WebSocket (RFC 6455) on top of an upgraded
+        HTTP connection: text frames out, ping and close handling in."""
+        self.connection = connection
+        # updates and pongs are sent from different tasks
+        self.send_lock = trio.Lock()
+
+    async def accept(self, headers: Dict[str, str]):
+        key = headers.get('sec-websocket-key')
+        if headers.get('upgrade', '').lower() != 'websocket' or not key:
+            raise HttpError(400, 'Expected a WebSocket upgrade')
+        accept = base64.b64encode(hashlib.sha1((key + WEBSOCKET_GUID).encode()).digest()).decode()
+        await self.connection.send_response(101, {'Upgrade': 'websocket', 'Connection': 'Upgrade',
+                                                  'Sec-WebSocket-Accept': accept})
+
+    async def send_frame(self, opcode: int, payload: bytes):
+        length = len(payload)
+        if length < 126:
+            header = struct.pack('!BB', 0x80 | opcode, length)
+        elif length < 1 << 16:
+            header = struct.pack('!BBH', 0x80 | opcode, 126, length)
+        else:
+            header = struct.pack('!BBQ', 0x80 | opcode, 127, length)
+        async with self.send_lock:
+            await self.connection.stream.send_all(header + payload)
+
+    async def send_text(self, text: str):
+        await self.send_frame(0x1, text.encode())
+
+    async def receive_frame(self) -> Tuple[int, bytes]:
+        connection = self.connection
+        while len(connection.buffer) < 2:
+            await connection.receive_some()
+        opcode = connection.buffer[0] & 0x0f
+        masked = connection.buffer[1] & 0x80
+        length = connection.buffer[1] & 0x7f
+        offset = 2
+        if length >= 126:
+            size = 2 if length == 126 else 8
+            while len(connection.buffer) < offset + size:
+                await connection.receive_some()
+            length = int.from_bytes(connection.buffer[offset:offset + size], 'big')
+            offset += size
+        mask_size = 4 if masked else 0
+        while len(connection.buffer) < offset + mask_size + length:
+            await connection.receive_some()
+        mask = connection.buffer[offset:offset + mask_size]
+        offset += mask_size
+        payload = bytes(connection.buffer[offset:offset + length])
+        del connection.buffer[:offset + length]
+        if masked:
+            payload = bytes(byte ^ mask[i % 4] for i, byte in enumerate(payload))
+        return opcode, payload
+
+    async def receive_until_closed(self):
+        """Answer pings and return when the client closes the socket."""
+        try:
+            while True:
+                opcode, payload = await self.receive_frame()
+                if opcode == 0x8:
+                    await self.send_frame(0x8, payload[:2])
+                    return
+                if opcode == 0x9:
+                    await self.send_frame(0xA, payload)
+        except (EOFError, trio.BrokenResourceError):
+            return
+
+
+class Subscriber:
+    def __init__(self):
+        """Latest update of each kind for each server, waiting to be sent."""
+        self.pending: Dict[Tuple[int, str], str] = dict()
+        self.has_pending = trio.Event()
+
+    def push(self, key: Tuple[int, str], text: str):
+        self.pending[key] = text
+        self.has_pending.set()
+
+    async def updates(self) -> List[str]:
+        await self.has_pending.wait()
+        self.has_pending = trio.Event()
+        updates, self.pending = list(self.pending.values()), dict()
+        return updates
+
+
+class LeanGateway:
+    def __init__(self, pool: LeanServerPool):
+        """HTTP and WebSocket front end to a started pool, see the module docstring."""
+        self.pool = pool
+        self.subscribers: Set[Subscriber] = set()
+        self.next_server = 0
+        for index, server in enumerate(pool.servers):
+            server.response_callbacks.append(functools.partial(self.publish, index))
+
+    def publish(self, index: int, resp: Response):
+        if not self.subscribers or not isinstance(resp, (AllMessagesResponse, CurrentTasksResponse)):
+            return
+        value = dataclass_to_dict(resp)
+        value['server'] = index
+        value['response'] = resp.response
+        text = json.dumps(value)
+        for subscriber in self.subscribers:
+            subscriber.push((index, resp.response), text)
+
+    async def serve(self, port: int, host: str = '127.0.0.1', *, task_status=trio.TASK_STATUS_IGNORED):
+        await trio.serve_tcp(self.handle_connection, port, host=host, task_status=task_status)
+
+    async def handle_connection(self, stream: trio.abc.Stream):
+        connection = HttpConnection(stream)
+        try:
+            while True:
+                try:
+                    request = await connection.receive_request()
+                except HttpError as error:
+                    # We can't find the next request after a malformed one.
+                    await connection.send_json(error.status, {'message': error.message})
+                    return
+                if request is None:
+                    return
+                method, target, headers, body = request
+                try:
+                    url = urlsplit(target)
+                    if url.path == '/events':
+                        await self.stream_events(connection, headers)
+                        return
+                    status, value = 200, await self.handle(method, url.path, parse_qs(url.query), body)
+                except HttpError as error:
+                    status, value = error.status, {'message': error.message}
+                except ChildProcessError as error:
+                    status, value = 502, {'message': str(error)}
+                await connection.send_json(status, value)
+        except trio.BrokenResourceError:
+            pass
+        finally:
+            await stream.aclose()
+
+    def server_for(self, body: Dict[str, Any]) -> TrioLeanServer:
+        if 'file_name' in body:
+            return self.pool.server_for(body['file_name'])
+        self.next_server = (self.next_server + 1) % len(self.pool)
+        return self.pool.servers[self.next_server]
+
+    async def handle(self, method: str, path: str, query: Dict[str, List[str]], body: bytes) -> Any:
+        command = path.strip('/')
+        if command == 'messages':
+            if 'file_name' not in query:
+                raise HttpError(400, 'Missing file_name parameter')
+            file_name = query['file_name'][0]
+            # A read must not assign the file to a server
+            server = self.pool.assignments.get(file_name)
+            if server is None:
+                return {'messages': []}
+            return {'messages': dataclass_to_dict(server.message_index.query(file_name))}
+        if command != 'sync' and command not in REQUESTS:
+            raise HttpError(404, f'Unknown command {command}')
+        if method != 'POST':
+            raise HttpError(405, f'Use POST for {command}')
+        # Only the parsing of the request is a client error, errors of the
+        # server below are not.
+        try:
+            args = json.loads(body)
+            request = dict_to_dataclass(SyncRequest if command == 'sync' else REQUESTS[command], args)
+            server = self.server_for(args)
+        except (ValueError, TypeError, KeyError, AttributeError) as error:
+            raise HttpError(400, f'Invalid {command} request: {error}')
+        if isinstance(request, SyncRequest):
+            await server.full_sync(request.file_name, request.content)
+            return {'messages': dataclass_to_dict(server.message_index.query(request.file_name))}
+        response = await server.send(request)
+        value = dataclass_to_dict(response)
+        value['response'] = 'ok'
+        return value
+
+    async def stream_events(self, connection: HttpConnection, headers: Dict[str, str]):
+        websocket = WebSocket(connection)
+        await websocket.accept(headers)
+        subscriber = Subscriber()
+        self.subscribers.add(subscriber)
+        try:
+            async with trio.open_nursery() as nursery:
+                async def send_updates():
+                    while True:
+                        for text in await subscriber.updates():
+                            await websocket.send_text(text)
+
+                nursery.start_soon(send_updates)
+                await websocket.receive_until_closed()
+                nursery.cancel_scope.cancel()
+        finally:
+            self.subscribers.discard(subscriber)
+
+
+async def main(args):
+    async with trio.open_nursery() as nursery:
+        pool = LeanServerPool(nursery, args.servers, args.lean_cmd.split())
+        await pool.start()
+        print(f'Serving {args.servers} Lean servers on http://{args.host}:{args.port}')
+        await LeanGateway(pool).serve(args.port, args.host)
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='HTTP and WebSocket gateway to Lean servers.')
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=8000)
+    parser.add_argument('--servers', type=int, default=1, help='number of Lean processes')
+    parser.add_argument('--lean-cmd', default='lean', help='command running Lean')
+    trio.run(main, parser.parse_args())
@@ -0,0 +1,170 @@
+"""
+Structured goal states.
+
+Lean sends tactic states (InfoRecord.state) as pretty-printed text such as
+
+    2 goals
+    case or.inl
+    p q : Prop,
+    hp : p
+    ⊢ p ∨ q
+
+    p q : Prop
+    ⊢ q
+
+parse_goal_state turns this text into a ParsedGoalState made of Goals, each
+having Hypotheses and a target. When many states are parsed with the same
+GoalInterner, equal strings, hypotheses and goals are shared between states,
+and each state carries a digest of its canonical form (whitespace
+normalized), which is cheap to hash and compare for deduplication.
+"""
+from typing import Optional, List, Dict, Tuple
+from dataclasses import dataclass, field
+import hashlib
+import re
+
+NB_GOALS = re.compile(r'\d+ goals?$')
+
+
+@dataclass(frozen=True)
+class Hypothesis:
+    # No names for an entry not of the form "names : type", kept as is in type_
+    names: Tuple[str, ...]
+    type_: str
+
+    def __str__(self):
+        if not self.names:
+            return self.type_
+        return f"{' '.join(self.names)} : {self.type_}"
+
+
+@dataclass(frozen=True)
+class Goal:
+    hypotheses: Tuple[Hypothesis, ...]
+    target: str
+    case: Optional[str] = None
+
+    def __str__(self):
+        lines = [f'case {self.case}'] if self.case is not None else []
+        lines.append(',\n'.join(str(hyp) for hyp in self.hypotheses))
+        lines.append(f'⊢ {self.target}')
+        return '\n'.join(line for line in lines if line)
+
+
+@dataclass(frozen=True)
+class ParsedGoalState:
+    goals: Tuple[Goal, ...]
+    # Digest of the canonical form of the state, equal states have equal digests.
+    digest: bytes = field(compare=False, repr=False, default=b'')
+
+    def __eq__(self, other):
+        if not isinstance(other, ParsedGoalState):
+            return NotImplemented
+        return self.digest == other.digest
+
+    def __hash__(self):
+        return hash(self.digest)
+
+    def __post_init__(self):
+        if not self.digest:
+            object.__setattr__(self, 'digest', canonical_digest(self.goals))
+
+    def __str__(self):
+        if not self.goals:
+            return 'no goals'
+        text = '\n\n'.join(str(goal) for goal in self.goals)
+        if len(self.goals) > 1:
+            text = f'{len(self.goals)} goals\n{text}'
+        return text
+
+    @property
+    def is_solved(self) -> bool:
+        return not self.goals
+
+
+def normalize(text: str) -> str:
+    return ' '.join(text.split())
+
+
+class GoalInterner:
+    def __init__(self):
+        """Tables of strings, hypotheses and goals shared by parsed states."""
+        self.strings: Dict[str, str] = dict()
+        self.hypotheses: Dict[Hypothesis, Hypothesis] = dict()
+        self.goals: Dict[Goal, Goal] = dict()
+
+    def string(self, text: str) -> str:
+        return self.strings.setdefault(text, text)
+
+    def hypothesis(self, names: Tuple[str, ...], type_: str) -> Hypothesis:
+        hyp = Hypothesis(tuple(self.string(name) for name in names), self.string(type_))
+        return self.hypotheses.setdefault(hyp, hyp)
+
+    def goal(self, hypotheses: Tuple[Hypothesis, ...], target: str, case: Optional[str]) -> Goal:
+        goal = Goal(hypotheses, self.string(target), self.string(case) if case is not None else None)
+        return self.goals.setdefault(goal, goal)
+
+    def clear(self):
+        self.strings.clear()
+        self.hypotheses.clear()
+        self.goals.clear()
+
+
+def split_entries(lines: List[str]) -> List[str]:
+    """Join continuation lines (indented lines of a long hypothesis or
+    target) to the line they continue."""
+    entries: List[str] = []
+    for line in lines:
+        if entries and line[:1].isspace():
+            entries[-1] += '\n' + line
+        else:
+            entries.append(line)
+    return entries
+
+
+def parse_goal(text: str, interner: GoalInterner) -> Goal:
+    lines = text.split('\n')
+    case = None
+    if lines[0].startswith('case '):
+        case = lines.pop(0)[len('case '):]
+    target_start = next((i for i, line in enumerate(lines) if line.startswith('⊢')), len(lines))
+    target = '\n'.join(lines[target_start:])[1:].strip()
+
+    hypotheses = []
+    for entry in split_entries(lines[:target_start]):
+        entry = entry.rstrip().rstrip(',')
+        names, sep, type_ = entry.partition(' : ')
+        if not sep:
+            # Unexpected output should not stop a session or a search
+            names, type_ = '', entry
+        hypotheses.append(interner.hypothesis(tuple(names.split()), type_.strip()))
+    return interner.goal(tuple(hypotheses), target, case)
+
+
+def canonical_digest(goals: Tuple[Goal, ...]) -> bytes:
+    parts = []
+    for goal in goals:
+        parts.append(f'\x02{goal.case or ""}')
+        for hyp in goal.hypotheses:
+            parts.append(f"\x01{' '.join(hyp.names)}\x00{normalize(hyp.type_)}")
+        parts.append(f'\x03{normalize(goal.target)}')
+    return hashlib.blake2b(''.join(parts).encode(), digest_size=16).digest()
+
+
+def parse_goal_state(state: str, interner: Optional[GoalInterner] = None) -> ParsedGoalState:
+    """
+    Parse a goal state as sent by Lean. Strings, hypotheses and goals are
+    shared with previously parsed states when the same interner is used.
+    Context lines which are not hypotheses are kept as unnamed hypotheses.
+    """
+    if interner is None:
+        interner = GoalInterner()
+    state = state.strip()
+    if not state or state == 'no goals':
+        return ParsedGoalState((), canonical_digest(()))
+    blocks = [block.strip('\n') for block in re.split(r'\n\s*\n', state)]
+    first_lines = blocks[0].split('\n', 1)
+    if NB_GOALS.match(first_lines[0]):
+        blocks[0] = first_lines[1] if len(first_lines) > 1 else ''
+    goals = tuple(parse_goal(block, interner) for block in blocks if block)
+    return ParsedGoalState(goals, canonical_digest(goals))
@@ -0,0 +1,104 @@
+"""
+Watching the resource use of Lean server processes.
+
+Lean's memory use keeps growing over long sessions. A LeanProcessMonitor
+samples the resident memory and CPU time of the Lean process of a
+TrioLeanServer from /proc (hence only on Linux), passes each sample to its
+callbacks, and restarts the server (see TrioLeanServer.restart) when it uses
+more than max_rss bytes or has answered max_requests requests. A failed
+restart is passed to the callbacks with the sample which triggered it, and
+monitoring goes on.
+
+    monitor = LeanProcessMonitor(server, interval=30, max_rss=4 << 30)
+    monitor.callbacks.append(lambda stats: print(stats))
+    nursery.start_soon(monitor.run)
+
+For a RemoteLeanServer (see lean_client.sharding), only max_requests
+applies and a restart only reconnects to the worker, whose own server should
+be monitored on its machine.
+
+read_process_stats can also be used directly, for instance with the
+processId() of the QProcess of a QtLeanServer.
+"""
+from typing import Optional, List, Callable
+from dataclasses import dataclass, replace
+import os
+import time
+
+import trio  # type: ignore
+
+from lean_client.trio_server import TrioLeanServer
+
+
+@dataclass
+class ProcessStats:
+    pid: Optional[int]  # None for servers without a local process
+    rss: int  # resident memory in bytes
+    cpu_time: float  # user and system CPU time in seconds
+    cpu_percent: float = 0.  # CPU use since the previous sample
+    requests: int = 0  # requests sent since the process started
+    restart_error: Optional[Exception] = None  # failure of the restart triggered by this sample
+
+
+def read_process_stats(pid: int) -> ProcessStats:
+    """Memory and CPU use of a process, from /proc."""
+    with open(f'/proc/{pid}/statm') as statm:
+        rss = int(statm.read().split()[1]) * os.sysconf('SC_PAGE_SIZE')
+    with open(f'/proc/{pid}/stat') as stat:
+        # The process name may contain spaces, the fields we want come after it.
+        fields = stat.read().rpartition(')')[2].split()
+    utime, stime = int(fields[11]), int(fields[12])
+    return ProcessStats(pid, rss, (utime + stime) / os.sysconf('SC_CLK_TCK'))
+
+
+class LeanProcessMonitor:
+    def __init__(self, server: TrioLeanServer, interval: float = 10.,
+                 max_rss: Optional[int] = None, max_requests: Optional[int] = None):
+        """Monitor of a started server, see the module docstring. The run
+        method has to be started in a nursery."""
+        self.server = server
+        self.interval = interval
+        self.max_rss = max_rss
+        self.max_requests = max_requests
+        self.callbacks: List[Callable[[ProcessStats], None]] = []
+        # latest sample, and when it was taken
+        self.stats: Optional[ProcessStats] = None
+        self.sampled_at = 0.
+        # Number of restarts so far
+        self.recycles = 0
+
+    def sample(self) -> ProcessStats:
+        if self.server.process is None:
+            raise ValueError('The server is not started')
+        pid = self.server.process.pid
+        # A RemoteLeanServer only counts requests, its Lean process is remote
+        stats = read_process_stats(pid) if pid is not None else ProcessStats(None, 0, 0.)
+        now = time.monotonic()
+        if self.stats is not None and self.stats.pid == stats.pid and now > self.sampled_at:
+            stats.cpu_percent = 100 * (stats.cpu_time - self.stats.cpu_time) / (now - self.sampled_at)
+        stats.requests = self.server.requests_sent
+        self.stats, self.sampled_at = stats, now
+        for callback in self.callbacks:
+            callback(stats)
+        return stats
+
+    def should_recycle(self, stats: ProcessStats) -> bool:
+        return ((self.max_rss is not None and stats.rss > self.max_rss) or
+                (self.max_requests is not None and stats.requests >= self.max_requests))
+
+    async def run(self):
+        while True:
+            try:
+                stats = self.sample()
+            except (OSError, ValueError, IndexError):
+                # The process is gone or being replaced.
+                stats = None
+            if stats and self.should_recycle(stats):
+                try:
+                    await self.server.restart()
+                except Exception as error:
+                    for callback in self.callbacks:
+                        callback(replace(stats, restart_error=error))
+                else:
+                    self.recycles += 1
+            await trio.sleep(self.interval)
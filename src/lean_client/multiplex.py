@@ -0,0 +1,175 @@
+"""
+Sharing one Lean process between many independent clients.
+
+A LeanMultiplexer wraps a TrioLeanServer. Each client obtained from
+LeanMultiplexer.client gets its own file name namespace (its files are
+synced to Lean under `<client name>/<file name>`) and its own view of
+messages and current tasks, with file names translated back. File names
+must be relative and stay in the namespace once normalized, so that a
+client can't reach the files of another one. Since Lean can't read
+`<client name>/<file name>` from disk, syncs without content are sent with
+the content of the file read by the client.
+
+Requests of all clients go through a scheduler which keeps at most
+max_in_flight of them running in Lean and picks the next one round-robin
+among clients, so that a client sending thousands of requests cannot starve
+the others.
+
+    async with trio.open_nursery() as nursery:
+        server = TrioLeanServer(nursery)
+        await server.start()
+        mux = LeanMultiplexer(server)
+        nursery.start_soon(mux.run)
+        alice = mux.client('alice')
+        await alice.full_sync('test.lean', content)
+"""
+from typing import Optional, List, Dict, Deque, Callable, Awaitable, Any
+from collections import deque
+from dataclasses import replace
+import copy
+import posixpath
+
+import trio  # type: ignore
+
+from lean_client.commands import Request, SyncRequest, CommandResponse, Message, Task
+from lean_client.trio_server import TrioLeanServer, Priority
+
+
+class PendingCall:
+    def __init__(self, fn: Callable[..., Awaitable[Any]], args: tuple):
+        """A call waiting for its turn, and then for its result."""
+        self.fn = fn
+        self.args = args
+        self.done = trio.Event()
+        self.result: Any = None
+        self.error: Optional[BaseException] = None
+
+
+class LeanMultiplexer:
+    def __init__(self, server: TrioLeanServer, max_in_flight: int = 8):
+        """Fair scheduler shared by all clients, see the module docstring.
+        The run method has to be started in a nursery."""
+        self.server = server
+        self.queues: Dict[str, Deque[PendingCall]] = dict()
+        # Names of clients having pending calls, in round-robin order
+        self.ready: Deque[str] = deque()
+        self.has_work = trio.Event()
+        self.slots = trio.Semaphore(max_in_flight)
+        self.clients: Dict[str, 'MultiplexedClient'] = dict()
+
+    def client(self, name: str) -> 'MultiplexedClient':
+        if '/' in name:
+            raise ValueError(f'Invalid client name {name!r}')
+        if name not in self.clients:
+            self.clients[name] = MultiplexedClient(self, name)
+            self.queues[name] = deque()
+        return self.clients[name]
+
+    async def submit(self, name: str, fn: Callable[..., Awaitable[Any]], *args) -> Any:
+        """Run fn(*args) when it is the turn of client name, and return its result."""
+        call = PendingCall(fn, args)
+        queue = self.queues[name]
+        if not queue:
+            self.ready.append(name)
+        queue.append(call)
+        self.has_work.set()
+        await call.done.wait()
+        if call.error is not None:
+            raise call.error
+        return call.result
+
+    async def run(self):
+        """Scheduler loop."""
+        async with trio.open_nursery() as nursery:
+            while True:
+                await self.slots.acquire()
+                while not self.ready:
+                    self.has_work = trio.Event()
+                    await self.has_work.wait()
+                name = self.ready.popleft()
+                queue = self.queues[name]
+                call = queue.popleft()
+                if queue:
+                    self.ready.append(name)
+                nursery.start_soon(self.run_call, call)
+
+    async def run_call(self, call: PendingCall):
+        try:
+            call.result = await call.fn(*call.args)
+        except Exception as error:
+            call.error = error
+        except BaseException:
+            # Cancellation of the scheduler: it can't go to the caller's task
+            call.error = RuntimeError('The multiplexer stopped before the end of this call')
+            raise
+        finally:
+            self.slots.release()
+            call.done.set()
+
+
+def renamed(obj, file_name: str):
+    """Copy of a message or task with another file name. Messages may be
+    retention.SpilledMessage objects, which dataclasses.replace can't build."""
+    obj = copy.copy(obj)
+    obj.file_name = file_name
+    return obj
+
+
+class MultiplexedClient:
+    def __init__(self, mux: LeanMultiplexer, name: str):
+        """One client of a LeanMultiplexer, with the same interface as a
+        TrioLeanServer for the usual operations."""
+        self.mux = mux
+        self.name = name
+        self.prefix = name + '/'
+
+    def to_lean(self, file_name: str) -> str:
+        """Name of a file of this client in Lean. Raises ValueError for
+        names outside of its namespace, like absolute names or names going
+        up with .."""
+        lean_name = posixpath.normpath(posixpath.join(self.name, file_name))
+        if not lean_name.startswith(self.prefix):
+            raise ValueError(f'Invalid file name {file_name!r}')
+        return lean_name
+
+    def from_lean(self, file_name: str) -> str:
+        return file_name[len(self.prefix):]
+
+    def owns(self, file_name: str) -> bool:
+        return file_name.startswith(self.prefix)
+
+    async def send(self, request: Request, priority: Priority = Priority.normal) -> Optional[CommandResponse]:
+        if isinstance(request, SyncRequest) and request.content is None:
+            request = replace(request, content=await self.read(request.file_name))
+        file_name = getattr(request, 'file_name', None)
+        if file_name is not None:
+            request = replace(request, file_name=self.to_lean(file_name))  # type: ignore
+        return await self.mux.submit(self.name, self.mux.server.send, request, priority)
+
+    @staticmethod
+    async def read(file_name: str) -> str:
+        """Content of a file synced without content, which Lean can't read
+        under its name in Lean."""
+        return await trio.Path(file_name).read_text()
+
+    async def full_sync(self, filename, content=None) -> None:
+        if content is None:
+            content = await self.read(filename)
+        await self.mux.submit(self.name, self.mux.server.full_sync, self.to_lean(filename), content)
+
+    async def state(self, filename, line, col, priority: Priority = Priority.normal) -> str:
+        return await self.mux.submit(self.name, self.mux.server.state, self.to_lean(filename), line, col,
+                                     priority)
+
+    @property
+    def messages(self) -> List[Message]:
+        """Messages about the files of this client."""
+        return [renamed(msg, self.from_lean(file_name))
+                for file_name, file_msgs in self.mux.server.message_index.files.items()
+                if self.owns(file_name)
+                for msg in file_msgs.msgs]
+
+    @property
+    def current_tasks(self) -> List[Task]:
+        return [renamed(task, self.from_lean(task.file_name))
+                for task in self.mux.server.current_tasks if self.owns(task.file_name)]
@@ -0,0 +1,67 @@
+"""
+Pools of Lean server processes.
+
+A LeanServerPool starts several TrioLeanServers and offers two ways of
+sharing them:
+
+* server_for(file_name) always returns the same server for a given file, so
+  requests about a file go to the process which has it synced,
+* checkout() gives exclusive use of an idle server for a while, for work
+  which syncs its own files (for instance speculative tactic evaluation).
+"""
+from typing import List, Dict, Union, AsyncIterator
+from contextlib import asynccontextmanager
+
+import trio  # type: ignore
+
+from lean_client.commands import Message
+from lean_client.trio_server import TrioLeanServer
+
+
+class LeanServerPool:
+    def __init__(self, nursery, size: int, lean_cmd: Union[str, List[str]] = 'lean', **server_options):
+        """Pool of size servers, server_options are passed to TrioLeanServer."""
+        if size < 1:
+            raise ValueError('A pool needs at least one server')
+        self.servers: List[TrioLeanServer] = [TrioLeanServer(nursery, lean_cmd, **server_options)
+                                              for _ in range(size)]
+        self.assignments: Dict[str, TrioLeanServer] = dict()
+        self.idle_send, self.idle_receive = trio.open_memory_channel(size)
+
+    async def start(self):
+        async with trio.open_nursery() as nursery:
+            for server in self.servers:
+                nursery.start_soon(server.start)
+        for server in self.servers:
+            self.idle_send.send_nowait(server)
+
+    def __len__(self):
+        return len(self.servers)
+
+    def server_for(self, file_name: str) -> TrioLeanServer:
+        """The server in charge of file_name. New files go to the server in
+        charge of the fewest files."""
+        if file_name not in self.assignments:
+            loads = {id(server): 0 for server in self.servers}
+            for server in self.assignments.values():
+                loads[id(server)] += 1
+            self.assignments[file_name] = min(self.servers, key=lambda server: loads[id(server)])
+        return self.assignments[file_name]
+
+    @asynccontextmanager
+    async def checkout(self) -> AsyncIterator[TrioLeanServer]:
+        """Exclusive use of an idle server (among checkout users)."""
+        server = await self.idle_receive.receive()
+        try:
+            yield server
+        finally:
+            self.idle_send.send_nowait(server)
+
+    @property
+    def messages(self) -> List[Message]:
+        return [msg for server in self.servers for msg in server.messages]
+
+    def kill(self):
+        for server in self.servers:
+            if server.process:
+                server.kill()
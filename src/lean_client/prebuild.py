@@ -0,0 +1,135 @@
+"""
+Compiling stale .olean files before starting Lean servers.
+
+A Lean server elaborates the imports of a file without an up to date .olean
+file itself, one at a time. prebuild finds these modules in a project and
+compiles them with `lean --make`, several processes at a time, each module
+once all the modules it imports are compiled:
+
+    await prebuild('src', jobs=8)
+    server = TrioLeanServer(nursery)
+    await server.start()
+
+Servers don't call prebuild, not even TrioLeanServer.start,
+LeanServerPool.start or a restart: callers await it themselves before
+starting their servers, as above.
+
+A module is stale if its .olean file is missing, or if it is older than its
+source file or than the .olean file of a module it imports. With
+method='hash', sources are compared to the content hashes recorded at the
+previous prebuild instead of modification times, which survives checkouts
+resetting them. The hashes are kept in a cache directory chosen by the
+caller, never in the project:
+
+    await prebuild('src', method='hash', cache_dir=Path.home() / '.cache' / 'lean_client')
+"""
+from typing import Optional, List, Dict, Set, Union
+from pathlib import Path
+from subprocess import STDOUT
+import hashlib
+import json
+import os
+
+import trio  # type: ignore
+
+from lean_client.project import ImportGraph
+
+def olean_path(path: Path) -> Path:
+    return path.with_suffix('.olean')
+
+
+def hashes_path(cache_dir: Union[str, Path], root: Path) -> Path:
+    """File of the content hashes of the sources of the modules of the
+    project in root compiled by the last prebuild. A cache directory can be
+    shared by several projects."""
+    key = hashlib.blake2b(str(root.resolve()).encode(), digest_size=8).hexdigest()
+    return Path(cache_dir) / f'hashes-{key}.json'
+
+
+def source_hash(path: Path) -> str:
+    return hashlib.blake2b(path.read_bytes(), digest_size=16).hexdigest()
+
+
+def stale_modules(graph: ImportGraph, method: str = 'mtime',
+                  hashes: Optional[Dict[str, str]] = None) -> Set[str]:
+    """Modules of graph which have to be compiled again, including those
+    importing such a module."""
+    if method not in ('mtime', 'hash'):
+        raise ValueError(f'Unknown staleness method {method!r}')
+    hashes = hashes or dict()
+    stale: Set[str] = set()
+    for module in graph.topological_order():
+        path = graph.modules[module]
+        olean = olean_path(path)
+        if not olean.exists() or any(other in stale for other in graph.imports[module]):
+            stale.add(module)
+        elif method == 'hash':
+            if hashes.get(module) != source_hash(path):
+                stale.add(module)
+        else:
+            olean_time = olean.stat().st_mtime
+            if (path.stat().st_mtime > olean_time or
+                    any(olean_path(graph.modules[other]).stat().st_mtime > olean_time
+                        for other in graph.imports[module])):
+                stale.add(module)
+    return stale
+
+
+async def prebuild(root: Union[str, Path], lean_cmd: Union[str, List[str]] = 'lean',
+                   jobs: Optional[int] = None, method: str = 'mtime',
+                   cache_dir: Union[str, Path, None] = None) -> List[str]:
+    """Compile the stale modules of the project in root with at most jobs
+    (by default the number of CPUs) Lean processes at once, and return them
+    in the order they were compiled. Raises ChildProcessError if some module
+    fails to compile; modules importing it are not compiled. method='hash'
+    requires a cache_dir for the hashes."""
+    root = Path(root)
+    lean_cmd = lean_cmd if isinstance(lean_cmd, list) else [lean_cmd]
+    graph = ImportGraph.from_directory(root)
+    hashes: Dict[str, str] = dict()
+    hashes_file = None
+    if method == 'hash':
+        if cache_dir is None:
+            raise ValueError("method='hash' requires a cache_dir")
+        hashes_file = hashes_path(cache_dir, root)
+        if hashes_file.exists():
+            hashes = json.loads(hashes_file.read_text())
+    stale = stale_modules(graph, method, hashes)
+
+    limiter = trio.CapacityLimiter(jobs or os.cpu_count() or 1)
+    done = {module: trio.Event() for module in stale}
+    compiled: List[str] = []
+    failures: Dict[str, str] = dict()
+
+    async def compile_module(module: str):
+        try:
+            for imported in graph.imports[module]:
+                if imported in done:
+                    await done[imported].wait()
+                if imported in failures:
+                    failures[module] = f'not compiled since {imported} failed'
+                    return
+            path = graph.modules[module]
+            async with limiter:
+                result = await trio.run_process(lean_cmd + ['--make', str(path)], cwd=str(root),
+                                                capture_stdout=True, stderr=STDOUT, check=False)
+            if result.returncode:
+                failures[module] = result.stdout.decode(errors='replace')
+            else:
+                compiled.append(module)
+                if hashes_file is not None:
+                    hashes[module] = source_hash(path)
+        finally:
+            done[module].set()
+
+    async with trio.open_nursery() as nursery:
+        for module in stale:
+            nursery.start_soon(compile_module, module)
+
+    if hashes_file is not None:
+        hashes_file.parent.mkdir(parents=True, exist_ok=True)
+        hashes_file.write_text(json.dumps(hashes, indent=0, sort_keys=True))
+    if failures:
+        report = '\n'.join(f'{module}: {output}' for module, output in sorted(failures.items()))
+        raise ChildProcessError(f'Lean failed to compile {len(failures)} modules:\n{report}')
+    return compiled
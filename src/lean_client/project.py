@@ -0,0 +1,140 @@
+"""
+Checking all Lean files of a project.
+
+An ImportGraph reads the import lines of the .lean files in a directory and
+records which files of the project each file imports (imports from outside
+the project, like mathlib, are ignored). A ProjectChecker then syncs the
+files on a LeanServerPool following this graph: a file is synced on the
+next idle server as soon as all files it imports are compiled, so
+independent files are compiled in parallel on different servers. Later
+requests about a file go to the server which compiled it (see
+LeanServerPool.server_for).
+
+    graph = ImportGraph.from_directory('src')
+    async with trio.open_nursery() as nursery:
+        pool = LeanServerPool(nursery, 4)
+        await pool.start()
+        messages = await ProjectChecker(pool, graph).check()
+"""
+from typing import List, Dict, Set, Union
+from pathlib import Path
+import re
+
+import trio  # type: ignore
+
+from lean_client.commands import Message
+from lean_client.pool import LeanServerPool
+
+COMMENT = re.compile(r'/-.*?-/|--[^\n]*', re.DOTALL)
+MODULE_NAME = re.compile(r"\.*[^\W\d][\w.']*$")
+# Words which can't be module names, in case a file has no command between
+# its imports and its first declaration.
+KEYWORDS = {'import', 'prelude', 'open', 'section', 'namespace', 'universe', 'universes', 'variable',
+            'variables', 'parameter', 'parameters', 'def', 'theorem', 'lemma', 'example', 'set_option',
+            'noncomputable', 'meta', 'local', 'attribute', 'instance', 'run_cmd', 'end', 'constant',
+            'constants', 'axiom', 'axioms', 'structure', 'class', 'inductive', 'notation', 'private',
+            'protected', 'abbreviation', 'include', 'omit', 'localized', 'open_locale'}
+
+
+def parse_imports(text: str) -> List[str]:
+    """Module names in the import commands at the beginning of a Lean file,
+    as written (relative imports keep their leading dots)."""
+    tokens = COMMENT.sub(' ', text).split()
+    if tokens[:1] == ['prelude']:
+        tokens = tokens[1:]
+    imports = []
+    in_import = False
+    for token in tokens:
+        if token == 'import':
+            in_import = True
+        elif in_import and token not in KEYWORDS and MODULE_NAME.match(token):
+            imports.append(token)
+        else:
+            break
+    return imports
+
+
+def module_name(root: Path, path: Path) -> str:
+    return '.'.join(path.relative_to(root).with_suffix('').parts)
+
+
+def resolve(importer: str, name: str) -> str:
+    """Absolute name of a module imported by the module importer. In Lean 3,
+    `import .foo` is foo next to the importer, `import ..foo` one level up..."""
+    if not name.startswith('.'):
+        return name
+    dots = len(name) - len(name.lstrip('.'))
+    package = importer.split('.')[:-dots]
+    return '.'.join(package + [name[dots:]])
+
+
+class ImportGraph:
+    def __init__(self, modules: Dict[str, Path], imports: Dict[str, Set[str]]):
+        """Files of a project by module name, and the modules of the project
+        imported by each of them."""
+        self.modules = modules
+        self.imports = imports
+        self.dependents: Dict[str, Set[str]] = {module: set() for module in modules}
+        for module, imported in imports.items():
+            for other in imported:
+                self.dependents[other].add(module)
+
+    @classmethod
+    def from_directory(cls, root: Union[str, Path]) -> 'ImportGraph':
+        root = Path(root)
+        modules = {module_name(root, path): path for path in sorted(root.rglob('*.lean'))}
+        imports = dict()
+        for module, path in modules.items():
+            names = (resolve(module, name) for name in parse_imports(path.read_text()))
+            imports[module] = {name for name in names if name in modules and name != module}
+        return cls(modules, imports)
+
+    def topological_order(self) -> List[str]:
+        """Modules sorted so that each one comes after those it imports.
+        Raises ValueError if imports are cyclic."""
+        remaining = {module: len(imported) for module, imported in self.imports.items()}
+        ready = sorted(module for module, count in remaining.items() if not count)
+        order = []
+        while ready:
+            module = ready.pop()
+            order.append(module)
+            for dependent in sorted(self.dependents[module]):
+                remaining[dependent] -= 1
+                if not remaining[dependent]:
+                    ready.append(dependent)
+        if len(order) < len(self.modules):
+            cycle = sorted(module for module, count in remaining.items() if count)
+            raise ValueError(f'Import cycle between {", ".join(cycle)}')
+        return order
+
+
+class ProjectChecker:
+    def __init__(self, pool: LeanServerPool, graph: ImportGraph):
+        """Syncs the files of graph on a started pool, one file at a time on
+        each server: a full_sync waits for everything its server compiles."""
+        self.pool = pool
+        self.graph = graph
+        # Lean file name (the path as a string) of each module
+        self.file_names = {module: str(path) for module, path in graph.modules.items()}
+
+    async def check(self) -> Dict[str, List[Message]]:
+        """Compile every file and return the messages of each module."""
+        # Check for cycles before starting anything
+        self.graph.topological_order()
+        compiled = {module: trio.Event() for module in self.graph.modules}
+        messages: Dict[str, List[Message]] = dict()
+
+        async def check_module(module: str):
+            for imported in self.graph.imports[module]:
+                await compiled[imported].wait()
+            file_name = self.file_names[module]
+            async with self.pool.checkout() as server:
+                self.pool.assignments[file_name] = server
+                await server.full_sync(file_name)
+            messages[module] = server.message_index.query(file_name)
+            compiled[module].set()
+
+        async with trio.open_nursery() as nursery:
+            for module in self.graph.modules:
+                nursery.start_soon(check_module, module)
+        return messages
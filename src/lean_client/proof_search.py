@@ -0,0 +1,146 @@
+"""
+Best-first proof search.
+
+A BestFirstSearch starts from a proof prefix and repeatedly expands the open
+node with the best score: the user-supplied generate function proposes
+tactics for its goals, they are all evaluated in parallel by a
+SpeculativeEvaluator, and each successful tactic leading to goals never seen
+before becomes a new open node, scored by the user-supplied score function
+(higher is better). Goal states are compared by the digest of their
+canonical form (see lean_client.goals), so that different tactic sequences
+reaching the same goals are only explored once.
+
+Up to one expansion per pool server runs at a time. The search stops at the
+first proof found, when no open node is left or after max_expansions
+expansions.
+
+    search = BestFirstSearch(SpeculativeEvaluator(pool, template),
+                             generate=lambda node: model.tactics(str(node.goals)),
+                             score=fewest_goals)
+    result = await search.search(['intro h'])
+    print(result.proof, result.stats)
+"""
+from typing import Optional, List, Dict, Tuple, Callable
+from dataclasses import dataclass, field
+import heapq
+import itertools
+
+import trio  # type: ignore
+
+from lean_client.goals import ParsedGoalState
+from lean_client.speculative import SpeculativeEvaluator
+
+
+@dataclass
+class SearchNode:
+    tactics: Tuple[str, ...]
+    goals: ParsedGoalState
+    score: float = 0.
+
+    @property
+    def depth(self) -> int:
+        return len(self.tactics)
+
+
+@dataclass
+class SearchStats:
+    expansions: int = 0
+    tactics_tried: int = 0
+    failed_tactics: int = 0
+    # successful tactics leading to goals already seen
+    duplicates: int = 0
+    max_depth: int = 0
+    elapsed: float = 0.
+
+
+@dataclass
+class SearchResult:
+    proof: Optional[List[str]]
+    stats: SearchStats
+    # Number of nodes explored at each depth
+    nodes_by_depth: Dict[int, int] = field(default_factory=dict)
+
+
+def fewest_goals(node: SearchNode) -> float:
+    """Prefer nodes with few goals, then shallow nodes."""
+    return -len(node.goals.goals) - 0.01 * node.depth
+
+
+class BestFirstSearch:
+    def __init__(self, evaluator: SpeculativeEvaluator, generate: Callable[[SearchNode], List[str]],
+                 score: Callable[[SearchNode], float] = fewest_goals,
+                 max_expansions: int = 1000, max_depth: int = 50, concurrency: Optional[int] = None):
+        """See the module docstring. concurrency defaults to the size of the
+        pool of the evaluator."""
+        self.evaluator = evaluator
+        self.generate = generate
+        self.score = score
+        self.max_expansions = max_expansions
+        self.max_depth = max_depth
+        self.concurrency = concurrency or len(evaluator.pool)
+
+    async def search(self, prefix: Optional[List[str]] = None) -> SearchResult:
+        prefix = list(prefix or [])
+        stats = SearchStats()
+        result = SearchResult(None, stats)
+        start = trio.current_time()
+        root = SearchNode(tuple(prefix), await self.evaluator.state_after(prefix))
+        if root.goals.is_solved:
+            result.proof = prefix
+            return result
+        # the transposition table: digests of all goal states reached so far
+        seen = {root.goals.digest}
+        # open nodes, best score first (the counter breaks ties in FIFO order)
+        counter = itertools.count()
+        frontier: List[Tuple[float, int, SearchNode]] = [(0., next(counter), root)]
+        running = 0
+        changed = trio.Event()
+
+        async def expand(node: SearchNode):
+            tactics = self.generate(node)
+            stats.tactics_tried += len(tactics)
+            outcomes = await self.evaluator.evaluate(list(node.tactics), tactics)
+            for outcome in outcomes:
+                if not outcome.success:
+                    stats.failed_tactics += 1
+                    continue
+                child = SearchNode(node.tactics + (outcome.tactic,), outcome.goals)
+                if child.goals.is_solved:
+                    result.proof = list(child.tactics)
+                    return
+                if child.goals.digest in seen:
+                    stats.duplicates += 1
+                    continue
+                seen.add(child.goals.digest)
+                child.score = self.score(child)
+                stats.max_depth = max(stats.max_depth, child.depth - len(prefix))
+                if child.depth - len(prefix) < self.max_depth:
+                    heapq.heappush(frontier, (-child.score, next(counter), child))
+
+        async def worker():
+            nonlocal running, changed
+            while result.proof is None:
+                if not frontier or stats.expansions >= self.max_expansions:
+                    if not running:
+                        return
+                    await changed.wait()
+                    continue
+                _, _, node = heapq.heappop(frontier)
+                stats.expansions += 1
+                depth = node.depth - len(prefix)
+                result.nodes_by_depth[depth] = result.nodes_by_depth.get(depth, 0) + 1
+                running += 1
+                try:
+                    await expand(node)
+                finally:
+                    running -= 1
+                    changed.set()
+                    changed = trio.Event()
+            # a proof was found, stop the other expansions
+            nursery.cancel_scope.cancel()
+
+        async with trio.open_nursery() as nursery:
+            for _ in range(self.concurrency):
+                nursery.start_soon(worker)
+        stats.elapsed = trio.current_time() - start
+        return result
@@ -4,28 +4,138 @@ Communicating with the Lean server in a Qt context.
 This is only the beginning, implementing reading a file and requesting tactic
 state. See the example use in examples/qt_interface.py.
 """
-from PyQt5.QtCore import QProcess, pyqtSignal, QObject
+from typing import Optional, List, Dict, Tuple, Union, TYPE_CHECKING
+import functools
+
+from PyQt5.QtCore import QProcess, pyqtSignal, pyqtSlot, QObject, QThread
 from PyQt5 import QtCore
 
-from lean_client.commands import (SyncRequest, InfoRequest,
+from lean_client.commands import (Request, SyncRequest, InfoRequest,
                                   CurrentTasksResponse, OkResponse, InfoResponse, AllMessagesResponse, Severity,
-                                  CommandResponse)
+                                  CommandResponse, Response, Message, Task)
+from lean_client.diagnostics import MessageIndex
+
+if TYPE_CHECKING:
+    # only needed by users passing a retention policy or a tracer
+    from lean_client.retention import MessageRetention
+    from lean_client.tracing import FrameTracer
+
+# Lines received from Lean with their parsed response, or the exception
+# raised while parsing them
+ParsedLines = List[Tuple[bytes, Union[Response, Exception]]]
+
+
+def stop_thread(thread: QThread):
+    """Stop the event loop of thread and wait for it to finish."""
+    if thread.isRunning():
+        thread.quit()
+        thread.wait()
+
+
+class ResponseParser(QObject):
+    parsed = pyqtSignal(object)
+
+    def __init__(self, reuse_messages: bool = True):
+        """Splits Lean's output into lines, keeping an unfinished last line
+        for the next chunk, and parses them. It lives in the GUI thread or,
+        to parse large responses without freezing the GUI, in a worker
+        thread, where it gets chunks through parse and sends responses back
+        through the parsed signal. With reuse_messages, unchanged messages
+        are reused from one all_messages response to the next (see
+        AllMessagesResponse)."""
+        super().__init__()
+        self.unfinished_line = b''
+        # only used from the thread of the parser
+        self.previous_msgs: Optional[Dict[tuple, Message]] = dict() if reuse_messages else None
+
+    def feed(self, data: bytes) -> ParsedLines:
+        lines = (self.unfinished_line + data).split(b'\n')
+        self.unfinished_line = lines.pop()
+        results: ParsedLines = []
+        for line in lines:
+            if not line.strip():
+                continue
+            try:
+                results.append((line, CommandResponse.parse_response(line.decode(), self.previous_msgs)))
+            except Exception as error:
+                results.append((line, error))
+        return results
+
+    @pyqtSlot(bytes)
+    def parse(self, data: bytes):
+        results = self.feed(data)
+        if results:
+            self.parsed.emit(results)
+
 
 class QtLeanServer(QObject):
     incoming_message = pyqtSignal()
     state_update = pyqtSignal()
     is_ready = pyqtSignal()
     error = pyqtSignal(str)
+    # Chunks of Lean's output, for a parser in a worker thread
+    lean_output = pyqtSignal(bytes)
 
-    def __init__(self, debug=False):
+    def __init__(self, debug=False, lean_cmd: Union[str, List[str]] = 'lean',
+                 flush_delay: float = 0., retention: Optional['MessageRetention'] = None,
+                 sync_delay: float = 0., tracer: Optional['FrameTracer'] = None,
+                 parse_in_thread: bool = False):
         """Interface to Lean compatible with the Qt event loop and signaling
-        framework."""
+        framework. Requests sent within flush_delay seconds of each other, or
+        during the same event loop iteration if it is zero, are written to
+        Lean in a single write. If a retention policy is given, it decides
+        which messages are kept in self.messages, see lean_client.retention.
+
+        If sync_delay is positive, a file is only synced once sync was not
+        called for it during sync_delay seconds, with the latest content, so
+        that Lean doesn't restart elaboration at each key stroke. Info
+        queries about a file waiting for its sync are sent after it, and
+        dropped if the file changes again before.
+
+        A tracer keeps the last frames exchanged with Lean and dumps them when
+        a response can't be parsed, see lean_client.tracing.
+
+        With parse_in_thread, Lean's responses are parsed in a worker thread
+        and delivered to the GUI thread by queued signals, so that a huge
+        all_messages response doesn't freeze the window. Only reading the
+        process output and updating the server state are left to the GUI
+        thread."""
         super().__init__()
         self.debug = debug
-        self.messages = []
+        self.flush_delay = flush_delay
+        self.sync_delay = sync_delay
+        self.tracer = tracer
+        # Queued requests with the version of their file when they were sent
+        self.write_buffer: List[Tuple[Request, int]] = []
+        # Number of sync calls for each file
+        self.file_versions: Dict[str, int] = dict()
+        # Latest content of files waiting for the end of sync_delay, their
+        # timers and the info requests waiting for their sync
+        self.pending_syncs: Dict[str, Optional[str]] = dict()
+        self.sync_timers: Dict[str, QtCore.QTimer] = dict()
+        self.held_requests: Dict[str, List[InfoRequest]] = dict()
+        self.lean_cmd: List[str] = lean_cmd if isinstance(lean_cmd, List) else [lean_cmd]
+        self.messages: List[Message] = []
+        self.retention = retention
+        self.message_index = MessageIndex()
         self.goal_state = ''
         self.is_busy = False
-        self.current_tasks = []
+        self.current_tasks: List[Task] = []
+
+        # A retention policy reuses its own versions of unchanged messages
+        self.parser = ResponseParser(reuse_messages=retention is None)
+        self.parser_thread: Optional[QThread] = None
+        if parse_in_thread:
+            self.parser_thread = QThread()
+            self.parser.moveToThread(self.parser_thread)
+            # Both connections are queued since the parser lives in another thread
+            self.lean_output.connect(self.parser.parse)
+            self.parser.parsed.connect(self.handle_responses)
+            self.parser_thread.start()
+            # A server dropped without kill must not destroy a running
+            # thread. The slot can't refer to self, which is gone when
+            # destroyed is emitted.
+            self.destroyed.connect(functools.partial(stop_thread, self.parser_thread))
 
         self.process = QProcess()
         self.process.setProcessChannelMode(QtCore.QProcess.MergedChannels)
@@ -33,7 +143,8 @@ class QtLeanServer(QObject):
         self.process.finished.connect(self.lean_finished)
         if self.debug:
             print('Starting lean -- server...')
-        self.process.start('lean --server', QtCore.QIODevice.ReadWrite)
+        self.process.start(self.lean_cmd[0], self.lean_cmd[1:] + ['--server'],
+                           QtCore.QIODevice.ReadWrite)
         self.process.waitForStarted()
         if self.debug:
             print('Server has started.')
@@ -44,25 +155,79 @@ class QtLeanServer(QObject):
         request.seq_num = self.seq_num
         if self.debug:
             print(f'Sending {request}')
-        self.process.write((request.to_json()+'\n').encode())
+        if not self.write_buffer:
+            QtCore.QTimer.singleShot(int(1000*self.flush_delay), self.flush)
+        version = self.file_versions.get(getattr(request, 'file_name', ''), 0)
+        self.write_buffer.append((request, version))
+
+    def is_stale(self, request: Request, version: int) -> bool:
+        """Whether request is an info query about an older version of its file."""
+        return isinstance(request, InfoRequest) and version < self.file_versions.get(request.file_name, 0)
+
+    def flush(self):
+        """Write all queued requests to Lean, except stale info queries."""
+        if self.write_buffer:
+            data = ''.join(request.to_json() + '\n' for request, version in self.write_buffer
+                           if not self.is_stale(request, version)).encode()
+            if self.tracer is not None:
+                self.tracer.sent(data)
+            self.process.write(data)
+            self.write_buffer = []
 
     def sync(self, file_name, content=None):
-        """Send synchronisation query to Lean."""
-        self.send(SyncRequest(file_name, content))
+        """Send synchronisation query to Lean, after sync_delay seconds
+        without other sync of this file if sync_delay is positive."""
+        self.file_versions[file_name] = self.file_versions.get(file_name, 0) + 1
+        self.held_requests.pop(file_name, None)
+        if self.sync_delay <= 0:
+            self.send(SyncRequest(file_name, content))
+            self.is_busy = True
+            return
+        self.pending_syncs[file_name] = content
+        if file_name not in self.sync_timers:
+            timer = QtCore.QTimer(self)
+            timer.setSingleShot(True)
+            timer.timeout.connect(functools.partial(self.send_pending_sync, file_name))
+            self.sync_timers[file_name] = timer
+        self.sync_timers[file_name].start(int(1000*self.sync_delay))
+
+    def send_pending_sync(self, file_name):
+        if file_name not in self.pending_syncs:
+            return
+        self.send(SyncRequest(file_name, self.pending_syncs.pop(file_name)))
         self.is_busy = True
+        for request in self.held_requests.pop(file_name, []):
+            self.send(request)
 
     def info(self, filename, line, col):
-        """Send info query to Lean."""
-        self.send(InfoRequest(filename, line, col))
+        """Send info query to Lean, once the file is synced if its sync is
+        delayed."""
+        request = InfoRequest(filename, line, col)
+        if filename in self.pending_syncs:
+            self.held_requests.setdefault(filename, []).append(request)
+        else:
+            self.send(request)
 
     def lean_finished(self):
         pass
 
     def lean_reply(self):
         """Called when Lean outputs something."""
-        data = self.process.readAllStandardOutput().data().decode()
-        for line in data.strip().split('\n'):
-            resp = CommandResponse.parse_response(line)
+        data = self.process.readAllStandardOutput().data()
+        if self.parser_thread is not None:
+            self.lean_output.emit(data)
+        else:
+            self.handle_responses(self.parser.feed(data))
+
+    def handle_responses(self, results: ParsedLines):
+        """Update the server state with parsed responses, in the GUI thread."""
+        for line, resp in results:
+            if self.tracer is not None:
+                self.tracer.received(line)
+            if isinstance(resp, Exception):
+                if self.tracer is not None:
+                    self.tracer.dump()
+                raise resp
             if self.debug:
                 print(f'Received {resp}')
             if isinstance(resp, CurrentTasksResponse):
@@ -71,7 +236,8 @@ class QtLeanServer(QObject):
                     self.is_ready.emit()
                 self.is_busy = resp.is_running
             elif isinstance(resp, AllMessagesResponse):
-                self.messages = resp.msgs
+                self.messages = self.retention.retain(resp.msgs) if self.retention else resp.msgs
+                self.message_index.update(self.messages)
                 for msg in resp.msgs:
                     if msg.severity == Severity.error:
                         self.error.emit(msg.text)
@@ -82,9 +248,13 @@ class QtLeanServer(QObject):
                 #  This is a stop gap that preserves the current behavior.
                 info_resp = resp.to_command_response('info')
                 assert isinstance(info_resp, InfoResponse)
-                self.goal_state = info_resp.record.state
+                # Positions outside of proofs have no record or no state
+                record = info_resp.record
+                self.goal_state = record.state if record is not None and record.state is not None else ''
                 self.state_update.emit()
 
     def kill(self):
         self.process.kill()
         self.process.waitForFinished(2000)
+        if self.parser_thread is not None:
+            stop_thread(self.parser_thread)
@@ -0,0 +1,186 @@
+"""
+Bounding the memory used by the messages a server keeps around.
+
+Lean sometimes puts huge terms in error messages, and sends all messages
+again in each all_messages response. A MessageRetention policy, passed to a
+server, decides what is actually kept in server.messages:
+
+* texts longer than max_text_length are moved to a temporary file and read
+  back when accessed (or simply truncated if spilling is disabled),
+* if the remaining messages still exceed memory_budget, the messages of the
+  files which changed least recently are dropped.
+"""
+from typing import Optional, List, Dict, Tuple, Set
+from dataclasses import fields, replace
+import hashlib
+import tempfile
+
+from lean_client.commands import Message
+
+# Rough size of a Message object without its text, in bytes
+MESSAGE_OVERHEAD = 400
+
+TRUNCATION_MARK = '\n[… truncated]'
+
+
+def text_digest(text: str) -> bytes:
+    return hashlib.blake2b(text.encode(), digest_size=16).digest()
+
+
+class SpillStore:
+    def __init__(self, directory: Optional[str] = None):
+        """
+        Texts stored in an anonymous temporary file. Identical texts are
+        stored only once. Keys are (offset, length) pairs in the file.
+        """
+        self.file = tempfile.TemporaryFile(dir=directory)
+        self.size = 0
+        self.keys: Dict[bytes, Tuple[int, int]] = dict()
+
+    def put(self, text: str) -> Tuple[int, int]:
+        data = text.encode()
+        digest = hashlib.blake2b(data, digest_size=16).digest()
+        if digest not in self.keys:
+            self.file.seek(self.size)
+            self.file.write(data)
+            self.keys[digest] = (self.size, len(data))
+            self.size += len(data)
+        return self.keys[digest]
+
+    def get(self, key: Tuple[int, int]) -> str:
+        offset, length = key
+        self.file.seek(offset)
+        return self.file.read(length).decode()
+
+    def close(self):
+        self.file.close()
+
+
+class SpilledMessage(Message):
+    def __init__(self, msg: Message, store: SpillStore):
+        """A message whose text lives in a SpillStore. The text is read
+        from disk each time it is accessed."""
+        for field in fields(Message):
+            if field.name != 'text':
+                setattr(self, field.name, getattr(msg, field.name))
+        self.store = store
+        self.key = store.put(msg.text)
+
+    @property  # type: ignore
+    def text(self) -> str:  # type: ignore
+        return self.store.get(self.key)
+
+    def __repr__(self):
+        return (f'SpilledMessage(file_name={self.file_name!r}, severity={self.severity}, '
+                f'pos_line={self.pos_line}, pos_col={self.pos_col}, key={self.key})')
+
+
+def message_key(msg: Message) -> tuple:
+    """Identifies a message without holding its text, which may be huge."""
+    return (msg.file_name, msg.severity, msg.caption, text_digest(msg.text),
+            msg.pos_line, msg.pos_col, msg.end_pos_line, msg.end_pos_col)
+
+
+def keys_digest(keys: List[tuple]) -> bytes:
+    return hashlib.blake2b(repr(keys).encode(), digest_size=16).digest()
+
+
+class MessageRetention:
+    def __init__(self, memory_budget: Optional[int] = None, max_text_length: Optional[int] = 10_000,
+                 spill: bool = True, spill_dir: Optional[str] = None):
+        """
+        Retention policy for Lean messages, see the module docstring.
+        memory_budget is an estimate in bytes, None means no limit.
+        """
+        self.memory_budget = memory_budget
+        self.max_text_length = max_text_length
+        self.spill_dir = spill_dir
+        self.store: Optional[SpillStore] = SpillStore(spill_dir) if spill else None
+        # Retained versions of the messages of the previous response, so
+        # that unchanged messages are not spilled or truncated again
+        self.retained: Dict[tuple, Message] = dict()
+        # file name -> number of the last response where its messages changed
+        self.last_changed: Dict[str, int] = dict()
+        # file name -> digest of the keys of its messages, to detect changes
+        self.file_keys: Dict[str, bytes] = dict()
+        self.generation = 0
+        # files whose messages were dropped from the last response
+        self.evicted: Set[str] = set()
+        self.memory_used = 0
+
+    def shrink(self, msg: Message) -> Message:
+        """The version of msg which is kept in memory."""
+        if self.max_text_length is None or len(msg.text) <= self.max_text_length:
+            return msg
+        if self.store is not None:
+            return SpilledMessage(msg, self.store)
+        return replace(msg, text=msg.text[:self.max_text_length] + TRUNCATION_MARK)
+
+    @staticmethod
+    def size(msg: Message) -> int:
+        if isinstance(msg, SpilledMessage):
+            return MESSAGE_OVERHEAD
+        return MESSAGE_OVERHEAD + len(msg.text)
+
+    def retain(self, msgs: List[Message]) -> List[Message]:
+        """Messages of a new all_messages response which should be kept,
+        in the order Lean sent them."""
+        self.generation += 1
+        retained: Dict[tuple, Message] = dict()
+        kept_msgs: List[Message] = []
+        file_keys: Dict[str, List[tuple]] = dict()
+        file_sizes: Dict[str, int] = dict()
+        for msg in msgs:
+            key = message_key(msg)
+            kept = self.retained.get(key) or retained.get(key) or self.shrink(msg)
+            retained[key] = kept
+            kept_msgs.append(kept)
+            file_keys.setdefault(msg.file_name, []).append(key)
+            file_sizes[msg.file_name] = file_sizes.get(msg.file_name, 0) + self.size(kept)
+
+        digests = {file_name: keys_digest(keys) for file_name, keys in file_keys.items()}
+        for file_name, digest in digests.items():
+            if self.file_keys.get(file_name) != digest:
+                self.last_changed[file_name] = self.generation
+        for file_name in set(self.last_changed) - set(digests):
+            del self.last_changed[file_name]
+        self.file_keys = digests
+        self.retained = retained
+
+        self.memory_used = sum(file_sizes.values())
+        self.evicted = set()
+        if self.memory_budget is not None:
+            # The most recently changed file is always kept.
+            by_age = sorted(file_sizes, key=lambda file_name: self.last_changed[file_name])
+            for file_name in by_age[:-1]:
+                if self.memory_used <= self.memory_budget:
+                    break
+                self.memory_used -= file_sizes[file_name]
+                self.evicted.add(file_name)
+        for file_name in self.evicted:
+            for key in file_keys[file_name]:
+                self.retained.pop(key, None)
+        self.compact()
+        if not self.evicted:
+            return kept_msgs
+        return [msg for msg in kept_msgs if msg.file_name not in self.evicted]
+
+    def compact(self, min_size: int = 1 << 20):
+        """Start a new spill file holding only the texts of retained
+        messages if the current one is mostly garbage."""
+        if self.store is None or self.store.size < min_size:
+            return
+        spilled = [msg for msg in self.retained.values() if isinstance(msg, SpilledMessage)]
+        live_keys = {msg.key for msg in spilled}
+        if 2 * sum(length for _, length in live_keys) > self.store.size:
+            return
+        old_store, self.store = self.store, SpillStore(self.spill_dir)
+        for msg in spilled:
+            text = old_store.get(msg.key)
+            msg.store, msg.key = self.store, self.store.put(text)
+        old_store.close()
+
+    def close(self):
+        """Delete the spill file."""
+        if self.store is not None:
+            self.store.close()
@@ -0,0 +1,170 @@
+"""
+Spreading files over several Lean workers (see lean_client.worker).
+
+A ShardedLeanClient connects to a list of workers, given as "host:port" or
+"unix:/path/to/socket", and sends everything about a file to the worker
+chosen for it by consistent hashing. Hence a file always goes to the same
+warm worker, and adding or removing a worker only moves the files of that
+worker.
+"""
+from typing import Optional, List, Dict, Generic, TypeVar, Tuple
+import bisect
+import hashlib
+import socket
+
+import trio  # type: ignore
+
+from lean_client.commands import Request, SyncRequest, CommandResponse, Message
+from lean_client.trio_server import TrioLeanServer, Priority
+
+Node = TypeVar('Node')
+
+
+def ring_hash(key: str) -> int:
+    return int.from_bytes(hashlib.blake2b(key.encode(), digest_size=8).digest(), 'big')
+
+
+class HashRing(Generic[Node]):
+    def __init__(self, replicas: int = 64):
+        """Consistent hashing: each node owns the keys hashed right before
+        one of its replicas points on the ring."""
+        self.replicas = replicas
+        self.points: List[Tuple[int, str]] = []
+        self.nodes: Dict[str, Node] = dict()
+
+    def add(self, name: str, node: Node):
+        self.nodes[name] = node
+        for i in range(self.replicas):
+            bisect.insort(self.points, (ring_hash(f'{name}#{i}'), name))
+
+    def remove(self, name: str):
+        del self.nodes[name]
+        self.points = [point for point in self.points if point[1] != name]
+
+    def node_for(self, key: str) -> Node:
+        if not self.points:
+            raise ValueError('Empty hash ring')
+        index = bisect.bisect(self.points, (ring_hash(key), '')) % len(self.points)
+        return self.nodes[self.points[index][1]]
+
+
+class SocketProcess:
+    def __init__(self, stream: trio.SocketStream):
+        """Stands for the Lean process of a RemoteLeanServer. There is no
+        local process id: the process runs on the worker's machine."""
+        self.stdin = stream
+        self.stdout = stream
+        self.pid: Optional[int] = None
+        # Set once the receiver reading the stream is done and closed it
+        self.closed = trio.Event()
+
+    async def wait(self):
+        await self.closed.wait()
+
+    def kill(self):
+        # The receiver then sees the end of the stream, as with a dead process.
+        try:
+            self.stdin.socket.shutdown(socket.SHUT_RDWR)
+        except OSError:
+            pass
+
+
+async def connect(address: str) -> trio.SocketStream:
+    if address.startswith('unix:'):
+        return await trio.open_unix_socket(address[len('unix:'):])
+    host, _, port = address.rpartition(':')
+    return await trio.open_tcp_stream(host, int(port))
+
+
+class RemoteLeanServer(TrioLeanServer):
+    def __init__(self, nursery, address: str, **server_options):
+        """TrioLeanServer talking to a LeanWorker instead of a child process.
+        restart only opens a new connection to the worker and syncs the
+        files again: the Lean process of a worker is recycled by a monitor
+        running next to it."""
+        super().__init__(nursery, **server_options)
+        self.address = address
+
+    async def start(self):
+        self.process = SocketProcess(await connect(self.address))  # type: ignore
+        self.nursery.start_soon(self.receiver)
+
+    async def receiver(self):
+        process = self.process
+        try:
+            await super().receiver()
+        finally:
+            with trio.CancelScope(shield=True):
+                await process.stdin.aclose()
+            process.closed.set()
+
+
+class ShardedLeanClient:
+    def __init__(self, nursery, addresses: List[str], replicas: int = 64, **server_options):
+        """Client of several workers, see the module docstring.
+        server_options are passed to each RemoteLeanServer."""
+        self.nursery = nursery
+        self.server_options = server_options
+        self.ring: HashRing[RemoteLeanServer] = HashRing(replicas)
+        self.addresses = list(addresses)
+        self.next_server = 0
+
+    @property
+    def servers(self) -> List[RemoteLeanServer]:
+        return list(self.ring.nodes.values())
+
+    async def start(self):
+        async with trio.open_nursery() as nursery:
+            for address in self.addresses:
+                nursery.start_soon(self.add_worker, address)
+
+    async def add_worker(self, address: str):
+        """Connect to a new worker, and sync there the files it now owns,
+        as they were last synced on their previous worker."""
+        server = RemoteLeanServer(self.nursery, address, **self.server_options)
+        await server.start()
+        synced = {file_name: content for other in self.servers
+                  for file_name, content in other.synced_files.items()}
+        self.ring.add(address, server)
+        if address not in self.addresses:
+            self.addresses.append(address)
+        async with trio.open_nursery() as nursery:
+            for file_name, content in synced.items():
+                if self.server_for(file_name) is server:
+                    nursery.start_soon(server.send, SyncRequest(file_name, content))
+
+    def remove_worker(self, address: str):
+        """Disconnect from a worker. Its files are not synced on the
+        workers now owning them, this is up to the caller."""
+        self.ring.nodes[address].kill()
+        self.ring.remove(address)
+        self.addresses.remove(address)
+
+    def server_for(self, file_name: str) -> RemoteLeanServer:
+        return self.ring.node_for(file_name)
+
+    async def send(self, request: Request, priority: Priority = Priority.normal) -> Optional[CommandResponse]:
+        """Send a request to the worker owning its file, or to the next worker
+        for requests which are not about a file (like search)."""
+        file_name = getattr(request, 'file_name', None)
+        if file_name is not None:
+            server = self.server_for(file_name)
+        else:
+            servers = self.servers
+            self.next_server = (self.next_server + 1) % len(servers)
+            server = servers[self.next_server]
+        return await server.send(request, priority)
+
+    async def full_sync(self, filename, content=None) -> None:
+        await self.server_for(filename).full_sync(filename, content)
+
+    async def state(self, filename, line, col, priority: Priority = Priority.normal) -> str:
+        return await self.server_for(filename).state(filename, line, col, priority)
+
+    @property
+    def messages(self) -> List[Message]:
+        return [msg for server in self.servers for msg in server.messages]
+
+    def kill(self):
+        for server in self.servers:
+            server.kill()
@@ -0,0 +1,96 @@
+"""
+Trying many tactics at the same point of a proof, in parallel.
+
+A SpeculativeEvaluator writes the proof prefix followed by each candidate
+tactic into a virtual file (there is one such file per server, synced with
+its content and never written to disk) and evaluates the candidates
+concurrently on the servers of a LeanServerPool:
+
+    evaluator = SpeculativeEvaluator(pool, template)
+    outcomes = await evaluator.evaluate(['intro h'], ['cases h', 'simp', 'finish'])
+    winner = await evaluator.evaluate(['intro h'], candidates, first_success=True)
+
+Each TacticOutcome has the goal state after the tactic, or the errors Lean
+reported on its line.
+"""
+from typing import Optional, List, Tuple
+from dataclasses import dataclass
+
+import trio  # type: ignore
+
+from lean_client.commands import Message, Severity
+from lean_client.goals import ParsedGoalState, GoalInterner, parse_goal_state
+from lean_client.pool import LeanServerPool
+from lean_client.tactics import ProofDocument, UNSOLVED
+from lean_client.trio_server import TrioLeanServer
+
+
+@dataclass
+class TacticOutcome:
+    tactic: str
+    state: str
+    goals: ParsedGoalState
+    errors: List[Message]
+
+    @property
+    def success(self) -> bool:
+        return not self.errors
+
+
+class SpeculativeEvaluator:
+    def __init__(self, pool: LeanServerPool, template: str, placeholder: str = 'sorry',
+                 file_name: str = 'speculative.lean', interner: Optional[GoalInterner] = None):
+        """Evaluator of tactics in the proof of template (see
+        lean_client.tactics.ProofDocument) on a started pool. The virtual
+        files are named after file_name, which decides how relative imports
+        are resolved."""
+        self.pool = pool
+        self.document = ProofDocument(template, placeholder)
+        self.base_name = file_name[:-len('.lean')] if file_name.endswith('.lean') else file_name
+        self.interner = interner or GoalInterner()
+
+    def file_name(self, server: TrioLeanServer) -> str:
+        return f'{self.base_name}_{self.pool.servers.index(server)}.lean'
+
+    async def run(self, tactics: List[str]) -> Tuple[str, List[Message]]:
+        """Goal state after tactics, and errors on the line of the last one."""
+        line = self.document.tactic_line(len(tactics) - 1)
+        async with self.pool.checkout() as server:
+            file_name = self.file_name(server)
+            await server.full_sync(file_name, self.document.content(tactics))
+            errors = [msg for msg in server.message_index.query(file_name, line, line, Severity.error)
+                      if tactics and not msg.text.startswith(UNSOLVED)]
+            state_line, state_column = self.document.state_position(len(tactics))
+            state = await server.state(file_name, state_line, state_column)
+        return state, errors
+
+    async def state_after(self, tactics: List[str]) -> ParsedGoalState:
+        state, _ = await self.run(tactics)
+        return parse_goal_state(state, self.interner)
+
+    async def evaluate_one(self, prefix: List[str], tactic: str) -> TacticOutcome:
+        state, errors = await self.run(prefix + [tactic])
+        return TacticOutcome(tactic, state, parse_goal_state(state, self.interner), errors)
+
+    async def evaluate(self, prefix: List[str], tactics: List[str],
+                       first_success: bool = False) -> List[TacticOutcome]:
+        """Outcomes of each tactic after the prefix tactics, in the order of
+        tactics. With first_success, return as soon as a tactic succeeds,
+        cancelling the other evaluations, and return only its outcome (or all
+        outcomes if none succeeds)."""
+        outcomes: List[Optional[TacticOutcome]] = [None] * len(tactics)
+        winner: List[TacticOutcome] = []
+
+        async with trio.open_nursery() as nursery:
+            async def run(index: int):
+                outcome = outcomes[index] = await self.evaluate_one(prefix, tactics[index])
+                if first_success and outcome.success and not winner:
+                    winner.append(outcome)
+                    nursery.cancel_scope.cancel()
+
+            for index in range(len(tactics)):
+                nursery.start_soon(run, index)
+
+        if winner:
+            return winner
+        return [outcome for outcome in outcomes if outcome is not None]
@@ -0,0 +1,202 @@
+"""
+Communicating with the Lean server from plain synchronous code.
+
+A SyncLeanServer reads Lean's responses in a background thread. Sending a
+request writes it right away and returns a concurrent.futures.Future
+resolved by the reader thread when the response with its sequence number
+comes in, so blocking calls from many threads are pipelined on the same
+Lean process:
+
+    server = SyncLeanServer()
+    server.start()
+    server.full_sync('test.lean')
+    with ThreadPoolExecutor(8) as executor:
+        states = list(executor.map(lambda line: server.state('test.lean', line, 0), range(1, 100)))
+    server.kill()
+"""
+from typing import Optional, List, Dict, Union, Callable, TYPE_CHECKING
+from concurrent.futures import Future
+from subprocess import Popen, PIPE
+import threading
+import time
+
+from lean_client.commands import (SyncRequest, InfoRequest,
+                                  Request, Response, CommandResponse, Message, Task,
+                                  InfoResponse, AllMessagesResponse, CurrentTasksResponse, ErrorResponse,
+                                  OkResponse, SyncResponse)
+from lean_client.diagnostics import MessageIndex
+
+if TYPE_CHECKING:
+    # only needed by users passing a retention policy or a tracer
+    from lean_client.retention import MessageRetention
+    from lean_client.tracing import FrameTracer
+
+
+class SyncLeanServer:
+    def __init__(self, lean_cmd: Union[str, List[str]] = 'lean', debug=False,
+                 retention: Optional['MessageRetention'] = None, tracer: Optional['FrameTracer'] = None):
+        """
+        Lean server interface for synchronous code, safe to use from several
+        threads at once.
+
+        Retention policies and tracers work as for TrioLeanServer. Response
+        callbacks are called in the reader thread.
+        """
+        self.lean_cmd: List[str] = lean_cmd if isinstance(lean_cmd, List) else [lean_cmd]
+        self.debug: bool = debug
+        self.retention: Optional['MessageRetention'] = retention
+        # Messages of the last all_messages response, reused when unchanged
+        # (see AllMessagesResponse). A retention policy reuses its own
+        # versions instead, so that full texts are not kept here.
+        self.previous_msgs: Optional[Dict[tuple, Message]] = None if retention else dict()
+        self.tracer: Optional['FrameTracer'] = tracer
+        self.seq_num: int = 0
+        self.messages: List[Message] = []
+        self.message_index = MessageIndex()
+        self.current_tasks: List[Task] = []
+        # Functions called with each response, in the order Lean sent them,
+        # after the server state has been updated
+        self.response_callbacks: List[Callable[[Response], None]] = []
+        self.process: Optional[Popen] = None
+        self.reader: Optional[threading.Thread] = None
+        # Held while allocating a sequence number and writing the request,
+        # so that requests reach Lean in the order of their numbers
+        self.lock = threading.Lock()
+        # Futures of the requests waiting for a response, by sequence
+        # number. Their lock is never held while writing: the reader must
+        # not wait for a writer blocked by a full pipe.
+        self.futures: Dict[int, Future] = dict()
+        self.futures_lock = threading.Lock()
+        self.stopped: bool = False
+        self.is_fully_ready = threading.Event()
+
+    def start(self):
+        self.process = Popen(self.lean_cmd + ['--server'], stdin=PIPE, stdout=PIPE)
+        self.reader = threading.Thread(target=self.receiver, name='lean-reader', daemon=True)
+        self.reader.start()
+
+    def send_async(self, request: Request) -> Future:
+        """Write the request and return a future of Lean's raw response
+        (None for requests without response)."""
+        if not self.process:
+            raise ValueError('No Lean server')
+        stdin = self.process.stdin
+        assert stdin is not None  # started with stdin=PIPE
+        future: Future = Future()
+        with self.lock:
+            self.seq_num += 1
+            request.seq_num = self.seq_num
+            if self.debug:
+                print(f'Sending {request}')
+            # The future must be registered before the request is written
+            # since the response may come in right away.
+            if request.expect_response:
+                with self.futures_lock:
+                    if self.stopped:
+                        raise ChildProcessError('Lean server stopped')
+                    self.futures[request.seq_num] = future
+            data = (request.to_json() + '\n').encode()
+            if self.tracer is not None:
+                self.tracer.sent(data)
+            try:
+                stdin.write(data)
+                stdin.flush()
+            except OSError:
+                with self.futures_lock:
+                    self.futures.pop(request.seq_num, None)
+                raise
+        if not request.expect_response:
+            future.set_result(None)
+        return future
+
+    def send(self, request: Request, timeout: Optional[float] = None) -> Optional[CommandResponse]:
+        response = self.send_async(request).result(timeout)
+
+        # Some responses like sleep and long_sleep don't get responses
+        if response is None:
+            return None
+
+        # Lean errors are rare and signify problems with the command itself
+        # (e.g. an incorrect file).  They should be raised as Python errors.
+        if isinstance(response, OkResponse):
+            return response.to_command_response(request.command)
+        assert isinstance(response, ErrorResponse)
+        if self.tracer is not None:
+            self.tracer.dump()
+        raise ChildProcessError(f'Lean server error while executing "{request.command}":\n{response}')
+
+    def receiver(self):
+        """Body of the reader thread: updates the server state (tasks and
+        messages) and resolves futures as responses come. When Lean stops,
+        the requests still waiting fail with ChildProcessError."""
+        try:
+            for line in self.process.stdout:
+                if self.tracer is not None:
+                    self.tracer.received(line.rstrip(b'\n'))
+                try:
+                    resp = Response.parse_response(line.decode(), self.previous_msgs)
+                except Exception:
+                    if self.tracer is not None:
+                        self.tracer.dump()
+                    raise
+                if self.debug:
+                    print(f'Received {resp}')
+
+                future: Optional[Future] = None
+                if isinstance(resp, CurrentTasksResponse):
+                    self.current_tasks = resp.tasks
+                    if not resp.is_running:
+                        self.is_fully_ready.set()
+                elif isinstance(resp, AllMessagesResponse):
+                    messages = self.retention.retain(resp.msgs) if self.retention else resp.msgs
+                    self.message_index.update(messages)
+                    self.messages = messages
+                elif isinstance(resp, (ErrorResponse, OkResponse)):
+                    if isinstance(resp, OkResponse) and resp.data.get('message') == 'file invalidated':
+                        # Cleared before the sync future is resolved, so that
+                        # full_sync waits for the following current_tasks.
+                        self.is_fully_ready.clear()
+                    with self.futures_lock:
+                        future = self.futures.pop(resp.seq_num, None)
+
+                # Callbacks come first: once the future is resolved, the
+                # sender converts the response data in place.
+                for callback in self.response_callbacks:
+                    callback(resp)
+                if future is not None:
+                    future.set_result(resp)
+        finally:
+            with self.futures_lock:
+                self.stopped = True
+                futures, self.futures = self.futures, dict()
+            for future in futures.values():
+                future.set_exception(ChildProcessError('Lean server stopped'))
+
+    def full_sync(self, filename, content=None, timeout: Optional[float] = None) -> None:
+        """Fully compile a Lean file before returning. Raises TimeoutError
+        if this takes more than timeout seconds."""
+        deadline = None if timeout is None else time.monotonic() + timeout
+        response = self.send(SyncRequest(filename, content), timeout)
+        assert isinstance(response, SyncResponse)
+
+        if response.message == "file invalidated":
+            remaining = None if deadline is None else max(0., deadline - time.monotonic())
+            if not self.is_fully_ready.wait(remaining):
+                raise TimeoutError(f'{filename} was not compiled within {timeout} seconds')
+
+    def state(self, filename, line, col, timeout: Optional[float] = None) -> str:
+        """Tactic state"""
+        resp = self.send(InfoRequest(filename, line, col), timeout)
+        if isinstance(resp, InfoResponse) and resp.record:
+            return resp.record.state or ''
+        else:
+            return ''
+
+    def kill(self):
+        """Kill the Lean process and wait for the reader thread."""
+        self.process.kill()
+        self.process.wait()
+        if self.reader is not None and self.reader is not threading.current_thread():
+            self.reader.join()
+        self.process.stdout.close()
+        self.process.stdin.close()
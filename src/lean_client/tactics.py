@@ -0,0 +1,127 @@
+"""
+Interactive proofs as stacks of tactic steps.
+
+A ProofDocument is a Lean file template containing a placeholder (sorry by
+default) where tactic lines are inserted, one per line. A TacticSession
+keeps the steps of a proof in a stack, with the goal state and the errors
+after each step:
+
+* adding a step syncs the new file and asks Lean for the state at the new
+  position only,
+* undoing a step pops it, without talking to Lean since the state before it
+  is cached (the file is synced again with the next step).
+
+    session = TacticSession(server, 'template.lean', Path('template.lean').read_text())
+    await session.start()
+    step = await session.add('intro h')
+    print(step.state)
+    session.undo()
+"""
+from typing import Optional, List, Tuple, TYPE_CHECKING
+from dataclasses import dataclass
+
+from lean_client.commands import Message, Severity
+from lean_client.goals import ParsedGoalState, GoalInterner, parse_goal_state
+
+if TYPE_CHECKING:
+    # ProofDocument is also used with QtLeanServer, without trio
+    from lean_client.trio_server import TrioLeanServer
+
+# Lean reports unfinished proofs at the end of the proof, this is not an
+# error of the last step.
+UNSOLVED = 'tactic failed, there are unsolved goals'
+
+
+class ProofDocument:
+    def __init__(self, template: str, placeholder: str = 'sorry', indent: str = '  '):
+        """Lean file where tactic lines replace the first occurrence of placeholder."""
+        if placeholder not in template:
+            raise ValueError(f'No {placeholder} in the template')
+        self.template = template
+        self.placeholder = placeholder
+        self.indent = indent
+        # line number (starting at 1, as in Lean) of the placeholder
+        self.proof_start = template[:template.index(placeholder)].count('\n') + 1
+
+    def content(self, tactics: List[str]) -> str:
+        lines = [self.indent + tactic.strip(' ,') + ',' for tactic in tactics]
+        return self.template.replace(self.placeholder, '\n'.join(lines), 1)
+
+    def tactic_line(self, index: int) -> int:
+        """Line of the tactic number index (starting at 0)."""
+        return self.proof_start + index
+
+    def state_position(self, nb_tactics: int) -> Tuple[int, int]:
+        """Where Lean reports the goals after nb_tactics tactics: the start
+        of the following line."""
+        return self.proof_start + nb_tactics, 0
+
+
+@dataclass
+class ProofStep:
+    tactic: str
+    state: str
+    goals: ParsedGoalState
+    errors: List[Message]
+
+    @property
+    def failed(self) -> bool:
+        return bool(self.errors)
+
+
+class TacticSession:
+    def __init__(self, server: 'TrioLeanServer', file_name: str, template: str, placeholder: str = 'sorry',
+                 interner: Optional[GoalInterner] = None):
+        """Proof in the file file_name of a started server, see the module docstring."""
+        self.server = server
+        self.file_name = file_name
+        self.document = ProofDocument(template, placeholder)
+        self.interner = interner or GoalInterner()
+        self.steps: List[ProofStep] = []
+        self.initial_state = ''
+        self.initial_goals = parse_goal_state('', self.interner)
+
+    @property
+    def tactics(self) -> List[str]:
+        return [step.tactic for step in self.steps]
+
+    @property
+    def content(self) -> str:
+        return self.document.content(self.tactics)
+
+    @property
+    def state(self) -> str:
+        """Goal state after the last step."""
+        return self.steps[-1].state if self.steps else self.initial_state
+
+    @property
+    def goals(self) -> ParsedGoalState:
+        return self.steps[-1].goals if self.steps else self.initial_goals
+
+    async def query_state(self, nb_tactics: int) -> str:
+        line, column = self.document.state_position(nb_tactics)
+        return await self.server.state(self.file_name, line, column)
+
+    async def start(self) -> str:
+        """Sync the file without any tactic and return the initial goal state."""
+        self.steps = []
+        await self.server.full_sync(self.file_name, self.content)
+        self.initial_state = await self.query_state(0)
+        self.initial_goals = parse_goal_state(self.initial_state, self.interner)
+        return self.initial_state
+
+    async def add(self, tactic: str) -> ProofStep:
+        """Run tactic after the current steps and push the resulting step,
+        even if it failed (see ProofStep.failed)."""
+        line = self.document.tactic_line(len(self.steps))
+        await self.server.full_sync(self.file_name, self.document.content(self.tactics + [tactic]))
+        errors = [msg for msg in self.server.message_index.query(self.file_name, line, line, Severity.error)
+                  if not msg.text.startswith(UNSOLVED)]
+        state = await self.query_state(len(self.steps) + 1)
+        step = ProofStep(tactic, state, parse_goal_state(state, self.interner), errors)
+        self.steps.append(step)
+        return step
+
+    def undo(self) -> Optional[ProofStep]:
+        """Pop the last step, if any. The previous state is known already."""
+        return self.steps.pop() if self.steps else None
@@ -0,0 +1,139 @@
+"""
+Recording what a TrioLeanServer and Lean are doing over time, in the Chrome
+trace event format, to be opened in chrome://tracing or https://ui.perfetto.dev.
+
+A Timeline passed as the timeline of a TrioLeanServer records:
+
+* the lifetime of each request: waiting for its turn and for the write to
+  Lean, waiting for Lean's response, and parsing of the response,
+* the tasks reported by Lean in current_tasks responses, from their first
+  appearance to their disappearance,
+* each full_sync, until the file is fully compiled.
+
+    timeline = Timeline()
+    server = TrioLeanServer(nursery, timeline=timeline)
+    await server.full_sync('test.lean')
+    timeline.write('sync.json')
+"""
+from typing import Optional, List, Dict, Any, Tuple
+from dataclasses import dataclass
+import itertools
+import json
+import os
+import time
+
+from lean_client.commands import Task
+
+# Process ids in the trace
+CLIENT_PID = 1
+LEAN_PID = 2
+
+
+@dataclass
+class RequestSpan:
+    command: str
+    file_name: Optional[str]
+    enqueued: float
+    written: Optional[float] = None
+    replied: Optional[float] = None
+    parsed: Optional[float] = None
+
+
+def task_key(task: Task) -> Tuple:
+    return task.file_name, task.pos_line, task.pos_col, task.end_pos_line, task.end_pos_col, task.desc
+
+
+class Timeline:
+    def __init__(self):
+        """Requests, Lean tasks and syncs recorded so far, see the module docstring."""
+        self.start_time = time.perf_counter()
+        self.requests: Dict[int, RequestSpan] = dict()
+        # Lean tasks currently running and their start time
+        self.running_tasks: Dict[Tuple, Tuple[Task, float]] = dict()
+        self.events: List[Dict[str, Any]] = []
+        self.ids = itertools.count(1)
+
+    @staticmethod
+    def now() -> float:
+        return time.perf_counter()
+
+    def timestamp(self, moment: float) -> float:
+        """Microseconds since the creation of the timeline."""
+        return round((moment - self.start_time) * 1e6, 3)
+
+    def async_span(self, pid: int, category: str, name: str, start: float, end: float, span_id: int,
+                   args: Optional[Dict[str, Any]] = None):
+        begin: Dict[str, Any] = {'name': name, 'cat': category, 'ph': 'b', 'id': span_id,
+                                 'pid': pid, 'tid': 0, 'ts': self.timestamp(start)}
+        if args:
+            begin['args'] = args
+        self.events.append(begin)
+        self.events.append({'name': name, 'cat': category, 'ph': 'e', 'id': span_id,
+                            'pid': pid, 'tid': 0, 'ts': self.timestamp(end)})
+
+    def request_enqueued(self, seq_num: int, command: str, file_name: Optional[str], enqueued: float):
+        self.requests[seq_num] = RequestSpan(command, file_name, enqueued)
+
+    def request_written(self, seq_num: int):
+        if seq_num in self.requests:
+            self.requests[seq_num].written = self.now()
+
+    def request_replied(self, seq_num: int, replied: float):
+        """Record the response of a request, received at replied and parsed now."""
+        if seq_num in self.requests:
+            self.requests[seq_num].replied = replied
+            self.requests[seq_num].parsed = self.now()
+            self.request_done(seq_num)
+
+    def request_done(self, seq_num: int, cancelled: bool = False):
+        """Turn the recorded times of a request into trace events. Does
+        nothing if they were turned already."""
+        span = self.requests.pop(seq_num, None)
+        if span is None:
+            return
+        span_id = next(self.ids)
+        end = self.now() if cancelled else span.parsed or span.replied or span.written or span.enqueued
+        args: Dict[str, Any] = {'seq_num': seq_num}
+        if cancelled:
+            args['cancelled'] = True
+        if span.file_name:
+            args['file_name'] = span.file_name
+        self.async_span(CLIENT_PID, 'request', span.command, span.enqueued, end, span_id, args)
+        phases = [('queued', span.enqueued, span.written), ('in Lean', span.written, span.replied),
+                  ('parsing', span.replied, span.parsed)]
+        for name, start, stop in phases:
+            if start is not None and stop is not None:
+                self.async_span(CLIENT_PID, 'request', name, start, stop, span_id)
+
+    def full_sync(self, file_name: str, start: float, end: float):
+        self.async_span(CLIENT_PID, 'sync', f'full_sync {file_name}', start, end, next(self.ids))
+
+    def tasks(self, tasks: List[Task]):
+        """Record the tasks of a current_tasks response."""
+        moment = self.now()
+        keys = set()
+        for task in tasks:
+            key = task_key(task)
+            keys.add(key)
+            if key not in self.running_tasks:
+                self.running_tasks[key] = (task, moment)
+        for key in [key for key in self.running_tasks if key not in keys]:
+            self.task_done(key, moment)
+
+    def task_done(self, key: Tuple, end: float):
+        task, start = self.running_tasks.pop(key)
+        self.async_span(LEAN_PID, 'task', task.desc, start, end, next(self.ids),
+                        {'file_name': task.file_name, 'line': task.pos_line, 'end_line': task.end_pos_line})
+
+    def to_chrome_trace(self) -> Dict[str, Any]:
+        """Trace of everything recorded so far. Lean tasks still running end now."""
+        moment = self.now()
+        for key in list(self.running_tasks):
+            self.task_done(key, moment)
+        metadata = [{'name': 'process_name', 'ph': 'M', 'pid': pid, 'args': {'name': name}}
+                    for pid, name in [(CLIENT_PID, f'lean_client {os.getpid()}'), (LEAN_PID, 'Lean tasks')]]
+        return {'traceEvents': metadata + self.events, 'displayTimeUnit': 'ms'}
+
+    def write(self, path: str):
+        with open(path, 'w') as file:
+            json.dump(self.to_chrome_trace(), file)
@@ -0,0 +1,91 @@
+"""
+Keeping the last protocol frames exchanged with Lean, for post-mortem
+diagnostics.
+
+A FrameTracer passed as the tracer of a TrioLeanServer or QtLeanServer records
+every chunk written to Lean and every line received from it, with a
+timestamp, in a fixed-size ring buffer of bytes keeping the last max_frames
+frames (fewer if they don't fit in capacity bytes). Nothing is formatted while
+recording; the buffer is only decoded by frames() or dump(), which the servers
+call when something goes wrong. Servers without a tracer only pay a test
+against None for each frame.
+
+    tracer = FrameTracer(max_frames=1000)
+    server = TrioLeanServer(nursery, tracer=tracer)
+    ...
+    tracer.dump()
+"""
+from typing import Optional, List, Deque, Tuple, TextIO
+from collections import deque
+import sys
+import time
+
+SENT = 0
+RECEIVED = 1
+DIRECTIONS = {SENT: '->', RECEIVED: '<-'}
+
+
+class FrameTracer:
+    def __init__(self, max_frames: Optional[int] = 1000, capacity: int = 1 << 20):
+        """Ring buffer holding the last max_frames frames (all frames if
+        None), as long as they fit in capacity bytes (a frame longer than
+        capacity is truncated)."""
+        if capacity < 1 or (max_frames is not None and max_frames < 1):
+            raise ValueError('The capacity and frame count of a tracer must be positive')
+        self.max_frames = max_frames
+        self.capacity = capacity
+        self.buffer = bytearray(capacity)
+        # Total number of bytes ever written in the buffer, the write
+        # position is written % capacity.
+        self.written = 0
+        # (start in the total byte count, length, time, direction) of each
+        # frame still in the buffer, oldest first
+        self.frames_info: Deque[Tuple[int, int, float, int]] = deque()
+        self.start_time = time.perf_counter()
+        # Number of frames which fell off the buffer
+        self.dropped = 0
+
+    def record(self, direction: int, data: bytes):
+        data = data[-self.capacity:]
+        length = len(data)
+        position = self.written % self.capacity
+        first = min(length, self.capacity - position)
+        self.buffer[position:position + first] = data[:first]
+        self.buffer[:length - first] = data[first:]
+        self.frames_info.append((self.written, length, time.perf_counter(), direction))
+        self.written += length
+        oldest = self.written - self.capacity
+        while self.frames_info[0][0] < oldest or (self.max_frames is not None
+                                                  and len(self.frames_info) > self.max_frames):
+            self.frames_info.popleft()
+            self.dropped += 1
+
+    def sent(self, data: bytes):
+        self.record(SENT, data)
+
+    def received(self, data: bytes):
+        self.record(RECEIVED, data)
+
+    def frames(self) -> List[Tuple[float, int, bytes]]:
+        """Recorded frames, oldest first, as (seconds since the tracer
+        creation, direction, data)."""
+        result = []
+        for start, length, timestamp, direction in self.frames_info:
+            position = start % self.capacity
+            data = bytes(self.buffer[position:position + length])
+            if len(data) < length:
+                data += bytes(self.buffer[:length - len(data)])
+            result.append((timestamp - self.start_time, direction, data))
+        return result
+
+    def dump(self, file: Optional[TextIO] = None):
+        """Write the recorded frames, to stderr by default."""
+        file = file or sys.stderr
+        if self.dropped:
+            print(f'[{self.dropped} older frames dropped]', file=file)
+        for timestamp, direction, data in self.frames():
+            print(f'{timestamp:12.6f} {DIRECTIONS[direction]} {data.decode(errors="replace").rstrip()}', file=file)
+
+    def clear(self):
+        self.frames_info.clear()
+        self.dropped = 0
@@ -5,30 +5,95 @@ Communicating with the Lean server in a trio context
 This is only the beginning, implementing reading a file and requesting tactic
 state. See the example use in examples/trio_example.py.
 """
-from typing import Optional, List, Dict, Union
+from typing import Optional, List, Dict, Tuple, Union, Callable, AsyncIterator, TYPE_CHECKING
+from contextlib import asynccontextmanager
+from enum import Enum
 from subprocess import PIPE
+import copy
+import json
+import time
 
 import trio # type: ignore
 
 from lean_client.commands import (SyncRequest, InfoRequest,
-                                  Request, CommandResponse, Message, Task,
+                                  Request, Response, CommandResponse, Message, Task,
                                   InfoResponse, AllMessagesResponse, CurrentTasksResponse, ErrorResponse,
                                   OkResponse, SyncResponse)
+from lean_client.diagnostics import MessageIndex
+
+if TYPE_CHECKING:
+    # only needed by users passing a retention policy or a tracer
+    from lean_client.retention import MessageRetention
+    from lean_client.tracing import FrameTracer
+    from lean_client.timeline import Timeline
+
+# Most urgent first. Requests wait while requests of a more urgent class are
+# in flight, and at most background_in_flight background requests are in flight.
+Priority = Enum('Priority', 'interactive normal background')
+
+
+class SharedResponse:
+    def __init__(self):
+        """Response to a read only request, awaited by every task which
+        sent the same request while it was in flight."""
+        self.done = trio.Event()
+        self.response: Union[OkResponse, ErrorResponse, None] = None
 
 
 class TrioLeanServer:
-    def __init__(self, nursery, lean_cmd: Union[str, List[str]] = 'lean', debug=False, debug_bytes=False):
+    def __init__(self, nursery, lean_cmd: Union[str, List[str]] = 'lean', debug=False, debug_bytes=False,
+                 flush_delay: float = 0., retention: Optional['MessageRetention'] = None,
+                 background_in_flight: int = 2, tracer: Optional['FrameTracer'] = None,
+                 timeline: Optional['Timeline'] = None):
         """
         Lean server trio interface.
+
+        Requests sent together are written to Lean in a single write. The
+        first sender of a burst waits flush_delay seconds (or only lets other
+        tasks run if it is zero) before flushing everything queued so far.
+
+        If a retention policy is given, it decides which messages are kept in
+        self.messages, see lean_client.retention.
+
+        Lean answers requests in the order it gets them, so requests sent
+        with Priority.background are held back while more urgent ones are in
+        flight, and only background_in_flight of them are handed to Lean at
+        a time. An interactive request then waits for at most that many
+        background requests.
+
+        A tracer (see lean_client.tracing) keeps the last frames exchanged
+        with Lean and dumps them when Lean sends an error or garbage. Unlike
+        debug and debug_bytes, it doesn't format anything while recording.
+
+        A timeline records requests, syncs and Lean tasks for viewing in a
+        trace viewer, see lean_client.timeline.
         """
         self.nursery = nursery
         self.seq_num: int = 0
         self.lean_cmd: List[str] = lean_cmd if isinstance(lean_cmd, List) else [lean_cmd]
         self.messages: List[Message] = []
+        self.retention: Optional['MessageRetention'] = retention
+        # Messages of the last all_messages response, reused when unchanged
+        # (see AllMessagesResponse). A retention policy reuses its own
+        # versions instead, so that full texts are not kept here.
+        self.previous_msgs: Optional[Dict[tuple, Message]] = None if retention else dict()
+        # the same messages, indexed by file, line range and severity
+        self.message_index = MessageIndex()
         self.current_tasks: List[Task] = []
+        # Functions called with each response, in the order Lean sent them,
+        # after the server state has been updated
+        self.response_callbacks: List[Callable[[Response], None]] = []
         self.process: Optional[trio.Process] = None
         self.debug: bool = debug
         self.debug_bytes: bool = debug_bytes
+        # records the last frames, dumped when Lean fails
+        self.tracer: Optional['FrameTracer'] = tracer
+        self.timeline: Optional['Timeline'] = timeline
+        self.flush_delay: float = flush_delay
+        # Serialized requests waiting to be written, and whether some task
+        # is already in charge of writing them
+        self.write_buffer: List[str] = []
+        self.is_flushing: bool = False
         # Each request, with sequence number seq_num, gets an event
         # self.response_events[seq_num] that it set when the response comes in
         self.response_events: Dict[int, trio.Event] = dict()
@@ -36,36 +101,115 @@ class TrioLeanServer:
         # handled
         self.responses: Dict[int, Union[ErrorResponse, OkResponse]] = dict()
         self.is_fully_ready: trio.Event = trio.Event()
+        # Number of requests of each priority sent and not yet answered, and
+        # an event replaced each time one of them is answered
+        self.in_flight: Dict[Priority, int] = {priority: 0 for priority in Priority}
+        self.request_done: trio.Event = trio.Event()
+        self.background_slots = trio.Semaphore(background_in_flight)
+        # Number of syncs sent for each file, and read only requests in flight
+        # by file version and content
+        self.file_versions: Dict[str, int] = dict()
+        self.shared_responses: Dict[Tuple[int, str], SharedResponse] = dict()
+        # Latest content synced for each file (None for the content on disk),
+        # synced again by restart
+        self.synced_files: Dict[str, Optional[str]] = dict()
+        # Number of requests sent to the current Lean process
+        self.requests_sent: int = 0
+        # Unset while restart replaces the Lean process
+        self.accepting: trio.Event = trio.Event()
+        self.accepting.set()
 
     async def start(self):
         self.process = await trio.open_process(
                 self.lean_cmd + ["--server"], stdin=PIPE, stdout=PIPE)
         self.nursery.start_soon(self.receiver)
 
-    async def send(self, request: Request) -> Optional[CommandResponse]:
-        if not self.process:
-            raise ValueError('No Lean server')
-        self.seq_num += 1
-        request.seq_num = self.seq_num
+    async def restart(self):
+        """Replace the Lean process by a new one, for instance to give back
+        the memory Lean accumulates over long sessions. New requests wait
+        while requests in flight are answered, the new process gets all
+        synced files and the restart is over once they are compiled."""
+        self.accepting = trio.Event()
+        try:
+            while any(self.in_flight.values()):
+                await self.request_done.wait()
+            self.process.kill()
+            await self.process.wait()
+            self.requests_sent = 0
+            await self.start()
+            invalidated = False
+            for file_name, content in list(self.synced_files.items()):
+                response = await self.send_raw_now(SyncRequest(file_name, content), Priority.normal,
+                                                   gated=False)
+                if isinstance(response, ErrorResponse):
+                    del self.synced_files[file_name]
+                elif response.data.get('message') == 'file invalidated':
+                    invalidated = True
+            if invalidated:
+                await self.is_fully_ready.wait()
+        finally:
+            self.accepting.set()
+
+    async def write(self, line: str):
+        """Queue a line for Lean's stdin. The first task queuing a line
+        becomes the flusher and writes everything queued in the meantime in
+        a single send_all, the others return right away."""
+        self.write_buffer.append(line)
+        if self.is_flushing:
+            return
+        self.is_flushing = True
+        try:
+            # Other tasks rely on us to write their requests, so we shouldn't
+            # be cancelled halfway.
+            with trio.CancelScope(shield=True):
+                await trio.sleep(self.flush_delay)
+                while self.write_buffer:
+                    data = ''.join(self.write_buffer).encode()
+                    self.write_buffer = []
+                    if self.debug_bytes:
+                        print(f'Sending {data!r}')
+                    if self.tracer is not None:
+                        self.tracer.sent(data)
+                    # lines are only queued by send_raw, once started
+                    assert self.process is not None
+                    await self.process.stdin.send_all(data)
+        finally:
+            self.is_flushing = False
 
-        if self.debug:
-            print(f'Sending {request}')
-        if self.debug_bytes:
-            bytes = (request.to_json() + '\n').encode()
-            print(f'Sending {bytes!r}')
+    @asynccontextmanager
+    async def turn(self, priority: Priority, gated: bool = True) -> AsyncIterator[None]:
+        """Wait until a request of the given priority may go to Lean, and
+        count it as in flight until the end of the block. Unless gated is
+        False (for the requests of restart itself), this also waits while
+        restart replaces the Lean process."""
+        if priority is Priority.background:
+            await self.background_slots.acquire()
+        try:
+            while True:
+                if gated and not self.accepting.is_set():
+                    await self.accepting.wait()
+                elif any(self.in_flight[other] for other in Priority if other.value < priority.value):
+                    await self.request_done.wait()
+                else:
+                    break
+            self.in_flight[priority] += 1
+            try:
+                yield
+            finally:
+                self.in_flight[priority] -= 1
+                self.request_done.set()
+                self.request_done = trio.Event()
+        finally:
+            if priority is Priority.background:
+                self.background_slots.release()
 
-        await self.process.stdin.send_all((request.to_json()+'\n').encode())
+    async def send(self, request: Request, priority: Priority = Priority.normal) -> Optional[CommandResponse]:
+        response = await self.send_raw(request, priority)
 
         # Some responses like sleep and long_sleep don't get responses
-        if not request.expect_response:
+        if response is None:
             return None
 
-        self.response_events[self.seq_num] = trio.Event()
-        await self.response_events[request.seq_num].wait()
-        self.response_events.pop(request.seq_num)
-
-        response = self.responses.pop(request.seq_num)
-
         # Lean errors are rare and signify problems with the command itself
         # (e.g. an incorrect file).  They should be raised as Python errors.
 
@@ -73,10 +217,105 @@ class TrioLeanServer:
             cmd_response = response.to_command_response(request.command)
         else:
             assert isinstance(response, ErrorResponse)
+            if self.tracer is not None:
+                self.tracer.dump()
             raise ChildProcessError(f'Lean server error while executing "{request.command}":\n{response}')
 
         return cmd_response
 
+    async def send_raw(self, request: Request,
+                       priority: Priority = Priority.normal) -> Union[OkResponse, ErrorResponse, None]:
+        """Send a request and return Lean's response before its conversion
+        to a CommandResponse.
+
+        A read only request identical to one in flight about the same version
+        of its file (no sync in between) is not sent again: it gets the
+        response of the request in flight. Requests still waiting for their
+        turn are not shared, so that an interactive request never waits
+        behind an identical background request."""
+        if not self.process:
+            raise ValueError('No Lean server')
+        if not self.accepting.is_set():
+            await self.accepting.wait()
+        if request.command == SyncRequest.command and hasattr(request, 'file_name'):
+            # also forwarded syncs, see lean_client.worker.RawRequest
+            file_name = request.file_name  # type: ignore
+            self.file_versions[file_name] = self.file_versions.get(file_name, 0) + 1
+            self.synced_files[file_name] = getattr(request, 'content', None)
+        elif request.read_only:
+            key = self.sharing_key(request)
+            if key in self.shared_responses:
+                shared = self.shared_responses[key]
+                await shared.done.wait()
+                if shared.response is not None:
+                    # send converts the data of responses in place
+                    return copy.deepcopy(shared.response)
+                # the first sender was cancelled, we have to ask ourselves
+                return await self.send_raw(request, priority)
+            shared = SharedResponse()
+
+            def share():
+                # An identical request may have got its turn first
+                self.shared_responses.setdefault(key, shared)
+            try:
+                shared.response = await self.send_raw_now(request, priority, on_turn=share)
+                return copy.deepcopy(shared.response)
+            finally:
+                if self.shared_responses.get(key) is shared:
+                    del self.shared_responses[key]
+                shared.done.set()
+        return await self.send_raw_now(request, priority)
+
+    def sharing_key(self, request: Request) -> Tuple[int, str]:
+        dic = request.__dict__.copy()
+        dic.pop('seq_num', None)
+        dic['command'] = request.command
+        return self.file_versions.get(dic.get('file_name', ''), 0), json.dumps(dic, sort_keys=True)
+
+    async def send_raw_now(self, request: Request, priority: Priority, gated: bool = True,
+                           on_turn: Optional[Callable[[], None]] = None) -> Union[OkResponse, ErrorResponse, None]:
+        """Send a request once its turn comes (see turn), calling on_turn
+        then."""
+        enqueued = time.perf_counter()
+        async with self.turn(priority, gated):
+            if on_turn is not None:
+                on_turn()
+            self.seq_num += 1
+            self.requests_sent += 1
+            request.seq_num = self.seq_num
+            if self.timeline is not None:
+                self.timeline.request_enqueued(request.seq_num, request.command,
+                                               getattr(request, 'file_name', None), enqueued)
+
+            if self.debug:
+                print(f'Sending {request}')
+
+            # The event must exist before the request is written since the
+            # response may come in before this task is scheduled again.
+            if request.expect_response:
+                self.response_events[request.seq_num] = trio.Event()
+
+            await self.write(request.to_json() + '\n')
+            if self.timeline is not None:
+                self.timeline.request_written(request.seq_num)
+
+            if not request.expect_response:
+                if self.timeline is not None:
+                    self.timeline.request_done(request.seq_num)
+                return None
+
+            try:
+                await self.response_events[request.seq_num].wait()
+            except trio.Cancelled:
+                # The receiver will drop the response, and won't close the span.
+                if self.timeline is not None:
+                    self.timeline.request_done(request.seq_num, cancelled=True)
+                raise
+            finally:
+                self.response_events.pop(request.seq_num)
+
+            return self.responses.pop(request.seq_num)
+
     async def receiver(self):
         """This task waits for Lean responses, updating the server state
         (tasks and messages) and triggering events when a response comes."""
@@ -90,33 +329,63 @@ class TrioLeanServer:
             for line in lines:
                 if self.debug_bytes:
                     print(f'Received {line}')
-                resp = CommandResponse.parse_response(line.decode())
+                if self.tracer is not None:
+                    self.tracer.received(line)
+                if self.timeline is not None:
+                    received = time.perf_counter()
+                try:
+                    resp = CommandResponse.parse_response(line.decode(), self.previous_msgs)
+                except Exception:
+                    if self.tracer is not None:
+                        self.tracer.dump()
+                    raise
                 if self.debug:
                     print(f'Received {resp}')
 
+                if self.timeline is not None:
+                    if isinstance(resp, CurrentTasksResponse):
+                        self.timeline.tasks(resp.tasks)
+                    elif isinstance(resp, (ErrorResponse, OkResponse)):
+                        self.timeline.request_replied(resp.seq_num, received)
+
                 if isinstance(resp, CurrentTasksResponse):
                     self.current_tasks = resp.tasks
                     if not resp.is_running:
                         self.is_fully_ready.set()
                 elif isinstance(resp, AllMessagesResponse):
-                    self.messages = resp.msgs
+                    self.messages = self.retention.retain(resp.msgs) if self.retention else resp.msgs
+                    self.message_index.update(self.messages)
                 elif isinstance(resp, (ErrorResponse, OkResponse)):
-                    self.responses[resp.seq_num] = resp
-                    self.response_events[resp.seq_num].set()
+                    if (isinstance(resp, OkResponse) and resp.data.get('message') == 'file invalidated'
+                            and self.is_fully_ready.is_set()):
+                        # Reset here rather than in full_sync: the following
+                        # current_tasks response may be in the same chunk.
+                        # An unset event is kept since concurrent full_syncs
+                        # may be waiting for it.
+                        self.is_fully_ready = trio.Event()
+                    if resp.seq_num in self.response_events:
+                        self.responses[resp.seq_num] = resp
+                        self.response_events[resp.seq_num].set()
+
+                for callback in self.response_callbacks:
+                    callback(resp)
 
     async def full_sync(self, filename, content=None) -> None:
         """Fully compile a Lean file before returning."""
+        start = time.perf_counter()
         # Waiting for the response is not enough, so we prepare another event
         response = await self.send(SyncRequest(filename, content))
         assert isinstance(response, SyncResponse)
 
         if response.message == "file invalidated":
-            self.is_fully_ready = trio.Event()
+            # the receiver replaced is_fully_ready when this response came in
             await self.is_fully_ready.wait()
+        if self.timeline is not None:
+            self.timeline.full_sync(filename, start, time.perf_counter())
 
-    async def state(self, filename, line, col) -> str:
+    async def state(self, filename, line, col, priority: Priority = Priority.normal) -> str:
         """Tactic state"""
-        resp = await self.send(InfoRequest(filename, line, col))
+        resp = await self.send(InfoRequest(filename, line, col), priority)
         if isinstance(resp, InfoResponse) and resp.record:
             return resp.record.state or ''
         else:
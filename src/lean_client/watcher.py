@@ -0,0 +1,262 @@
+"""
+Keeping a Lean server in sync with files changed on disk.
+
+A FileWatcher watches the .lean files under a directory and sends a sync
+request without content for each changed file, so that Lean reads the new
+version itself. Changes in quick succession, like those of a git checkout,
+are merged into a single batch, whose requests are written to Lean at once:
+
+    async with trio.open_nursery() as nursery:
+        server = TrioLeanServer(nursery)
+        await server.start()
+        await server.full_sync('src/foo.lean')
+        nursery.start_soon(FileWatcher(server, 'src').run)
+
+By default only the files the server has synced from disk are synced again:
+files synced with some content belong to an editor buffer, and syncing all
+files of a project would compile all of them.
+
+On Linux, changes are reported by inotify (through ctypes, without any
+dependency). Elsewhere, or if inotify is unavailable, the directory is
+scanned every poll_interval seconds.
+"""
+from typing import Optional, List, Dict, Set, Tuple, Union, Callable, TYPE_CHECKING
+from pathlib import Path
+import ctypes
+import ctypes.util
+import errno
+import os
+import struct
+import sys
+
+import trio  # type: ignore
+
+from lean_client.commands import SyncRequest
+
+if TYPE_CHECKING:
+    from lean_client.trio_server import TrioLeanServer
+
+# From sys/inotify.h
+IN_CLOSE_WRITE = 0x8
+IN_MOVED_FROM = 0x40
+IN_MOVED_TO = 0x80
+IN_CREATE = 0x100
+IN_DELETE = 0x200
+IN_DELETE_SELF = 0x400
+IN_Q_OVERFLOW = 0x4000
+IN_IGNORED = 0x8000
+IN_ISDIR = 0x40000000
+IN_NONBLOCK = os.O_NONBLOCK
+IN_CLOEXEC = getattr(os, 'O_CLOEXEC', 0)
+WATCH_MASK = IN_CLOSE_WRITE | IN_MOVED_FROM | IN_MOVED_TO | IN_CREATE | IN_DELETE | IN_DELETE_SELF
+EVENT = struct.Struct('iIII')
+
+
+def lean_files(root: Path) -> Set[Path]:
+    return set(root.rglob('*.lean'))
+
+
+def load_libc():
+    """The C library, if it has inotify."""
+    if not sys.platform.startswith('linux'):
+        return None
+    try:
+        libc = ctypes.CDLL(ctypes.util.find_library('c'), use_errno=True)
+    except OSError:
+        return None
+    return libc if hasattr(libc, 'inotify_init1') else None
+
+
+class InotifyWatcher:
+    def __init__(self, root: Path, libc):
+        """Changes under root reported by inotify. Raises OSError if
+        inotify can't be used, for instance if there are too many watches."""
+        self.root = root
+        self.libc = libc
+        self.fd = libc.inotify_init1(IN_NONBLOCK | IN_CLOEXEC)
+        if self.fd < 0:
+            raise OSError(ctypes.get_errno(), 'inotify_init1 failed')
+        # Watched directories by watch descriptor
+        self.directories: Dict[int, Path] = dict()
+        try:
+            self.watch_tree(root)
+        except OSError:
+            self.close()
+            raise
+
+    def watch_tree(self, directory: Path) -> Set[Path]:
+        """Watch directory and its subdirectories, and return the .lean
+        files already in them."""
+        found: Set[Path] = set()
+        for path, _, files in os.walk(directory):
+            wd = self.libc.inotify_add_watch(self.fd, os.fsencode(path), WATCH_MASK)
+            if wd < 0:
+                error = ctypes.get_errno()
+                if error == errno.ENOENT:
+                    # removed in the meantime
+                    continue
+                raise OSError(error, f'Cannot watch {path}')
+            self.directories[wd] = Path(path)
+            found.update(Path(path, name) for name in files if name.endswith('.lean'))
+        return found
+
+    def read_events(self, data: bytes) -> Set[Path]:
+        changed: Set[Path] = set()
+        offset = 0
+        while offset < len(data):
+            wd, mask, _, length = EVENT.unpack_from(data, offset)
+            name = data[offset + EVENT.size:offset + EVENT.size + length].rstrip(b'\0')
+            offset += EVENT.size + length
+            if mask & IN_Q_OVERFLOW:
+                # Events were lost, everything may have changed
+                changed.update(lean_files(self.root))
+                continue
+            directory = self.directories.get(wd)
+            if directory is None:
+                continue
+            if mask & IN_IGNORED:
+                del self.directories[wd]
+                continue
+            path = directory / os.fsdecode(name)
+            if mask & IN_ISDIR:
+                if mask & (IN_CREATE | IN_MOVED_TO):
+                    changed.update(self.watch_tree(path))
+            elif path.suffix == '.lean':
+                changed.add(path)
+        return changed
+
+    async def wait(self) -> Set[Path]:
+        """Paths of the .lean files changed (or removed) since the last call."""
+        while True:
+            await trio.lowlevel.wait_readable(self.fd)
+            try:
+                data = os.read(self.fd, 64 * 1024)
+            except BlockingIOError:
+                continue
+            changed = self.read_events(data)
+            if changed:
+                return changed
+
+    def close(self):
+        if self.fd >= 0:
+            os.close(self.fd)
+            self.fd = -1
+
+
+class PollingWatcher:
+    def __init__(self, root: Path, interval: float = 1.):
+        """Changes under root found by comparing modification times and
+        sizes every interval seconds."""
+        self.root = root
+        self.interval = interval
+        self.snapshot = self.scan()
+
+    def scan(self) -> Dict[Path, Tuple[int, int]]:
+        snapshot = dict()
+        for path in lean_files(self.root):
+            try:
+                stat = path.stat()
+            except FileNotFoundError:
+                continue
+            snapshot[path] = (stat.st_mtime_ns, stat.st_size)
+        return snapshot
+
+    async def wait(self) -> Set[Path]:
+        """Paths of the .lean files changed (or removed) since the last call."""
+        while True:
+            await trio.sleep(self.interval)
+            snapshot = self.scan()
+            changed = {path for path in snapshot.keys() | self.snapshot.keys()
+                       if snapshot.get(path) != self.snapshot.get(path)}
+            self.snapshot = snapshot
+            if changed:
+                return changed
+
+    def close(self):
+        pass
+
+
+class FileWatcher:
+    def __init__(self, server: 'TrioLeanServer', root: Union[str, Path], batch_delay: float = 0.1,
+                 max_delay: float = 2., only_synced: bool = True, polling: Optional[bool] = None,
+                 poll_interval: float = 1.):
+        """Syncs the .lean files changed under root on a started server, see
+        the module docstring. A batch is sent once no file changed during
+        batch_delay seconds, or max_delay seconds after its first change.
+        With only_synced=False, all changed files are synced. polling forces
+        (True) or prevents (False) the use of the polling watcher."""
+        self.server = server
+        self.root = Path(root).resolve()
+        self.batch_delay = batch_delay
+        self.max_delay = max_delay
+        self.only_synced = only_synced
+        self.polling = polling
+        self.poll_interval = poll_interval
+        self.backend: Union[InotifyWatcher, PollingWatcher, None] = None
+        # Functions called with the file names of each batch, once synced
+        self.batch_callbacks: List[Callable[[List[str]], None]] = []
+
+    def start(self):
+        """Start watching, done by run if needed. Changes before this are
+        not reported."""
+        libc = None if self.polling else load_libc()
+        if libc is None and self.polling is False:
+            raise OSError('inotify is not available')
+        if libc is not None:
+            try:
+                self.backend = InotifyWatcher(self.root, libc)
+                return
+            except OSError:
+                if self.polling is False:
+                    raise
+        self.backend = PollingWatcher(self.root, self.poll_interval)
+
+    async def next_batch(self) -> Set[Path]:
+        """Changed paths, merging changes until the batch is complete."""
+        backend = self.backend
+        if backend is None:
+            raise RuntimeError('The watcher is not started')
+        changed = await backend.wait()
+        deadline = trio.current_time() + self.max_delay
+        while True:
+            with trio.move_on_at(min(trio.current_time() + self.batch_delay, deadline)) as scope:
+                changed |= await backend.wait()
+            if scope.cancelled_caught:
+                return changed
+
+    def file_names(self, paths: Set[Path]) -> List[str]:
+        """Names to sync for the changed paths: the names the server knows
+        them by, skipping removed files."""
+        synced = {Path(name).resolve(): name for name, content in self.server.synced_files.items()
+                  if content is None}
+        names = []
+        for path in sorted(paths):
+            if not path.is_file():
+                continue
+            if path in synced:
+                names.append(synced[path])
+            elif not self.only_synced:
+                names.append(str(path))
+        return names
+
+    async def sync(self, file_names: List[str]):
+        """Send all syncs at once, they are written to Lean together. Lean
+        errors, for instance about a file removed in the meantime, are
+        ignored."""
+        async with trio.open_nursery() as nursery:
+            for file_name in file_names:
+                nursery.start_soon(self.server.send_raw, SyncRequest(file_name))
+
+    async def run(self):
+        if self.backend is None:
+            self.start()
+        try:
+            while True:
+                file_names = self.file_names(await self.next_batch())
+                if file_names:
+                    await self.sync(file_names)
+                    for callback in self.batch_callbacks:
+                        callback(file_names)
+        finally:
+            if self.backend is not None:
+                self.backend.close()
@@ -0,0 +1,163 @@
+"""
+Serving a Lean server over a socket.
+
+A LeanWorker listens on a TCP or Unix socket and speaks the same line
+delimited JSON protocol as `lean --server`, so a client can talk to a worker
+on another machine as if it were a local Lean process (see
+lean_client.sharding for such a client). Several clients may connect to the
+same worker: requests are forwarded to its TrioLeanServer with their own
+sequence numbers, and all_messages and current_tasks responses are sent to
+every client.
+
+    python -m lean_client.worker --port 9000 --lean-cmd lean
+"""
+from typing import Optional, Dict, Set, Any
+import argparse
+import json
+import math
+
+import trio  # type: ignore
+
+from lean_client.commands import Request, Response, OkResponse, ErrorResponse, dataclass_to_dict
+from lean_client.trio_server import TrioLeanServer
+
+EXPECT_RESPONSE: Dict[str, bool] = {cls.command: cls.expect_response  # type: ignore
+                                    for cls in Request.__subclasses__()}
+
+
+class RawRequest(Request):
+    def __init__(self, dic: Dict[str, Any], channel: trio.MemorySendChannel,
+                 pending: Dict[int, 'RawRequest']):
+        """A request received as JSON, forwarded as is apart from its seq_num.
+        Its response goes to channel."""
+        self.dic = dic
+        self.command = dic.get('command', '')  # type: ignore
+        self.expect_response = EXPECT_RESPONSE.get(self.command, True)  # type: ignore
+        self.seq_num = 0
+        self.client_seq_num: Optional[int] = dic.get('seq_num')
+        # Read by the server to track synced files, see TrioLeanServer.restart
+        if 'file_name' in dic:
+            self.file_name = dic['file_name']
+        if self.command == 'sync':
+            self.content = dic.get('content')
+        self.channel = channel
+        self.pending = pending
+
+    def to_json(self) -> str:
+        # Called once the server has given its seq_num, right before writing.
+        if self.expect_response:
+            self.pending[self.seq_num] = self
+        dic = self.dic.copy()
+        dic['seq_num'] = self.seq_num
+        return json.dumps(dic)
+
+
+class LeanWorker:
+    def __init__(self, server: TrioLeanServer):
+        """Socket front end to a started TrioLeanServer."""
+        self.server = server
+        # outgoing lines of each connected client
+        self.connections: Set[trio.MemorySendChannel] = set()
+        # forwarded requests waiting for their response, by server seq_num
+        self.pending: Dict[int, RawRequest] = dict()
+        server.response_callbacks.append(self.dispatch)
+
+    def dispatch(self, resp: Response):
+        """Queue a response for the clients concerned. This runs in the
+        receiver of the server, so that clients get responses in the order
+        Lean sent them: an ok response to a sync must come before the
+        current_tasks response saying the file is compiled."""
+        if isinstance(resp, (OkResponse, ErrorResponse)):
+            # Lean errors about unparsable requests have no sequence number
+            request = self.pending.pop(resp.seq_num, None) if resp.seq_num is not None else None
+            if request is None:
+                return
+            if isinstance(resp, OkResponse):
+                answer = resp.data.copy()
+                answer['response'] = 'ok'
+            else:
+                answer = dataclass_to_dict(resp)
+                answer['response'] = 'error'
+            answer['seq_num'] = request.client_seq_num
+            if request.channel in self.connections:
+                request.channel.send_nowait(json.dumps(answer))
+        elif self.connections:
+            dic = dataclass_to_dict(resp)
+            dic['response'] = resp.response
+            line = json.dumps(dic)
+            for channel in self.connections:
+                channel.send_nowait(line)
+
+    async def serve_tcp(self, port: int, host: str = '127.0.0.1', *, task_status=trio.TASK_STATUS_IGNORED):
+        await trio.serve_tcp(self.handle_connection, port, host=host, task_status=task_status)
+
+    async def serve_unix(self, path: str, *, task_status=trio.TASK_STATUS_IGNORED):
+        sock = trio.socket.socket(trio.socket.AF_UNIX, trio.socket.SOCK_STREAM)
+        await sock.bind(path)
+        sock.listen()
+        await trio.serve_listeners(self.handle_connection, [trio.SocketListener(sock)],
+                                   task_status=task_status)
+
+    async def handle_connection(self, stream: trio.abc.Stream):
+        send_channel, receive_channel = trio.open_memory_channel(math.inf)
+        self.connections.add(send_channel)
+        try:
+            async with trio.open_nursery() as nursery:
+                nursery.start_soon(self.write_lines, stream, receive_channel)
+                unfinished_line = b''
+                async for data in stream:
+                    lines = (unfinished_line + data).split(b'\n')
+                    unfinished_line = lines.pop()
+                    for line in lines:
+                        if line.strip():
+                            nursery.start_soon(self.forward, line, send_channel)
+                # The client is gone, nobody will read the answers.
+                nursery.cancel_scope.cancel()
+        except trio.BrokenResourceError:
+            pass
+        finally:
+            self.connections.discard(send_channel)
+            await stream.aclose()
+
+    @staticmethod
+    async def write_lines(stream: trio.abc.Stream, channel: trio.MemoryReceiveChannel):
+        """Write outgoing lines, everything available at once."""
+        async for line in channel:
+            lines = [line]
+            while True:
+                try:
+                    lines.append(channel.receive_nowait())
+                except trio.WouldBlock:
+                    break
+            await stream.send_all(('\n'.join(lines) + '\n').encode())
+
+    async def forward(self, line: bytes, channel: trio.MemorySendChannel):
+        try:
+            dic = json.loads(line.decode())
+        except ValueError as error:
+            channel.send_nowait(json.dumps({'response': 'error', 'message': f'Invalid JSON: {error}'}))
+            return
+        # dispatch sends the response to the client
+        await self.server.send_raw(RawRequest(dic, channel, self.pending))
+
+
+async def main(args):
+    async with trio.open_nursery() as nursery:
+        server = TrioLeanServer(nursery, args.lean_cmd.split())
+        await server.start()
+        worker = LeanWorker(server)
+        if args.unix:
+            print(f'Serving Lean on {args.unix}')
+            await worker.serve_unix(args.unix)
+        else:
+            print(f'Serving Lean on {args.host}:{args.port}')
+            await worker.serve_tcp(args.port, args.host)
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Serve a Lean server over a socket.')
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=9000)
+    parser.add_argument('--unix', help='path of a Unix socket to listen on instead of TCP')
+    parser.add_argument('--lean-cmd', default='lean', help='command running Lean')
+    trio.run(main, parser.parse_args())
@@ -0,0 +1,34 @@
+"""
+Helpers for the tests running a real (fake) Lean process, see
+lean_client.fake_server.
+"""
+from typing import List
+import json
+import sys
+
+
+def fake_lean(*options: str) -> List[str]:
+    """Command running the fake Lean server with the given options."""
+    return [sys.executable, '-m', 'lean_client.fake_server', *options]
+
+
+class RecordingStream:
+    """Wraps a send stream, recording each write. Tests replace the stdin of
+    a server process with it to see what reaches Lean."""
+    def __init__(self, stream):
+        self.stream = stream
+        self.writes: List[bytes] = []
+
+    async def send_all(self, data):
+        self.writes.append(data)
+        await self.stream.send_all(data)
+
+    @property
+    def lines(self) -> List[str]:
+        """Requests written, as JSON lines."""
+        return [line for data in self.writes for line in data.decode().splitlines()]
+
+    @property
+    def commands(self) -> List[str]:
+        """Commands of the requests written."""
+        return [json.loads(line)['command'] for line in self.lines]
@@ -62,6 +62,21 @@ class TestAllMessagesResponse:
 
         assert resp.msgs[1].severity == cmds.Severity.warning
 
+    def test_unchanged_messages_are_reused(self):
+        first_json = '{"msgs":[{"caption":"","file_name":"test3.lean","pos_col":7,"pos_line":2,"severity":"error","text":"unknown identifier \'foo\'"}],"response":"all_messages"}'
+        second_json = '{"msgs":[{"caption":"","file_name":"test3.lean","pos_col":7,"pos_line":2,"severity":"error","text":"unknown identifier \'foo\'"},{"caption":"","file_name":"test3.lean","pos_col":0,"pos_line":5,"severity":"warning","text":"declaration \'bar\' uses sorry"}],"response":"all_messages"}'
+        previous_msgs = dict()
+        first = cmds.Response.parse_response(first_json, previous_msgs)
+        second = cmds.Response.parse_response(second_json, previous_msgs)
+
+        assert second.msgs[0] is first.msgs[0]
+        assert len(previous_msgs) == 2
+        # without the table of the server, nothing is shared
+        assert cmds.Response.parse_response(first_json).msgs[0] is not first.msgs[0]
+        assert second.msgs[1].pos_line == 5
+        # file names are interned
+        assert second.msgs[1].file_name is first.msgs[0].file_name
+
 
 class TestCurrentTasksResponse:
     def test_no_tasks(self):
@@ -94,6 +109,14 @@ class TestCurrentTasksResponse:
         assert resp.response == "current_tasks"
         assert resp.tasks == [cmds.Task(desc='parsing at line 1', end_pos_col=70, end_pos_line=1, file_name='test.lean', pos_col=0, pos_line=1)]
 
+    def test_current_task(self):
+        response_json = '{"cur_task":{"desc":"parsing at line 1","end_pos_col":70,"end_pos_line":1,"file_name":"test.lean","pos_col":0,"pos_line":1},"is_running":true,"response":"current_tasks","tasks":[{"desc":"parsing at line 1","end_pos_col":70,"end_pos_line":1,"file_name":"test.lean","pos_col":0,"pos_line":1}]}'
+        resp = cmds.Response.parse_response(response_json)
+
+        assert isinstance(resp, cmds.CurrentTasksResponse)
+        assert resp.cur_task == resp.tasks[0]
+        assert resp.cur_task.desc is resp.tasks[0].desc
+
 
 class TestErrorResponse:
     def test_missing_file_error(self):
@@ -0,0 +1,139 @@
+"""
+Tests for the local declaration index.
+"""
+from concurrent.futures import ThreadPoolExecutor
+
+import trio  # type: ignore
+
+from lean_client.commands import InfoRequest, OkResponse, SearchItem, SearchRequest, SearchResponse, Source
+from lean_client.declarations import DeclarationIndex, match_score
+from lean_client.sync_server import SyncLeanServer
+from lean_client.trio_server import TrioLeanServer
+from test.fake_lean import fake_lean
+
+FAKE_LEAN = fake_lean()
+
+NAMES = ['nat.add_comm', 'nat.add_assoc', 'nat.mul_comm', 'int.add_comm', 'add_comm', 'nat.succ_ne_zero',
+         'list.append_assoc']
+
+
+def example_index():
+    return DeclarationIndex(SearchItem(name, 'Prop') for name in NAMES)
+
+
+def test_prefix():
+    index = example_index()
+    assert [item.text for item in index.prefix('nat.')] == ['nat.add_assoc', 'nat.add_comm', 'nat.mul_comm',
+                                                            'nat.succ_ne_zero']
+    assert [item.text for item in index.prefix('nat.', limit=1)] == ['nat.add_assoc']
+    assert index.prefix('real.') == []
+    index.add(SearchItem('nat.zero_add', 'Prop'))
+    assert index.prefix('nat.')[-1].text == 'nat.zero_add'
+
+
+def test_search():
+    index = example_index()
+    names = [item.text for item in index.search('add_comm')]
+    assert names[0] == 'add_comm'
+    assert set(names) == {'add_comm', 'int.add_comm', 'nat.add_comm'}
+    assert [item.text for item in index.search('nsnz')] == ['nat.succ_ne_zero']
+    assert index.search('ADD_COMM', limit=1)[0].text == 'add_comm'
+    assert index.search('xyz') == []
+    assert match_score('ac', 'add_comm') > match_score('ac', 'nat.mul_comm')
+
+
+def test_updates_keep_known_fields():
+    index = example_index()
+    index.add(SearchItem('add_comm', 'Prop', Source(1, 0, 'core.lean'), 'Commutativity'))
+    index.add(SearchItem('add_comm', '∀ a b, a + b = b + a'))
+    item = index.get('add_comm')
+    assert (item.type_, item.doc, item.source.file) == ('∀ a b, a + b = b + a', 'Commutativity', 'core.lean')
+    assert len(index) == len(NAMES)
+
+
+def test_raw_responses():
+    index = DeclarationIndex()
+    data = {'results': [{'text': 'foo', 'type': 'Prop', 'source': {'file': 'a.lean', 'line': 3}}]}
+    index.update(OkResponse(seq_num=1, data=data))
+    assert index.get('foo').source == Source(3, None, 'a.lean')
+    # the raw response is left for its sender to convert
+    assert data['results'][0]['type'] == 'Prop'
+    index.update(OkResponse(seq_num=1, data={'record': {'full-id': 'bar', 'type': 'ℕ', 'doc': 'Bar'}}))
+    index.update(OkResponse(seq_num=1, data={'record': {'state': '⊢ true'}}))
+    assert [item.text for item in index.prefix('')] == ['bar', 'foo']
+    assert index.get('bar').doc == 'Bar'
+
+
+def test_save_and_load(tmp_path):
+    index = example_index()
+    index.add(SearchItem('foo', 'Prop', Source(3, 1, 'a.lean'), 'doc'))
+    index.save(tmp_path / 'decls.json')
+    loaded = DeclarationIndex.load(tmp_path / 'decls.json')
+    assert loaded.items == index.items
+    assert [item.text for item in loaded.search('add_comm', limit=1)] == ['add_comm']
+
+
+def test_fill_from_server():
+    async def main():
+        async with trio.open_nursery() as nursery:
+            server = TrioLeanServer(nursery, lean_cmd=FAKE_LEAN + ['--results', '3'])
+            await server.start()
+            index = DeclarationIndex()
+            index.watch(server)
+            response = await server.send(SearchRequest('foo'))
+            await server.full_sync('test.lean', content='--')
+            await server.send(InfoRequest('test.lean', 1, 0))
+            await index.scan(server, ['bar', 'baz'])
+            server.kill()
+            nursery.cancel_scope.cancel()
+        return index, response
+
+    index, response = trio.run(main)
+    # the sender still got a converted response
+    assert isinstance(response, SearchResponse)
+    assert response.results[0].type_ == 'Prop'
+    assert sorted(index.items) == ['bar_0', 'bar_1', 'bar_2', 'baz_0', 'baz_1', 'baz_2',
+                                   'foo_0', 'foo_1', 'foo_2']
+    assert index.get('foo_1').source.line == 2
+
+
+def test_items_are_copied():
+    index = DeclarationIndex()
+    item = SearchItem('foo', 'Prop')
+    index.add(item)
+    index.add(SearchItem('foo', 'Type'))
+    assert item.type_ == 'Prop'
+    assert index.get('foo').type_ == 'Type'
+
+
+def test_lookups_during_additions():
+    index = example_index()
+
+    def add(start):
+        for i in range(start, start + 2000):
+            index.add(SearchItem(f'nat.lemma_{i}', 'Prop'))
+
+    def look_up(_):
+        for _ in range(50):
+            index.search('nat.lemma')
+            index.prefix('nat.')
+
+    with ThreadPoolExecutor(4) as executor:
+        futures = [executor.submit(add, 0), executor.submit(add, 2000),
+                   executor.submit(look_up, None), executor.submit(look_up, None)]
+        for future in futures:
+            future.result()
+    assert len(index.prefix('nat.lemma_')) == 4000
+
+
+def test_watch_sync_server():
+    server = SyncLeanServer(FAKE_LEAN + ['--results', '50'])
+    index = DeclarationIndex()
+    index.watch(server)
+    server.start()
+    with ThreadPoolExecutor(8) as executor:
+        responses = list(executor.map(lambda i: server.send(SearchRequest(f'q{i}')), range(100)))
+    server.kill()
+    assert all(isinstance(response, SearchResponse) for response in responses)
+    assert len(index) == 5000
+    assert index.get('q7_3').type_ == 'Prop'
@@ -0,0 +1,72 @@
+"""
+Tests for the indexed view of Lean messages.
+"""
+import random
+
+from lean_client.commands import Message, Severity
+from lean_client.diagnostics import MessageIndex
+
+
+def make_message(file_name, line, end_line=None, severity=Severity.error, text='oops'):
+    return Message(file_name=file_name, severity=severity, caption='', text=text,
+                   pos_line=line, pos_col=0, end_pos_line=end_line, end_pos_col=None)
+
+
+def overlapping_naive(msgs, file_name, first, last, severity=None):
+    return sorted((msg for msg in msgs
+                   if msg.file_name == file_name
+                   and msg.pos_line <= last
+                   and (msg.end_pos_line or msg.pos_line) >= first
+                   and (severity is None or msg.severity == severity)),
+                  key=lambda msg: (msg.pos_line, msg.pos_col))
+
+
+def test_range_queries_match_naive_scan():
+    rng = random.Random(0)
+    msgs = []
+    for _ in range(2000):
+        line = rng.randint(1, 500)
+        end = line + rng.choice([0, 0, 1, 5, 50]) if rng.random() < .8 else None
+        msgs.append(make_message(rng.choice(['a.lean', 'b.lean']), line, end,
+                                 severity=rng.choice(list(Severity))))
+    index = MessageIndex()
+    index.update(msgs)
+
+    for _ in range(200):
+        first = rng.randint(0, 520)
+        last = first + rng.randint(0, 30)
+        for severity in [None, *Severity]:
+            for file_name in ['a.lean', 'b.lean']:
+                assert index.query(file_name, first, last, severity) == \
+                       overlapping_naive(msgs, file_name, first, last, severity)
+
+
+def test_open_ranges_and_counts():
+    msgs = [make_message('a.lean', 3), make_message('a.lean', 10, 20, Severity.warning),
+            make_message('a.lean', 30)]
+    index = MessageIndex()
+    index.update(msgs)
+
+    assert index.query('a.lean') == msgs
+    assert index.query('a.lean', first_line=15) == msgs[1:]
+    assert index.query('a.lean', last_line=12) == msgs[:2]
+    assert index.query('a.lean', severity=Severity.warning) == [msgs[1]]
+    assert index.query('unknown.lean') == []
+    assert index.count('a.lean') == 3
+    assert index.count('a.lean', Severity.error) == 2
+    assert index.count('a.lean', Severity.information) == 0
+
+
+def test_only_changed_files_are_reindexed():
+    index = MessageIndex()
+    assert index.update([make_message('a.lean', 1), make_message('b.lean', 1)]) == {'a.lean', 'b.lean'}
+    b_index = index.files['b.lean']
+
+    changed = index.update([make_message('a.lean', 2), make_message('b.lean', 1)])
+    assert changed == {'a.lean'}
+    assert index.files['b.lean'] is b_index
+    assert index.query('a.lean', 2, 2)[0].pos_line == 2
+
+    # files without messages anymore are dropped
+    assert index.update([make_message('a.lean', 2)]) == {'b.lean'}
+    assert index.query('b.lean') == []
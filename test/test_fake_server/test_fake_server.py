@@ -0,0 +1,94 @@
+"""
+Tests for the fake Lean server, both at the protocol level and through a real
+TrioLeanServer child process.
+"""
+import json
+import subprocess
+
+import trio  # type: ignore
+
+from lean_client.commands import InfoRequest, SearchRequest, SearchResponse
+from lean_client.trio_server import TrioLeanServer
+from test.fake_lean import fake_lean
+
+FAKE_LEAN = fake_lean()
+
+
+def run_fake_lean(requests, *options):
+    """Send requests to a fake Lean process, close its stdin and return all its responses."""
+    stdin = ''.join(json.dumps(req) + '\n' for req in requests)
+    out = subprocess.run(FAKE_LEAN + list(options) + ['--server'],
+                         input=stdin.encode(), stdout=subprocess.PIPE, check=True, timeout=10).stdout
+    return [json.loads(line) for line in out.decode().splitlines()]
+
+
+def test_sync_then_info():
+    responses = run_fake_lean([
+        {"command": "sync", "file_name": "test.lean", "content": "--", "seq_num": 1},
+        {"command": "info", "file_name": "test.lean", "line": 1, "column": 0, "seq_num": 2},
+    ], '--messages-per-file', '3')
+
+    oks = [resp for resp in responses if resp['response'] == 'ok']
+    assert oks[0] == {"response": "ok", "seq_num": 1, "message": "file invalidated"}
+    assert oks[1]['seq_num'] == 2
+    assert oks[1]['record']['state'].startswith('⊢')
+
+    all_messages = [resp for resp in responses if resp['response'] == 'all_messages']
+    assert len(all_messages[-1]['msgs']) == 3
+    tasks = [resp for resp in responses if resp['response'] == 'current_tasks']
+    assert tasks[-1] == {"response": "current_tasks", "is_running": False, "tasks": []}
+
+
+def test_unchanged_and_unknown_files():
+    responses = run_fake_lean([
+        {"command": "sync", "file_name": "test.lean", "content": "--", "seq_num": 1},
+        {"command": "sync", "file_name": "test.lean", "content": "--", "seq_num": 2},
+        {"command": "info", "file_name": "other.lean", "line": 1, "column": 0, "seq_num": 3},
+        {"command": "sleep", "seq_num": 4},
+    ])
+    by_seq_num = {resp['seq_num']: resp for resp in responses if 'seq_num' in resp}
+    assert by_seq_num[2]['message'] == 'file unchanged'
+    assert by_seq_num[3]['response'] == 'error'
+    assert 4 not in by_seq_num
+
+
+def test_payload_sizes_and_rates():
+    responses = run_fake_lean([
+        {"command": "sync", "file_name": "test.lean", "content": "--", "seq_num": 1},
+        {"command": "info", "file_name": "test.lean", "line": 1, "column": 0, "seq_num": 2},
+    ], '--elaboration-time', '0.2', '--tasks-rate', '50', '--messages-rate', '25',
+       '--messages-per-file', '2', '--message-size', '1000', '--state-size', '500')
+
+    tasks = [resp for resp in responses if resp['response'] == 'current_tasks']
+    msgs = [resp for resp in responses if resp['response'] == 'all_messages']
+    assert len(tasks) >= 5
+    assert len(msgs) >= 3
+    assert all(len(msg['text']) == 1000 for msg in msgs[-1]['msgs'])
+    info = [resp for resp in responses if resp.get('seq_num') == 2][0]
+    assert len(info['record']['state']) == 500
+
+
+def test_trio_server_through_real_pipes():
+    async def check_behavior():
+        async with trio.open_nursery() as nursery:
+            server = TrioLeanServer(nursery, lean_cmd=FAKE_LEAN + ['--elaboration-time', '0.05',
+                                                                   '--messages-per-file', '2'])
+            await server.start()
+            await server.full_sync('test.lean', content='example : true := trivial')
+            assert len(server.messages) == 2
+
+            state = await server.state('test.lean', 1, 0)
+            assert state.startswith('⊢ goal at 1:0')
+
+            for i in range(100):
+                response = await server.send(InfoRequest('test.lean', i, 0))
+                assert response.record.state.startswith(f'⊢ goal at {i}:0')
+
+            search = await server.send(SearchRequest('nat'))
+            assert isinstance(search, SearchResponse)
+            assert search.results[0].text == 'nat_0'
+
+            server.kill()
+            nursery.cancel_scope.cancel()
+
+    trio.run(check_behavior)
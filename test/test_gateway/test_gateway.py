@@ -0,0 +1,145 @@
+"""
+Tests for the HTTP and WebSocket gateway, backed by a pool of fake Lean servers.
+"""
+import base64
+import json
+import os
+import struct
+
+import trio  # type: ignore
+
+from lean_client.gateway import LeanGateway, HttpConnection, WebSocket
+from lean_client.pool import LeanServerPool
+from test.fake_lean import fake_lean
+
+FAKE_LEAN = fake_lean('--messages-per-file', '2', '--elaboration-time', '0.05', '--tasks-rate', '100')
+
+
+def run_with_gateway(check):
+    async def main():
+        async with trio.open_nursery() as nursery:
+            pool = LeanServerPool(nursery, 2, FAKE_LEAN)
+            await pool.start()
+            gateway = LeanGateway(pool)
+            listeners = await nursery.start(gateway.serve, 0)
+            port = listeners[0].socket.getsockname()[1]
+            await check(pool, port)
+            pool.kill()
+            nursery.cancel_scope.cancel()
+    trio.run(main)
+
+
+async def http(stream, method, target, body=None):
+    data = json.dumps(body).encode() if body is not None else b''
+    await stream.send_all(f'{method} {target} HTTP/1.1\r\nHost: localhost\r\n'
+                          f'Content-Length: {len(data)}\r\n\r\n'.encode() + data)
+    connection = HttpConnection(stream)
+    while b'\r\n\r\n' not in connection.buffer:
+        await connection.receive_some()
+    head, _, rest = bytes(connection.buffer).partition(b'\r\n\r\n')
+    status = int(head.split(b' ')[1])
+    length = int(head.lower().split(b'content-length: ')[1].split(b'\r\n')[0])
+    while len(rest) < length:
+        rest += await stream.receive_some(1 << 16)
+    return status, json.loads(rest)
+
+
+def test_commands_over_http():
+    async def check(pool, port):
+        stream = await trio.open_tcp_stream('127.0.0.1', port)
+        # several requests on the same keep-alive connection
+        status, value = await http(stream, 'POST', '/sync', {'file_name': 'a.lean', 'content': '--'})
+        assert status == 200
+        assert [msg['pos_line'] for msg in value['messages']] == [1, 2]
+
+        status, value = await http(stream, 'POST', '/info', {'file_name': 'a.lean', 'line': 3, 'column': 0})
+        assert status == 200
+        assert value['record']['state'].startswith('⊢ goal at 3:0')
+
+        status, value = await http(stream, 'POST', '/search', {'query': 'nat'})
+        assert value['results'][0]['text'] == 'nat_0'
+        assert value['results'][0]['type'] == 'Prop'
+
+        status, value = await http(stream, 'GET', '/messages?file_name=a.lean')
+        assert value['messages'][0]['severity'] == 'error'
+        status, value = await http(stream, 'GET', '/messages?file_name=never_synced.lean')
+        assert (status, value) == (200, {'messages': []})
+        assert 'never_synced.lean' not in pool.assignments
+
+        status, value = await http(stream, 'POST', '/info', {'file_name': 'unknown.lean', 'line': 1, 'column': 0})
+        assert status == 502
+        status, value = await http(stream, 'POST', '/info', {'file_name': 'a.lean'})
+        assert status == 400
+        status, value = await http(stream, 'POST', '/sync', {'content': '--'})
+        assert status == 400
+        status, value = await http(stream, 'POST', '/nonsense', {})
+        assert status == 404
+        await stream.aclose()
+
+    run_with_gateway(check)
+
+
+def test_negative_content_length():
+    async def check(pool, port):
+        stream = await trio.open_tcp_stream('127.0.0.1', port)
+        await stream.send_all(b'POST /info HTTP/1.1\r\nContent-Length: -5\r\n\r\n')
+        data = b''
+        while True:
+            chunk = await stream.receive_some(1 << 16)
+            if not chunk:
+                break
+            data += chunk
+        assert data.startswith(b'HTTP/1.1 400 ')
+        await stream.aclose()
+
+    run_with_gateway(check)
+
+
+def test_files_are_spread_over_the_pool():
+    async def check(pool, port):
+        stream = await trio.open_tcp_stream('127.0.0.1', port)
+        await http(stream, 'POST', '/sync', {'file_name': 'a.lean', 'content': '--'})
+        await http(stream, 'POST', '/sync', {'file_name': 'b.lean', 'content': '--'})
+        assert pool.server_for('a.lean') is not pool.server_for('b.lean')
+        assert {msg.file_name for msg in pool.servers[0].messages} == {'a.lean'}
+        await stream.aclose()
+
+    run_with_gateway(check)
+
+
+def test_websocket_events():
+    async def check(pool, port):
+        stream = await trio.open_tcp_stream('127.0.0.1', port)
+        key = base64.b64encode(os.urandom(16)).decode()
+        await stream.send_all(f'GET /events HTTP/1.1\r\nHost: localhost\r\nUpgrade: websocket\r\n'
+                              f'Connection: Upgrade\r\nSec-WebSocket-Key: {key}\r\n'
+                              f'Sec-WebSocket-Version: 13\r\n\r\n'.encode())
+        connection = HttpConnection(stream)
+        while b'\r\n\r\n' not in connection.buffer:
+            await connection.receive_some()
+        assert connection.buffer.startswith(b'HTTP/1.1 101')
+        del connection.buffer[:connection.buffer.index(b'\r\n\r\n') + 4]
+        websocket = WebSocket(connection)
+
+        http_stream = await trio.open_tcp_stream('127.0.0.1', port)
+        await http(http_stream, 'POST', '/sync', {'file_name': 'a.lean', 'content': '--'})
+
+        kinds = set()
+        with trio.fail_after(5):
+            while 'all_messages' not in kinds:
+                opcode, payload = await websocket.receive_frame()
+                assert opcode == 0x1
+                event = json.loads(payload)
+                kinds.add(event['response'])
+        assert 'current_tasks' in kinds
+
+        # masked close frame from the client, echoed by the server
+        await stream.send_all(struct.pack('!BB', 0x88, 0x80 | 2) + b'\0\0\0\0' + b'\x03\xe8')
+        with trio.fail_after(5):
+            while opcode != 0x8:
+                opcode, payload = await websocket.receive_frame()
+        assert payload == b'\x03\xe8'
+        await stream.aclose()
+        await http_stream.aclose()
+
+    run_with_gateway(check)
@@ -0,0 +1,78 @@
+"""
+Tests for the parsing of goal states.
+"""
+from lean_client.goals import parse_goal_state, GoalInterner, Hypothesis
+
+TWO_GOALS = """2 goals
+case or.inl
+p q : Prop,
+hp : p,
+f : p →
+  q
+⊢ p ∨
+    q
+
+p q : Prop
+⊢ q"""
+
+
+def test_parse_two_goals():
+    state = parse_goal_state(TWO_GOALS)
+    assert len(state.goals) == 2
+
+    first = state.goals[0]
+    assert first.case == 'or.inl'
+    assert first.hypotheses[0] == Hypothesis(('p', 'q'), 'Prop')
+    assert first.hypotheses[1] == Hypothesis(('hp',), 'p')
+    assert first.hypotheses[2] == Hypothesis(('f',), 'p →\n  q')
+    assert first.target == 'p ∨\n    q'
+
+    second = state.goals[1]
+    assert second.case is None
+    assert second.target == 'q'
+    assert not state.is_solved
+
+
+def test_single_goal_and_no_goals():
+    state = parse_goal_state('⊢ true')
+    assert len(state.goals) == 1
+    assert state.goals[0].hypotheses == ()
+    assert state.goals[0].target == 'true'
+    assert str(state) == '⊢ true'
+
+    assert parse_goal_state('no goals').is_solved
+    assert parse_goal_state('').is_solved
+
+
+def test_round_trip():
+    assert parse_goal_state(str(parse_goal_state(TWO_GOALS))) == parse_goal_state(TWO_GOALS)
+
+
+def test_interning_shares_objects():
+    interner = GoalInterner()
+    state1 = parse_goal_state('p q : Prop,\nhp : p\n⊢ p ∧ q', interner)
+    state2 = parse_goal_state('p q : Prop,\nhq : q\n⊢ p ∧ q', interner)
+    assert state1.goals[0].hypotheses[0] is state2.goals[0].hypotheses[0]
+    assert state1.goals[0].target is state2.goals[0].target
+
+    state3 = parse_goal_state('p q : Prop,\nhp : p\n⊢ p ∧ q', interner)
+    assert state3.goals[0] is state1.goals[0]
+
+
+def test_canonical_hash():
+    state1 = parse_goal_state('h : a =  b\n⊢ b = a')
+    state2 = parse_goal_state('h : a = b\n⊢ b =\n  a')
+    state3 = parse_goal_state('h : a = b\n⊢ a = b')
+    assert state1 == state2
+    assert hash(state1) == hash(state2)
+    assert state1 != state3
+    assert len({state1, state2, state3}) == 2
+
+
+def test_unparsable_hypothesis():
+    state = parse_goal_state('p : Prop,\nnonsense\n⊢ true')
+    goal, = state.goals
+    assert goal.hypotheses == (Hypothesis(('p',), 'Prop'), Hypothesis((), 'nonsense'))
+    assert goal.target == 'true'
+    assert str(state) == 'p : Prop,\nnonsense\n⊢ true'
+    assert state != parse_goal_state('p : Prop,\nother\n⊢ true')
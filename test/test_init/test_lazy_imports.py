@@ -0,0 +1,30 @@
+"""
+Importing lean_client should not import the optional backends.
+"""
+import subprocess
+import sys
+
+import pytest
+
+
+def imported_modules(code: str):
+    result = subprocess.run([sys.executable, '-c', code + '; import sys; print(" ".join(sys.modules))'],
+                            capture_output=True, text=True, check=True)
+    return set(result.stdout.split())
+
+
+def test_backends_are_not_imported():
+    modules = imported_modules('import lean_client, lean_client.commands')
+    assert 'trio' not in modules
+    assert 'PyQt5' not in modules
+    assert 'lean_client.retention' not in modules
+
+
+def test_backends_are_imported_on_use():
+    import lean_client
+    from lean_client.trio_server import TrioLeanServer
+
+    assert lean_client.TrioLeanServer is TrioLeanServer
+    assert 'TrioLeanServer' in dir(lean_client)
+    with pytest.raises(AttributeError):
+        lean_client.NoSuchServer
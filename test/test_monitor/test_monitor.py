@@ -0,0 +1,111 @@
+"""
+Tests for the monitoring and recycling of Lean processes, with a fake Lean
+server.
+"""
+import os
+
+import trio  # type: ignore
+
+from lean_client.commands import InfoRequest, InfoResponse
+from lean_client.monitor import LeanProcessMonitor, read_process_stats
+from lean_client.trio_server import TrioLeanServer, Priority
+from test.fake_lean import fake_lean
+
+FAKE_LEAN = fake_lean('--latency', '0.001')
+
+
+def test_read_process_stats():
+    stats = read_process_stats(os.getpid())
+    assert stats.pid == os.getpid()
+    assert stats.rss > 1 << 20
+    assert stats.cpu_time > 0
+
+
+def test_recycle_after_max_requests():
+    samples = []
+
+    async def check_behavior():
+        async with trio.open_nursery() as nursery:
+            server = TrioLeanServer(nursery, lean_cmd=FAKE_LEAN)
+            await server.start()
+            first_pid = server.process.pid
+            await server.full_sync('test.lean', content='--')
+            monitor = LeanProcessMonitor(server, interval=0.01, max_requests=5)
+            monitor.callbacks.append(samples.append)
+            nursery.start_soon(monitor.run)
+
+            responses = []
+            with trio.fail_after(10):
+                while not monitor.recycles:
+                    responses.append(await server.send(InfoRequest('test.lean', 1, 0)))
+                    await trio.sleep(0.005)
+                # the file was synced again in the new process
+                responses.append(await server.send(InfoRequest('test.lean', 1, 0)))
+
+            assert server.process.pid != first_pid
+            assert server.requests_sent < 5
+            server.kill()
+            nursery.cancel_scope.cancel()
+        return responses
+
+    responses = trio.run(check_behavior)
+    assert all(isinstance(response, InfoResponse) for response in responses)
+    assert samples[0].rss > 0
+    assert max(stats.requests for stats in samples) >= 5
+
+
+def test_failed_restarts_are_reported():
+    samples = []
+
+    async def check_behavior():
+        async with trio.open_nursery() as nursery:
+            server = TrioLeanServer(nursery, lean_cmd=FAKE_LEAN)
+            await server.start()
+
+            async def restart():
+                raise OSError('no more processes')
+            server.restart = restart
+            monitor = LeanProcessMonitor(server, interval=0.01, max_requests=0)
+            monitor.callbacks.append(samples.append)
+            nursery.start_soon(monitor.run)
+            with trio.fail_after(10):
+                while sum(stats.restart_error is not None for stats in samples) < 2:
+                    await trio.sleep(0.01)
+            assert monitor.recycles == 0
+            server.kill()
+            nursery.cancel_scope.cancel()
+
+    trio.run(check_behavior)
+    failure = next(stats for stats in samples if stats.restart_error is not None)
+    assert isinstance(failure.restart_error, OSError)
+    assert failure.pid is not None
+
+
+def test_restart_holds_queued_requests():
+    async def check_behavior():
+        async with trio.open_nursery() as nursery:
+            server = TrioLeanServer(nursery, lean_cmd=FAKE_LEAN[:-1] + ['0.05'], background_in_flight=1)
+            await server.start()
+            first_pid = server.process.pid
+            await server.full_sync('test.lean', content='--')
+            responses = []
+
+            async def info(line, priority):
+                responses.append(await server.send(InfoRequest('test.lean', line, 0), priority))
+
+            nursery.start_soon(info, 1, Priority.normal)
+            for line in range(2, 5):
+                nursery.start_soon(info, line, Priority.background)
+            await trio.sleep(0.01)
+            # the background requests wait in turn() while the restart starts
+            await server.restart()
+            with trio.fail_after(5):
+                while len(responses) < 4:
+                    await trio.sleep(0.01)
+            assert server.process.pid != first_pid
+            server.kill()
+            nursery.cancel_scope.cancel()
+        return responses
+
+    responses = trio.run(check_behavior)
+    assert all(isinstance(response, InfoResponse) for response in responses)
@@ -0,0 +1,103 @@
+"""
+Tests for the sharing of one Lean process between several clients,
+using the fake Lean server.
+"""
+import pytest  # type: ignore
+import trio  # type: ignore
+
+from lean_client.commands import InfoRequest, InfoResponse, SyncRequest
+from lean_client.multiplex import LeanMultiplexer
+from lean_client.trio_server import TrioLeanServer
+from test.fake_lean import fake_lean
+
+FAKE_LEAN = fake_lean('--messages-per-file', '2')
+
+
+def run_with_multiplexer(check, max_in_flight=8):
+    async def main():
+        async with trio.open_nursery() as nursery:
+            server = TrioLeanServer(nursery, lean_cmd=FAKE_LEAN)
+            await server.start()
+            mux = LeanMultiplexer(server, max_in_flight=max_in_flight)
+            nursery.start_soon(mux.run)
+            await check(server, mux)
+            server.kill()
+            nursery.cancel_scope.cancel()
+    trio.run(main)
+
+
+def test_namespaces_and_message_views():
+    async def check(server, mux):
+        alice, bob = mux.client('alice'), mux.client('bob')
+        async with trio.open_nursery() as nursery:
+            nursery.start_soon(alice.full_sync, 'test.lean', 'example : true := trivial')
+            nursery.start_soon(bob.full_sync, 'test.lean', 'example : 1 = 1 := rfl')
+
+        assert {msg.file_name for msg in server.messages} == {'alice/test.lean', 'bob/test.lean'}
+        assert [msg.file_name for msg in alice.messages] == ['test.lean', 'test.lean']
+        assert len(bob.messages) == 2
+
+        response = await alice.send(InfoRequest('test.lean', 1, 0))
+        assert isinstance(response, InfoResponse)
+        assert (await bob.state('test.lean', 3, 0)).startswith('⊢ goal at 3:0')
+
+    run_with_multiplexer(check)
+
+
+def test_round_robin_scheduling():
+    order = []
+
+    async def check(server, mux):
+        greedy, polite = mux.client('greedy'), mux.client('polite')
+        await greedy.full_sync('a.lean', '--')
+        await polite.full_sync('b.lean', '--')
+
+        async def info(client, i):
+            await client.send(InfoRequest('a.lean' if client is greedy else 'b.lean', i, 0))
+            order.append(client.name)
+
+        async with trio.open_nursery() as nursery:
+            for i in range(20):
+                nursery.start_soon(info, greedy, i)
+            await trio.sleep(0)
+            for i in range(2):
+                nursery.start_soon(info, polite, i)
+
+    run_with_multiplexer(check, max_in_flight=1)
+    # the polite client does not wait for all of the greedy client's requests
+    assert order.index('polite') < 5
+    assert len(order) == 22
+
+
+def test_syncs_from_disk_and_errors(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    path = tmp_path / 'disk.lean'
+    path.write_text('example : true := trivial')
+
+    async def check(server, mux):
+        alice = mux.client('alice')
+        await alice.full_sync('disk.lean')
+        assert server.synced_files == {'alice/disk.lean': 'example : true := trivial'}
+        path.write_text('-- edited')
+        await alice.send(SyncRequest('./disk.lean'))
+        assert server.synced_files['alice/disk.lean'] == '-- edited'
+        with pytest.raises(ChildProcessError):
+            await alice.send(InfoRequest('unknown.lean', 1, 0))
+
+    run_with_multiplexer(check)
+
+
+def test_file_names_stay_in_namespace():
+    async def check(server, mux):
+        alice = mux.client('alice')
+        assert alice.to_lean('a/../b.lean') == 'alice/b.lean'
+        for name in ['/abs/path.lean', '../bob/test.lean', 'a/../../bob/test.lean', '.']:
+            with pytest.raises(ValueError):
+                alice.to_lean(name)
+        with pytest.raises(ValueError):
+            await alice.send(InfoRequest('../bob/test.lean', 1, 0))
+        with pytest.raises(ValueError):
+            await alice.full_sync('/abs/path.lean', content='--')
+        assert server.synced_files == {}
+
+    run_with_multiplexer(check)
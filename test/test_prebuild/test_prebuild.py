@@ -0,0 +1,100 @@
+"""
+Tests for the prebuild of .olean files, with a fake `lean --make` which
+writes the .olean file and records when it ran.
+"""
+import json
+import os
+import sys
+
+import pytest
+import trio  # type: ignore
+
+from lean_client.prebuild import prebuild, stale_modules, olean_path, hashes_path
+from lean_client.project import ImportGraph
+
+FAKE_MAKE = """
+import json, sys, time
+from pathlib import Path
+path = Path(sys.argv[-1])
+start = time.time()
+if 'fail' in path.read_text():
+    print('error: failed')
+    sys.exit(1)
+time.sleep(0.05)
+path.with_suffix('.olean').write_text('olean')
+with open('log.jsonl', 'a') as log:
+    log.write(json.dumps([path.stem, start, time.time()]) + '\\n')
+"""
+
+
+@pytest.fixture
+def project(tmp_path):
+    files = {'base.lean': '', 'left.lean': 'import base', 'right.lean': 'import base',
+             'top.lean': 'import left right'}
+    for name, text in files.items():
+        (tmp_path / name).write_text(text)
+    compiler = tmp_path / 'fake_make.py'
+    compiler.write_text(FAKE_MAKE)
+    return tmp_path, [sys.executable, str(compiler)]
+
+
+def read_log(root):
+    log = {}
+    for line in (root / 'log.jsonl').read_text().splitlines():
+        name, start, end = json.loads(line)
+        log[name] = (start, end)
+    (root / 'log.jsonl').unlink()
+    return log
+
+
+def test_prebuild_follows_imports(project):
+    root, lean_cmd = project
+    compiled = trio.run(prebuild, root, lean_cmd, 4)
+    assert compiled[0] == 'base' and compiled[-1] == 'top'
+    log = read_log(root)
+    assert log['base'][1] <= min(log['left'][0], log['right'][0])
+    assert max(log['left'][1], log['right'][1]) <= log['top'][0]
+    # left and right run together
+    assert log['left'][0] < log['right'][1] and log['right'][0] < log['left'][1]
+
+    assert trio.run(prebuild, root, lean_cmd) == []
+    # nothing but .olean files is written to the project
+    assert sorted(path.name for path in root.iterdir() if path.suffix != '.olean') == [
+        'base.lean', 'fake_make.py', 'left.lean', 'right.lean', 'top.lean']
+
+
+def test_stale_by_mtime(project):
+    root, lean_cmd = project
+    trio.run(prebuild, root, lean_cmd)
+    graph = ImportGraph.from_directory(root)
+    assert stale_modules(graph) == set()
+    olean = olean_path(root / 'left.lean')
+    os.utime(root / 'left.lean', (olean.stat().st_mtime + 10,) * 2)
+    assert stale_modules(graph) == {'left', 'top'}
+
+
+def test_stale_by_hash(project, tmp_path_factory):
+    root, lean_cmd = project
+    cache_dir = tmp_path_factory.mktemp('cache') / 'lean_client'
+    with pytest.raises(ValueError):
+        trio.run(prebuild, root, lean_cmd, None, 'hash')
+    trio.run(prebuild, root, lean_cmd, None, 'hash', cache_dir)
+    graph = ImportGraph.from_directory(root)
+    hashes = json.loads(hashes_path(cache_dir, root).read_text())
+    assert stale_modules(graph, 'hash', hashes) == set()
+    # touching doesn't matter, changing content does
+    os.utime(root / 'right.lean', (os.stat(root / 'right.lean').st_mtime + 10,) * 2)
+    assert stale_modules(graph, 'hash', hashes) == set()
+    (root / 'right.lean').write_text('import base\n-- changed')
+    assert stale_modules(graph, 'hash', hashes) == {'right', 'top'}
+    assert trio.run(prebuild, root, lean_cmd, None, 'hash', cache_dir) == ['right', 'top']
+
+
+def test_failures(project):
+    root, lean_cmd = project
+    (root / 'left.lean').write_text('import base\nfail')
+    with pytest.raises(ChildProcessError) as error:
+        trio.run(prebuild, root, lean_cmd)
+    assert 'left: error: failed' in str(error.value)
+    assert 'top: not compiled since left failed' in str(error.value)
+    assert olean_path(root / 'right.lean').exists()
@@ -0,0 +1,95 @@
+"""
+Tests for import graphs and project checking, with fake Lean servers.
+"""
+import pytest
+import trio  # type: ignore
+
+from lean_client.pool import LeanServerPool
+from lean_client.project import ImportGraph, ProjectChecker, parse_imports, resolve
+from test.fake_lean import fake_lean
+
+FAKE_LEAN = fake_lean('--elaboration-time', '0.05', '--messages-per-file', '2')
+
+
+def test_parse_imports():
+    text = """/- Copyright
+import fake -/
+import data.real.basic -- comment
+  tactic .sibling
+import ..parent
+open real
+
+theorem foo : true := trivial
+"""
+    assert parse_imports(text) == ['data.real.basic', 'tactic', '.sibling', '..parent']
+    assert parse_imports('prelude\nimport init.core\ndef x := 1') == ['init.core']
+    assert parse_imports('theorem foo : true := trivial') == []
+
+
+def test_resolve():
+    assert resolve('a.b.c', 'd.e') == 'd.e'
+    assert resolve('a.b.c', '.d') == 'a.b.d'
+    assert resolve('a.b.c', '..d') == 'a.d'
+
+
+def write_project(root):
+    files = {
+        'base.lean': 'def x := 1',
+        'left.lean': 'import base',
+        'right.lean': 'import base data.real.basic',
+        'sub/top.lean': 'import left right\nimport .helper',
+        'sub/helper.lean': '',
+    }
+    for name, text in files.items():
+        path = root / name
+        path.parent.mkdir(exist_ok=True)
+        path.write_text(text)
+
+
+def test_import_graph(tmp_path):
+    write_project(tmp_path)
+    graph = ImportGraph.from_directory(tmp_path)
+    assert graph.imports == {'base': set(), 'left': {'base'}, 'right': {'base'},
+                             'sub.helper': set(), 'sub.top': {'left', 'right', 'sub.helper'}}
+    order = graph.topological_order()
+    for module, imported in graph.imports.items():
+        assert all(order.index(other) < order.index(module) for other in imported)
+
+
+def test_import_cycle(tmp_path):
+    (tmp_path / 'a.lean').write_text('import b')
+    (tmp_path / 'b.lean').write_text('import a')
+    with pytest.raises(ValueError, match='a, b'):
+        ImportGraph.from_directory(tmp_path).topological_order()
+
+
+def test_project_checker(tmp_path):
+    write_project(tmp_path)
+    graph = ImportGraph.from_directory(tmp_path)
+    intervals = dict()
+
+    async def check_behavior():
+        async with trio.open_nursery() as nursery:
+            pool = LeanServerPool(nursery, 2, FAKE_LEAN)
+            await pool.start()
+            for server in pool.servers:
+                full_sync = server.full_sync
+
+                async def timed_sync(file_name, content=None, full_sync=full_sync):
+                    start = trio.current_time()
+                    await full_sync(file_name, content)
+                    intervals[file_name] = (start, trio.current_time())
+                server.full_sync = timed_sync
+            messages = await ProjectChecker(pool, graph).check()
+            pool.kill()
+            nursery.cancel_scope.cancel()
+        return messages
+
+    messages = trio.run(check_behavior)
+    assert set(messages) == set(graph.modules)
+    assert all(len(msgs) == 2 for msgs in messages.values())
+    times = {module: intervals[str(path)] for module, path in graph.modules.items()}
+    for module, imported in graph.imports.items():
+        assert all(times[other][1] <= times[module][0] for other in imported)
+    # left and right only need base, they are compiled together
+    assert times['left'][0] < times['right'][1] and times['right'][0] < times['left'][1]
@@ -0,0 +1,113 @@
+"""
+Tests for best-first proof search: the search logic with an evaluator
+playing a small tactic game, then a run on fake Lean servers.
+"""
+from typing import List
+
+import trio  # type: ignore
+
+from lean_client.goals import GoalInterner, parse_goal_state
+from lean_client.pool import LeanServerPool
+from lean_client.proof_search import BestFirstSearch, SearchNode
+from lean_client.speculative import SpeculativeEvaluator, TacticOutcome
+from test.fake_lean import fake_lean
+
+FAKE_LEAN = fake_lean()
+
+
+class CountdownEvaluator:
+    """The goal is a number n, `dec` replaces it by n - 1, `half` by n // 2
+    if n is even and fails otherwise, `noop` keeps it. 0 is solved."""
+    def __init__(self, start: int):
+        self.start = start
+        self.interner = GoalInterner()
+        self.pool = [None, None]
+        self.evaluated: List[List[str]] = []
+
+    def goals(self, tactics):
+        n = self.start
+        for tactic in tactics:
+            if tactic == 'dec':
+                n -= 1
+            elif tactic == 'half':
+                if n % 2:
+                    return None
+                n //= 2
+        return parse_goal_state(f'⊢ {n}' if n else 'no goals', self.interner)
+
+    async def state_after(self, tactics):
+        return self.goals(tactics)
+
+    async def evaluate(self, prefix, tactics, first_success=False):
+        await trio.sleep(0.001)
+        self.evaluated.append(prefix)
+        outcomes = []
+        for tactic in tactics:
+            goals = self.goals(prefix + [tactic])
+            errors = ['error'] if goals is None else []
+            outcomes.append(TacticOutcome(tactic, str(goals), goals or parse_goal_state(''), errors))
+        return outcomes
+
+
+def target(node: SearchNode) -> int:
+    return int(node.goals.goals[0].target)
+
+
+def test_search_finds_a_proof():
+    evaluator = CountdownEvaluator(12)
+    search = BestFirstSearch(evaluator, generate=lambda node: ['noop', 'dec', 'half'],
+                             score=lambda node: -target(node))
+    result = trio.run(search.search)
+    assert evaluator.goals(result.proof).is_solved
+    # 12 -> 6 -> 3 -> 2 -> 1 -> 0, greedily
+    assert result.proof[:3] == ['half', 'half', 'dec'] and len(result.proof) == 5
+    # noop always leads to a known state
+    assert result.stats.duplicates >= result.stats.expansions - 1
+    assert result.stats.failed_tactics >= 1
+    assert result.nodes_by_depth[0] == 1
+
+
+def test_transpositions_are_explored_once():
+    evaluator = CountdownEvaluator(6)
+    # larger numbers first: noop and the prefix reach known states only
+    search = BestFirstSearch(evaluator, generate=lambda node: ['dec', 'noop'],
+                             score=lambda node: target(node), max_expansions=100)
+    result = trio.run(search.search, ['noop'])
+    assert result.proof == ['noop'] + ['dec'] * 6
+    assert len(evaluator.evaluated) == len({tuple(prefix) for prefix in evaluator.evaluated})
+
+
+def test_limits():
+    evaluator = CountdownEvaluator(1000)
+    search = BestFirstSearch(evaluator, generate=lambda node: ['dec'], max_expansions=5)
+    result = trio.run(search.search)
+    assert result.proof is None
+    assert result.stats.expansions == 5
+
+    search = BestFirstSearch(evaluator, generate=lambda node: ['dec'], max_depth=3)
+    result = trio.run(search.search)
+    assert result.proof is None
+    assert result.stats.max_depth == 3
+
+
+def test_search_on_fake_lean():
+    template = 'example : true :=\nbegin\nsorry\nend\n'
+
+    async def main():
+        async with trio.open_nursery() as nursery:
+            pool = LeanServerPool(nursery, 2, FAKE_LEAN)
+            await pool.start()
+            search = BestFirstSearch(SpeculativeEvaluator(pool, template),
+                                     generate=lambda node: ['simp', 'trivial', 'refl'],
+                                     max_expansions=4)
+            result = await search.search()
+            pool.kill()
+            nursery.cancel_scope.cancel()
+        return result
+
+    result = trio.run(main)
+    # The fake goal only depends on the line, so siblings are transpositions.
+    assert result.proof is None
+    assert result.stats.expansions == 4
+    assert result.stats.duplicates == 2 * 4
+    assert result.nodes_by_depth == {0: 1, 1: 1, 2: 1, 3: 1}
@@ -0,0 +1,50 @@
+"""
+Tests for the splitting and parsing of Lean's output in the Qt server,
+without a Qt event loop or thread.
+"""
+import pytest
+
+pytest.importorskip('PyQt5')
+
+from lean_client.commands import AllMessagesResponse, CurrentTasksResponse, ErrorResponse
+from lean_client.qt_server import ResponseParser
+
+TASKS = b'{"is_running":false,"response":"current_tasks","tasks":[]}'
+ERROR = b'{"message":"file \'missing.lean\' not found in the LEAN_PATH","response":"error","seq_num":3}'
+MESSAGES = (b'{"msgs":[{"caption":"","file_name":"test.lean","pos_col":7,"pos_line":2,'
+            b'"severity":"error","text":"unknown identifier \'foo\'"}],"response":"all_messages"}')
+
+
+def test_lines_split_across_chunks():
+    parser = ResponseParser()
+    assert parser.feed(TASKS[:10]) == []
+    results = parser.feed(TASKS[10:] + b'\n' + ERROR[:20])
+    assert [line for line, _ in results] == [TASKS]
+    assert isinstance(results[0][1], CurrentTasksResponse)
+
+    results = parser.feed(ERROR[20:] + b'\n\n  \n')
+    assert [line for line, _ in results] == [ERROR]
+    assert isinstance(results[0][1], ErrorResponse)
+    assert results[0][1].seq_num == 3
+    assert parser.unfinished_line == b''
+
+
+def test_parse_errors_are_returned():
+    parser = ResponseParser()
+    results = parser.feed(b'not json\n' + TASKS + b'\n')
+    assert results[0][0] == b'not json'
+    assert isinstance(results[0][1], Exception)
+    assert isinstance(results[1][1], CurrentTasksResponse)
+
+
+def test_message_reuse():
+    parser = ResponseParser()
+    (_, first), = parser.feed(MESSAGES + b'\n')
+    (_, second), = parser.feed(MESSAGES + b'\n')
+    assert isinstance(first, AllMessagesResponse)
+    assert second.msgs[0] is first.msgs[0]
+
+    parser = ResponseParser(reuse_messages=False)
+    (_, first), = parser.feed(MESSAGES + b'\n')
+    (_, second), = parser.feed(MESSAGES + b'\n')
+    assert second.msgs[0] is not first.msgs[0]
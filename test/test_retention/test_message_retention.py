@@ -0,0 +1,73 @@
+"""
+Tests for the memory bounded retention of Lean messages.
+"""
+from lean_client.commands import Message, Severity
+from lean_client.retention import MessageRetention, SpilledMessage, TRUNCATION_MARK
+
+
+def make_message(file_name, line, text='oops'):
+    return Message(file_name=file_name, severity=Severity.error, caption='', text=text,
+                   pos_line=line, pos_col=0)
+
+
+def test_long_texts_are_spilled_and_read_back():
+    retention = MessageRetention(max_text_length=100)
+    huge = 'x' * 10_000
+    msgs = [make_message('a.lean', 1, huge), make_message('a.lean', 2)]
+
+    kept = retention.retain(msgs)
+    assert isinstance(kept[0], SpilledMessage)
+    assert kept[0].text == huge
+    assert kept[0].pos_line == 1
+    assert kept[1] is msgs[1]
+    assert retention.memory_used < 1000
+
+    # the same message in the next response is neither copied nor written again
+    size = retention.store.size
+    kept_again = retention.retain([make_message('a.lean', 1, huge), make_message('a.lean', 2)])
+    assert kept_again[0] is kept[0]
+    assert retention.store.size == size
+    retention.close()
+
+
+def test_long_texts_are_truncated_without_spilling():
+    retention = MessageRetention(max_text_length=100, spill=False)
+    kept = retention.retain([make_message('a.lean', 1, 'x' * 10_000)])
+    assert kept[0].text == 'x' * 100 + TRUNCATION_MARK
+
+
+def test_least_recently_changed_files_are_evicted():
+    retention = MessageRetention(memory_budget=3000, max_text_length=None)
+    text = 'y' * 1000
+    a, b, c = (make_message(name, 1, text) for name in ['a.lean', 'b.lean', 'c.lean'])
+
+    assert len(retention.retain([a, b])) == 2
+    assert retention.evicted == set()
+
+    # b changes, then c shows up: a is the oldest and gets evicted
+    b2 = make_message('b.lean', 2, text)
+    assert retention.retain([a, b2]) == [a, b2]
+    assert retention.retain([a, b2, c]) == [b2, c]
+    assert retention.evicted == {'a.lean'}
+    assert retention.memory_used <= 3000
+
+
+def test_spill_file_is_compacted():
+    retention = MessageRetention(max_text_length=10)
+    for i in range(50):
+        kept = retention.retain([make_message('a.lean', 1, str(i) * 100_000)])
+    assert retention.store.size < 1 << 21
+    assert kept[0].text == '49' * 100_000
+    retention.close()
+
+
+def test_keys_do_not_hold_texts():
+    retention = MessageRetention(memory_budget=3000, max_text_length=100)
+    msgs = [make_message(f'{i}.lean', 1, str(i) * 1_000_000) for i in range(10)]
+    kept = retention.retain(msgs)
+    assert retention.memory_used <= 3000
+    assert all(isinstance(key[3], bytes) for key in retention.retained)
+    # only the messages still kept are retained
+    assert len(retention.retained) == len(kept) < len(msgs)
+    assert sum(len(part) for key in retention.retained for part in key if isinstance(part, str)) < 100
+    retention.close()
@@ -0,0 +1,151 @@
+"""
+Tests for Lean workers served over sockets and for the sharding client,
+with fake Lean servers behind the workers.
+"""
+import os
+import tempfile
+
+import pytest
+import trio  # type: ignore
+
+from lean_client.commands import InfoRequest, SearchRequest, SearchResponse
+from lean_client.monitor import LeanProcessMonitor
+from lean_client.sharding import HashRing, ShardedLeanClient
+from lean_client.trio_server import TrioLeanServer
+from lean_client.worker import LeanWorker
+from test.fake_lean import fake_lean
+
+FAKE_LEAN = fake_lean('--messages-per-file', '1')
+
+
+def test_hash_ring_is_consistent():
+    ring = HashRing(replicas=32)
+    for name in 'abcd':
+        ring.add(name, name)
+    keys = [f'file{i}.lean' for i in range(1000)]
+    before = {key: ring.node_for(key) for key in keys}
+    assert set(before.values()) == set('abcd')
+
+    ring.remove('c')
+    after = {key: ring.node_for(key) for key in keys}
+    # only the keys of the removed node move
+    assert all(after[key] == before[key] for key in keys if before[key] != 'c')
+    assert 'c' not in after.values()
+
+
+async def start_worker(nursery, serve, *args):
+    server = TrioLeanServer(nursery, lean_cmd=FAKE_LEAN)
+    await server.start()
+    worker = LeanWorker(server)
+    listeners = await nursery.start(serve.__get__(worker), *args)
+    return server, listeners
+
+
+def test_sharded_client_over_tcp():
+    async def main():
+        async with trio.open_nursery() as nursery:
+            addresses = []
+            lean_servers = []
+            for _ in range(3):
+                server, listeners = await start_worker(nursery, LeanWorker.serve_tcp, 0)
+                lean_servers.append(server)
+                addresses.append(f'127.0.0.1:{listeners[0].socket.getsockname()[1]}')
+
+            client = ShardedLeanClient(nursery, addresses)
+            await client.start()
+
+            files = [f'file{i}.lean' for i in range(12)]
+            async with trio.open_nursery() as syncs:
+                for file_name in files:
+                    syncs.start_soon(client.full_sync, file_name, '--')
+
+            # each file is synced on exactly one worker, the one chosen by the ring
+            for file_name in files:
+                owners = [server for server in lean_servers
+                          if any(msg.file_name == file_name for msg in server.messages)]
+                assert len(owners) == 1
+            assert sorted(msg.file_name for msg in client.messages) == sorted(files)
+
+            response = await client.send(InfoRequest('file3.lean', 2, 0))
+            assert response.record.state.startswith('⊢ goal at 2:0')
+            assert isinstance(await client.send(SearchRequest('nat')), SearchResponse)
+            with pytest.raises(ChildProcessError):
+                await client.send(InfoRequest('unknown.lean', 1, 0))
+
+            client.kill()
+            for server in lean_servers:
+                server.kill()
+            nursery.cancel_scope.cancel()
+
+    trio.run(main)
+
+
+def test_worker_over_unix_socket():
+    async def main():
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, 'lean.sock')
+            async with trio.open_nursery() as nursery:
+                server, _ = await start_worker(nursery, LeanWorker.serve_unix, path)
+                client = ShardedLeanClient(nursery, [f'unix:{path}'])
+                await client.start()
+                await client.full_sync('test.lean', '--')
+                assert await client.state('test.lean', 1, 0)
+                client.kill()
+                server.kill()
+                nursery.cancel_scope.cancel()
+
+    trio.run(main)
+
+
+def test_restart_and_monitor_remote_server():
+    async def main():
+        async with trio.open_nursery() as nursery:
+            server, listeners = await start_worker(nursery, LeanWorker.serve_tcp, 0)
+            client = ShardedLeanClient(nursery, [f'127.0.0.1:{listeners[0].socket.getsockname()[1]}'])
+            await client.start()
+            await client.full_sync('test.lean', '--')
+            # the worker's server knows forwarded syncs, to sync them again on restart
+            assert server.synced_files == {'test.lean': '--'}
+
+            remote = client.servers[0]
+            stats = LeanProcessMonitor(remote, max_requests=1).sample()
+            assert (stats.pid, stats.requests) == (None, 1)
+            await remote.restart()
+            assert remote.requests_sent == 1
+            assert await client.state('test.lean', 1, 0)
+
+            client.kill()
+            server.kill()
+            nursery.cancel_scope.cancel()
+
+    trio.run(main)
+
+
+def test_added_worker_gets_its_files():
+    async def main():
+        async with trio.open_nursery() as nursery:
+            lean_servers, addresses = [], []
+            for _ in range(2):
+                server, listeners = await start_worker(nursery, LeanWorker.serve_tcp, 0)
+                lean_servers.append(server)
+                addresses.append(f'127.0.0.1:{listeners[0].socket.getsockname()[1]}')
+
+            client = ShardedLeanClient(nursery, addresses[:1])
+            await client.start()
+            files = [f'file{i}.lean' for i in range(12)]
+            for file_name in files:
+                await client.full_sync(file_name, f'-- {file_name}')
+
+            await client.add_worker(addresses[1])
+            moved = [file_name for file_name in files if client.server_for(file_name).address == addresses[1]]
+            assert moved
+            assert lean_servers[1].synced_files == {file_name: f'-- {file_name}' for file_name in moved}
+            for file_name in moved:
+                assert await client.state(file_name, 1, 0)
+
+            client.kill()
+            for server in lean_servers:
+                server.kill()
+            nursery.cancel_scope.cancel()
+
+    trio.run(main)
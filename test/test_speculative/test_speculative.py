@@ -0,0 +1,66 @@
+"""
+Tests for speculative tactic evaluation, with fake Lean servers reporting an
+error on lines 1, 4, 7... and the queried position in goal states.
+"""
+import trio  # type: ignore
+
+from lean_client.pool import LeanServerPool
+from lean_client.speculative import SpeculativeEvaluator
+from test.fake_lean import fake_lean
+
+FAKE_LEAN = fake_lean('--messages-per-file', '10', '--elaboration-time', '0.05')
+
+TEMPLATE = """variables (P Q : Prop)
+
+example : P ∧ Q → Q ∧ P :=
+begin
+sorry
+end
+"""
+
+
+def run_with_pool(check):
+    async def main():
+        async with trio.open_nursery() as nursery:
+            pool = LeanServerPool(nursery, 3, FAKE_LEAN)
+            await pool.start()
+            result = await check(SpeculativeEvaluator(pool, TEMPLATE))
+            pool.kill()
+            nursery.cancel_scope.cancel()
+        return result
+
+    return trio.run(main)
+
+
+def test_evaluate_all():
+    tactics = [f'tactic_{i}' for i in range(6)]
+
+    async def check(evaluator):
+        # let the fake servers warm up
+        await evaluator.evaluate([], [f'warm_up_{i}' for i in range(3)])
+        start = trio.current_time()
+        outcomes = await evaluator.evaluate(['intro h'], tactics)
+        return outcomes, trio.current_time() - start
+
+    outcomes, elapsed = run_with_pool(check)
+    assert [outcome.tactic for outcome in outcomes] == tactics
+    for outcome in outcomes:
+        assert outcome.success
+        assert outcome.state.startswith('⊢ goal at 7:0')
+        assert outcome.goals.goals[0].target.startswith('goal at 7:0')
+    # 6 candidates on 3 servers take two rounds of elaboration
+    assert elapsed < 4 * 0.05
+
+
+def test_errors_and_first_success():
+    async def check(evaluator):
+        # the third tactic is on line 7, where the fake server reports an error
+        failed = await evaluator.evaluate(['intro h', 'split'], ['cases h', 'simp'])
+        winner = await evaluator.evaluate(['intro h'], ['cases h', 'simp', 'finish'], first_success=True)
+        return failed, winner
+
+    failed, winner = run_with_pool(check)
+    assert len(failed) == 2
+    assert not any(outcome.success for outcome in failed)
+    assert all(outcome.errors[0].pos_line == 7 for outcome in failed)
+    assert len(winner) == 1 and winner[0].success
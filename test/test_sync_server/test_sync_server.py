@@ -0,0 +1,83 @@
+"""
+Tests for the synchronous client, with several threads sharing a real (fake)
+Lean process.
+"""
+from concurrent.futures import ThreadPoolExecutor
+import time
+
+import pytest  # type: ignore
+
+from lean_client.commands import InfoRequest, SearchRequest, Severity
+from lean_client.sync_server import SyncLeanServer
+from test.fake_lean import fake_lean
+
+FAKE_LEAN = fake_lean('--latency', '0.01')
+
+
+@pytest.fixture
+def server():
+    server = SyncLeanServer(FAKE_LEAN + ['--messages-per-file', '3', '--elaboration-time', '0.05'])
+    server.start()
+    yield server
+    server.kill()
+
+
+def test_full_sync_and_state(server):
+    server.full_sync('test.lean', content='--')
+    assert server.is_fully_ready.is_set()
+    assert server.message_index.query('test.lean', severity=Severity.error)
+    assert server.state('test.lean', 3, 2).startswith('⊢ goal at 3:2')
+
+
+def test_requests_from_many_threads(server):
+    server.full_sync('test.lean', content='--')
+    positions = [(line, col) for line in range(1, 21) for col in range(5)]
+    with ThreadPoolExecutor(8) as executor:
+        states = list(executor.map(lambda pos: server.state('test.lean', *pos), positions))
+    assert all(state.startswith(f'⊢ goal at {line}:{col} ') for state, (line, col) in zip(states, positions))
+    assert server.seq_num == len(positions) + 1
+    assert not server.futures
+
+
+def test_requests_are_pipelined(server):
+    server.full_sync('test.lean', content='--')
+    futures = [server.send_async(InfoRequest('test.lean', line, 0)) for line in range(1, 11)]
+    # Sent before any response came back
+    assert [future.result(5).seq_num for future in futures] == list(range(2, 12))
+
+
+def test_errors(server):
+    with pytest.raises(ChildProcessError):
+        server.state('unknown.lean', 1, 0)
+
+
+def test_pending_requests_fail_when_lean_stops():
+    server = SyncLeanServer(FAKE_LEAN + ['--latency', '1'])
+    server.start()
+    future = server.send_async(InfoRequest('test.lean', 1, 0))
+    server.kill()
+    with pytest.raises(ChildProcessError):
+        future.result(5)
+
+
+def test_full_sync_timeout():
+    server = SyncLeanServer(FAKE_LEAN + ['--elaboration-time', '1'])
+    server.start()
+    start = time.monotonic()
+    with pytest.raises(TimeoutError):
+        server.full_sync('test.lean', content='--', timeout=0.2)
+    assert time.monotonic() - start < 0.5
+    server.kill()
+
+
+def test_callbacks_see_responses_before_their_senders():
+    server = SyncLeanServer(FAKE_LEAN + ['--results', '50'])
+    results = []
+    server.response_callbacks.append(
+        lambda resp: results.extend(item['type'] for item in resp.data.get('results', [])))
+    server.start()
+    with ThreadPoolExecutor(8) as executor:
+        responses = list(executor.map(lambda i: server.send(SearchRequest(f'q{i}')), range(100)))
+    server.kill()
+    assert all(len(response.results) == 50 for response in responses)
+    assert results == ['Prop'] * 5000
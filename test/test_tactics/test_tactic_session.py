@@ -0,0 +1,68 @@
+"""
+Tests for tactic sessions, with a fake Lean server which reports the queried
+position in goal states and an error on lines 1, 4, 7...
+"""
+import pytest
+import trio  # type: ignore
+
+from lean_client.tactics import ProofDocument, TacticSession
+from lean_client.trio_server import TrioLeanServer
+from test.fake_lean import fake_lean, RecordingStream
+
+FAKE_LEAN = fake_lean('--messages-per-file', '10')
+
+TEMPLATE = """variables (P Q : Prop)
+
+example : P ∧ Q → Q ∧ P :=
+begin
+sorry
+end
+"""
+
+
+def test_proof_document():
+    document = ProofDocument(TEMPLATE)
+    assert document.proof_start == 5
+    assert document.content(['intro h', 'split,']) == TEMPLATE.replace('sorry', '  intro h,\n  split,')
+    assert document.state_position(2) == (7, 0)
+    with pytest.raises(ValueError):
+        ProofDocument('begin end')
+
+
+def test_session():
+    async def check_behavior():
+        async with trio.open_nursery() as nursery:
+            server = TrioLeanServer(nursery, lean_cmd=FAKE_LEAN)
+            await server.start()
+            session = TacticSession(server, 'template.lean', TEMPLATE)
+            assert (await session.start()).startswith('⊢ goal at 5:0')
+            stdin = server.process.stdin = RecordingStream(server.process.stdin)
+
+            first = await session.add('intro h')
+            assert first.state.startswith('⊢ goal at 6:0')
+            assert not first.failed
+            assert stdin.commands == ['sync', 'info']
+
+            second = await session.add('cases h with hp hq')
+            assert second.goals.goals[0].target.startswith('goal at 7:0')
+            # the fake server has an error on line 7, the line of the third tactic
+            third = await session.add('split')
+            assert third.failed
+            assert server.messages and session.content.count('\n') == TEMPLATE.count('\n') + 2
+
+            stdin.writes.clear()
+            assert session.undo() is third
+            assert session.state is second.state
+            assert session.tactics == ['intro h', 'cases h with hp hq']
+            session.undo()
+            session.undo()
+            assert session.state.startswith('⊢ goal at 5:0')
+            assert session.undo() is None
+            assert stdin.commands == []
+
+            again = await session.add('intro h')
+            assert again.state == first.state
+            server.kill()
+            nursery.cancel_scope.cancel()
+
+    trio.run(check_behavior)
@@ -0,0 +1,95 @@
+"""
+Tests for the Chrome trace export of requests, syncs and Lean tasks.
+"""
+import json
+
+import trio  # type: ignore
+
+from lean_client.commands import InfoRequest, Task
+from lean_client.timeline import Timeline, CLIENT_PID, LEAN_PID
+from lean_client.trio_server import TrioLeanServer
+from test.fake_lean import fake_lean
+
+FAKE_LEAN = fake_lean('--elaboration-time', '0.05', '--latency', '0.01')
+
+
+def spans(trace, pid):
+    """Names and durations of the async spans of process pid."""
+    begins = dict()
+    result = []
+    for event in trace['traceEvents']:
+        if event.get('pid') != pid or event['ph'] not in 'be':
+            continue
+        key = (event['id'], event['name'])
+        if event['ph'] == 'b':
+            begins[key] = event
+        else:
+            result.append((event['name'], event['ts'] - begins.pop(key)['ts']))
+    assert not begins
+    return result
+
+
+def test_tasks_intervals():
+    timeline = Timeline()
+    first = Task('a.lean', 1, 0, 3, 0, 'elaborating')
+    second = Task('a.lean', 4, 0, 5, 0, 'checking')
+    timeline.tasks([first])
+    timeline.tasks([first, second])
+    timeline.tasks([second])
+    timeline.tasks([])
+    names = [name for name, _ in spans(timeline.to_chrome_trace(), LEAN_PID)]
+    assert names == ['elaborating', 'checking']
+
+
+def test_running_tasks_end_at_export():
+    timeline = Timeline()
+    timeline.tasks([Task('a.lean', 1, 0, 3, 0, 'elaborating')])
+    assert [name for name, _ in spans(timeline.to_chrome_trace(), LEAN_PID)] == ['elaborating']
+
+
+def test_server_timeline(tmp_path):
+    timeline = Timeline()
+
+    async def check_behavior():
+        async with trio.open_nursery() as nursery:
+            server = TrioLeanServer(nursery, lean_cmd=FAKE_LEAN, timeline=timeline)
+            await server.start()
+            await server.full_sync('test.lean', content='--')
+            await server.send(InfoRequest('test.lean', 1, 0))
+            server.kill()
+            nursery.cancel_scope.cancel()
+
+    trio.run(check_behavior)
+    path = tmp_path / 'trace.json'
+    timeline.write(str(path))
+    trace = json.loads(path.read_text())
+
+    client = spans(trace, CLIENT_PID)
+    names = [name for name, _ in client]
+    assert names.count('sync') == names.count('info') == 1
+    assert names.count('in Lean') == 2
+    durations = dict(client)
+    assert durations['full_sync test.lean'] >= 50_000
+    assert durations['in Lean'] >= 10_000
+    assert spans(trace, LEAN_PID)
+    assert not timeline.requests
+
+
+def test_cancelled_requests():
+    timeline = Timeline()
+
+    async def check_behavior():
+        async with trio.open_nursery() as nursery:
+            server = TrioLeanServer(nursery, lean_cmd=FAKE_LEAN, timeline=timeline)
+            await server.start()
+            await server.full_sync('test.lean', content='--')
+            with trio.move_on_after(0.001):
+                await server.send(InfoRequest('test.lean', 1, 0))
+            server.kill()
+            nursery.cancel_scope.cancel()
+
+    trio.run(check_behavior)
+    assert not timeline.requests
+    info = [event for event in timeline.to_chrome_trace()['traceEvents']
+            if event.get('name') == 'info' and event['ph'] == 'b']
+    assert info[0]['args']['cancelled']
@@ -0,0 +1,86 @@
+"""
+Tests for the ring buffer of protocol frames.
+"""
+import io
+
+import pytest
+import trio  # type: ignore
+
+from lean_client.commands import InfoRequest
+from lean_client.tracing import FrameTracer, SENT, RECEIVED
+from lean_client.trio_server import TrioLeanServer
+from test.fake_lean import fake_lean
+
+FAKE_LEAN = fake_lean()
+
+
+def test_frames_wrap_around():
+    tracer = FrameTracer(capacity=10)
+    tracer.sent(b'abcd')
+    tracer.received(b'efgh')
+    assert [(direction, data) for _, direction, data in tracer.frames()] == [(SENT, b'abcd'), (RECEIVED, b'efgh')]
+
+    # overwrites abcd, and wraps around the end of the buffer
+    tracer.sent(b'ijklm')
+    assert [data for _, _, data in tracer.frames()] == [b'efgh', b'ijklm']
+    assert tracer.dropped == 1
+
+    timestamps = [timestamp for timestamp, _, _ in tracer.frames()]
+    assert timestamps == sorted(timestamps)
+
+
+def test_long_frames_are_truncated():
+    tracer = FrameTracer(capacity=4)
+    tracer.sent(b'ab')
+    tracer.received(b'0123456789')
+    assert [data for _, _, data in tracer.frames()] == [b'6789']
+    assert tracer.dropped == 1
+
+
+def test_frame_count_limit():
+    tracer = FrameTracer(max_frames=2, capacity=100)
+    for data in [b'a', b'b', b'c']:
+        tracer.sent(data)
+    assert [data for _, _, data in tracer.frames()] == [b'b', b'c']
+    assert tracer.dropped == 1
+
+
+def test_invalid_capacity():
+    with pytest.raises(ValueError):
+        FrameTracer(capacity=0)
+    with pytest.raises(ValueError):
+        FrameTracer(max_frames=0)
+
+
+def test_dump():
+    tracer = FrameTracer(capacity=8)
+    tracer.sent(b'1234567')
+    tracer.sent(b'{"a":1}\n')
+    tracer.received(b'{"b":2}')
+    out = io.StringIO()
+    tracer.dump(out)
+    lines = out.getvalue().splitlines()
+    assert lines[0] == '[2 older frames dropped]'
+    assert lines[1].endswith('<- {"b":2}')
+
+
+def test_server_dumps_frames_on_error(capsys):
+    tracer = FrameTracer()
+
+    async def check_behavior():
+        async with trio.open_nursery() as nursery:
+            server = TrioLeanServer(nursery, lean_cmd=FAKE_LEAN, tracer=tracer)
+            await server.start()
+            await server.full_sync('test.lean', content='--')
+            with pytest.raises(ChildProcessError):
+                await server.send(InfoRequest('unknown.lean', 1, 0))
+            server.kill()
+            nursery.cancel_scope.cancel()
+
+    trio.run(check_behavior)
+    directions = [direction for _, direction, _ in tracer.frames()]
+    assert directions[0] == SENT and RECEIVED in directions
+    assert b'unknown.lean' in tracer.frames()[-1][2]
+    err = capsys.readouterr().err
+    assert '-> {"file_name": "test.lean"' in err
+    assert '<- {"response": "error"' in err
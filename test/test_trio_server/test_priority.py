@@ -0,0 +1,72 @@
+"""
+Background requests should not delay interactive ones.
+These tests run a real (fake) Lean process to exercise real pipes.
+"""
+import trio  # type: ignore
+
+from lean_client.commands import InfoRequest, InfoResponse
+from lean_client.trio_server import TrioLeanServer, Priority
+from test.fake_lean import fake_lean, RecordingStream
+
+FAKE_LEAN = fake_lean('--latency', '0.02')
+
+
+def test_interactive_requests_overtake_background_ones():
+    async def check_behavior():
+        async with trio.open_nursery() as nursery:
+            server = TrioLeanServer(nursery, lean_cmd=FAKE_LEAN, background_in_flight=2)
+            await server.start()
+            await server.full_sync('test.lean', content='--')
+            stdin = server.process.stdin = RecordingStream(server.process.stdin)
+
+            states = dict()
+
+            async def state(line, priority):
+                states[line] = await server.state('test.lean', line, 0, priority)
+
+            async with trio.open_nursery() as requests:
+                for line in range(1, 21):
+                    requests.start_soon(state, line, Priority.background)
+                await trio.sleep(0.01)
+                assert server.in_flight[Priority.background] == 2
+                requests.start_soon(state, 100, Priority.interactive)
+
+            server.kill()
+            nursery.cancel_scope.cancel()
+        return states, stdin.lines
+
+    states, lines = trio.run(check_behavior)
+    assert len(states) == 21
+    assert states[100].startswith('⊢ goal at 100:0')
+    # only the two background requests in flight went before the interactive one
+    position = next(i for i, line in enumerate(lines) if '"line": 100' in line)
+    assert position == 2
+
+
+def test_background_requests_wait_for_normal_ones():
+    async def check_behavior():
+        async with trio.open_nursery() as nursery:
+            server = TrioLeanServer(nursery, lean_cmd=FAKE_LEAN)
+            await server.start()
+            await server.full_sync('test.lean', content='--')
+
+            order = []
+
+            async def info(line, priority):
+                response = await server.send(InfoRequest('test.lean', line, 0), priority)
+                assert isinstance(response, InfoResponse)
+                order.append(priority)
+
+            async with trio.open_nursery() as requests:
+                for line in range(5):
+                    requests.start_soon(info, line, Priority.normal)
+                await trio.sleep(0)
+                for line in range(5):
+                    requests.start_soon(info, line, Priority.background)
+
+            server.kill()
+            nursery.cancel_scope.cancel()
+        return order
+
+    order = trio.run(check_behavior)
+    assert order == [Priority.normal] * 5 + [Priority.background] * 5
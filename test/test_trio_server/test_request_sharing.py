@@ -0,0 +1,106 @@
+"""
+Identical read only requests in flight together should reach Lean once.
+These tests run a real (fake) Lean process to exercise real pipes.
+"""
+import trio  # type: ignore
+
+from lean_client.commands import InfoRequest, InfoResponse, SyncRequest
+from lean_client.trio_server import TrioLeanServer, Priority
+from test.fake_lean import fake_lean, RecordingStream
+
+FAKE_LEAN = fake_lean('--latency', '0.02')
+
+
+def run_with_server(check):
+    async def main():
+        async with trio.open_nursery() as nursery:
+            server = TrioLeanServer(nursery, lean_cmd=FAKE_LEAN)
+            await server.start()
+            await server.full_sync('test.lean', content='--')
+            stdin = server.process.stdin = RecordingStream(server.process.stdin)
+            result = await check(server)
+            server.kill()
+            nursery.cancel_scope.cancel()
+        return result, stdin.lines
+
+    return trio.run(main)
+
+
+def test_identical_requests_share_a_response():
+    async def check(server):
+        responses = []
+
+        async def info(line):
+            responses.append(await server.send(InfoRequest('test.lean', line, 0)))
+        async with trio.open_nursery() as nursery:
+            for _ in range(10):
+                nursery.start_soon(info, 1)
+            nursery.start_soon(info, 2)
+        return responses
+
+    responses, lines = run_with_server(check)
+    assert len(responses) == 11
+    assert all(isinstance(response, InfoResponse) for response in responses)
+    assert sum(response.record.state.startswith('⊢ goal at 1:0') for response in responses) == 10
+    assert len(lines) == 2
+
+
+def test_no_sharing_across_syncs():
+    async def check(server):
+        responses = []
+
+        async def info():
+            responses.append(await server.send(InfoRequest('test.lean', 1, 0)))
+        async with trio.open_nursery() as nursery:
+            nursery.start_soon(info)
+            await trio.sleep(0)
+            await server.send(SyncRequest('test.lean', '-- edited'))
+            nursery.start_soon(info)
+        return responses
+
+    responses, lines = run_with_server(check)
+    assert len(responses) == 2
+    assert len(lines) == 3
+
+
+def test_cancelled_first_sender():
+    async def check(server):
+        responses = []
+
+        async def info():
+            responses.append(await server.send(InfoRequest('test.lean', 1, 0)))
+        async with trio.open_nursery() as nursery:
+            with trio.move_on_after(0.005):
+                nursery.start_soon(info)
+                await server.send(InfoRequest('test.lean', 1, 0))
+        return responses
+
+    responses, lines = run_with_server(check)
+    assert len(responses) == 1
+    assert len(lines) == 2
+
+
+def test_queued_background_requests_are_not_shared():
+    async def check(server):
+        server.background_slots = trio.Semaphore(1)
+        durations = []
+
+        async def background(line):
+            await server.send(InfoRequest('test.lean', line, 0), Priority.background)
+
+        async with trio.open_nursery() as nursery:
+            nursery.start_soon(background, 0)
+            await trio.sleep(0.001)
+            for line in range(1, 10):
+                nursery.start_soon(background, line)
+            await trio.sleep(0.005)
+            # line 9 is still queued behind the others: the interactive
+            # request doesn't wait for it
+            start = trio.current_time()
+            await server.send(InfoRequest('test.lean', 9, 0), Priority.interactive)
+            durations.append(trio.current_time() - start)
+        return durations
+
+    (duration,), lines = run_with_server(check)
+    assert duration < 0.1
+    assert sum('"line": 9' in line for line in lines) == 2
@@ -0,0 +1,51 @@
+"""
+Requests sent together should be written to Lean together.
+These tests run a real (fake) Lean process to exercise real pipes.
+"""
+import trio  # type: ignore
+
+from lean_client.commands import InfoRequest, InfoResponse
+from lean_client.trio_server import TrioLeanServer
+from test.fake_lean import fake_lean, RecordingStream
+
+FAKE_LEAN = fake_lean()
+
+
+def run_pipelined(nb_requests, **kwargs):
+    async def check_behavior():
+        async with trio.open_nursery() as nursery:
+            server = TrioLeanServer(nursery, lean_cmd=FAKE_LEAN, **kwargs)
+            await server.start()
+            await server.full_sync('test.lean', content='--')
+            stdin = server.process.stdin = RecordingStream(server.process.stdin)
+
+            responses = dict()
+
+            async def info(line):
+                responses[line] = await server.send(InfoRequest('test.lean', line, 0))
+            async with trio.open_nursery() as requests:
+                for line in range(nb_requests):
+                    requests.start_soon(info, line)
+
+            server.kill()
+            nursery.cancel_scope.cancel()
+        return responses, stdin.writes
+
+    return trio.run(check_behavior)
+
+
+def test_pipelined_requests_are_coalesced():
+    responses, writes = run_pipelined(200)
+
+    assert len(responses) == 200
+    for line, response in responses.items():
+        assert isinstance(response, InfoResponse)
+        assert response.record.state.startswith(f'⊢ goal at {line}:0')
+    assert len(writes) < 10
+    assert sum(data.count(b'\n') for data in writes) == 200
+
+
+def test_flush_delay():
+    responses, writes = run_pipelined(50, flush_delay=0.01)
+    assert len(responses) == 50
+    assert len(writes) == 1
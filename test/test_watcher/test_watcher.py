@@ -0,0 +1,79 @@
+"""
+Tests for the file watcher, with both backends and a real (fake) Lean
+process reading the files.
+"""
+import pytest  # type: ignore
+import trio  # type: ignore
+
+from lean_client.trio_server import TrioLeanServer
+from lean_client.watcher import FileWatcher, load_libc
+from test.fake_lean import fake_lean, RecordingStream
+
+FAKE_LEAN = fake_lean()
+
+BACKENDS = [True, pytest.param(False, marks=pytest.mark.skipif(load_libc() is None, reason='no inotify'))]
+
+
+def run_watcher(tmp_path, polling, edit, **kwargs):
+    """Sync a.lean and b.lean from disk, start a watcher, run edit and
+    return the batches synced and the writes to Lean."""
+    for name in ['a.lean', 'b.lean', 'c.lean']:
+        (tmp_path / name).write_text('-- v1')
+
+    async def main():
+        batches = []
+        async with trio.open_nursery() as nursery:
+            server = TrioLeanServer(nursery, lean_cmd=FAKE_LEAN)
+            await server.start()
+            for name in ['a.lean', 'b.lean']:
+                await server.full_sync(str(tmp_path / name))
+            await server.full_sync(str(tmp_path / 'c.lean'), content='-- buffer')
+            stdin = server.process.stdin = RecordingStream(server.process.stdin)
+            watcher = FileWatcher(server, tmp_path, polling=polling, poll_interval=0.05, **kwargs)
+            watcher.batch_callbacks.append(batches.append)
+            watcher.start()
+            nursery.start_soon(watcher.run)
+            await edit(tmp_path)
+            await trio.sleep(0.5)
+            server.kill()
+            nursery.cancel_scope.cancel()
+        return batches, stdin.writes
+
+    return trio.run(main)
+
+
+@pytest.mark.parametrize('polling', BACKENDS)
+def test_bursts_are_synced_in_one_batch(tmp_path, polling):
+    async def edit(root):
+        for version in range(3):
+            for name in ['a.lean', 'b.lean', 'c.lean', 'new.lean']:
+                (root / name).write_text(f'-- v{version + 2}')
+            await trio.sleep(0.01)
+
+    batches, writes = run_watcher(tmp_path, polling, edit, batch_delay=0.2)
+    # c.lean has editor content and new.lean was never synced
+    assert batches == [[str(tmp_path / 'a.lean'), str(tmp_path / 'b.lean')]]
+    assert len(writes) == 1
+    assert b'"content"' not in writes[0]
+
+
+@pytest.mark.parametrize('polling', BACKENDS)
+def test_all_files_and_new_directories(tmp_path, polling):
+    async def edit(root):
+        (root / 'sub').mkdir()
+        await trio.sleep(0.1)
+        (root / 'sub' / 'd.lean').write_text('-- d')
+        (root / 'notes.txt').write_text('not Lean')
+
+    batches, _ = run_watcher(tmp_path, polling, edit, only_synced=False)
+    assert batches == [[str(tmp_path / 'sub' / 'd.lean')]]
+
+
+@pytest.mark.parametrize('polling', BACKENDS)
+def test_removed_files_are_not_synced(tmp_path, polling):
+    async def edit(root):
+        (root / 'a.lean').unlink()
+        (root / 'b.lean').write_text('-- v2')
+
+    batches, _ = run_watcher(tmp_path, polling, edit)
+    assert batches == [[str(tmp_path / 'b.lean')]]